@@ -317,6 +317,9 @@ def check_privileged():
         if data.get('max_workers') or data.get('maxWorkers'):
             logger.debug("User is trying to set max_workers")
             raise PermissionsException("Not authorized -- only admins and privileged users can set max workers.")
+        if data.get('min_idle_workers') or data.get('minIdleWorkers'):
+            logger.debug("User is trying to set min_idle_workers")
+            raise PermissionsException("Not authorized -- only admins and privileged users can set min idle workers.")
         if data.get('max_cpus') or data.get('maxCpus'):
             logger.debug("User is trying to set max CPUs")
             raise PermissionsException("Not authorized -- only admins and privileged users can set max CPUs.")
@@ -0,0 +1,295 @@
+"""
+Autoscaler process. On every tick, collects the number of queued messages and workers of each stateless actor and
+asks a scaling policy for the number of workers each actor should have; workers are then requested from, or shut
+down through, the spawners' command channels.
+
+Runs on its own schedule, independent of the Prometheus scrapes of the /metrics endpoint (which only exports the
+metrics). Configured in the [workers] stanza with the autoscaling and autoscaler_* options.
+
+Run from within the abaco/core image with:
+    python3 -u /actors/autoscaler.py
+"""
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import math
+import threading
+import time
+
+from codes import BUSY, SHUTTING_DOWN
+from config import Config
+import metrics_utils
+from models import ExecutionsRollup, Worker
+from stores import actors_store
+
+from agaveflask.logs import get_logger
+logger = get_logger(__name__)
+
+
+def get_autoscaler_config(option, default, typ=int):
+    """Returns the `autoscaler_<option>` setting from the [workers] stanza, or `default` if it is not set."""
+    try:
+        value = Config.get('workers', 'autoscaler_{}'.format(option))
+    except:
+        return default
+    if typ == bool:
+        return value.lower() == 'true'
+    try:
+        return typ(value)
+    except ValueError:
+        logger.error(f"Invalid autoscaler_{option} config: {value}; using {default}.")
+        return default
+
+
+def autoscaling_enabled():
+    enable_autoscaling = Config.get('workers', 'autoscaling')
+    return hasattr(enable_autoscaling, 'lower') and enable_autoscaling.lower() == 'true'
+
+
+class ScalingPolicy(ABC):
+    """
+    Base class for scaling policies. A policy computes the number of workers an actor should have from a snapshot of
+    its current metrics; the autoscaler bounds the result by the actor's max_workers and the command channel
+    capacity, and only shuts workers down when the actor has no queued messages.
+
+    Policies are instantiated once and called from several threads, so any state kept across ticks must be
+    thread-safe.
+    """
+
+    @abstractmethod
+    def target_workers(self, actor_id, messages, workers, max_workers, avg_runtime=None):
+        """
+        :param actor_id: the dbid of the actor.
+        :param messages: the number of messages currently queued for the actor.
+        :param workers: the current number of workers of the actor (including requested workers).
+        :param max_workers: the maximum number of workers allowed for the actor.
+        :param avg_runtime: the average runtime, in seconds, of the actor's executions; None if no execution has
+        completed yet.
+        :return: the number of workers the actor should have.
+        """
+
+
+class ThresholdPolicy(ScalingPolicy):
+    """
+    Adds a worker whenever the actor has at least `threshold` queued messages, and removes the workers once the
+    queue is empty. This is the original autoscaler behavior.
+    """
+    def __init__(self):
+        self.threshold = get_autoscaler_config('threshold', 1)
+
+    def target_workers(self, actor_id, messages, workers, max_workers, avg_runtime=None):
+        if messages == 0:
+            return 0
+        if messages >= self.threshold:
+            return workers + 1
+        return workers
+
+
+class MessagesPerWorkerPolicy(ScalingPolicy):
+    """Targets one worker for every `messages_per_worker` queued messages."""
+    def __init__(self):
+        self.messages_per_worker = max(get_autoscaler_config('messages_per_worker', 10), 1)
+
+    def target_workers(self, actor_id, messages, workers, max_workers, avg_runtime=None):
+        return math.ceil(messages / self.messages_per_worker)
+
+
+class BacklogPolicy(MessagesPerWorkerPolicy):
+    """
+    Targets enough workers to drain the actor's queue within `drain_time` seconds, based on the average runtime of
+    the actor's executions. Actors without a completed execution fall back to one worker for every
+    `messages_per_worker` queued messages.
+    """
+    def __init__(self):
+        super().__init__()
+        self.drain_time = max(get_autoscaler_config('drain_time', 60), 1)
+
+    def target_workers(self, actor_id, messages, workers, max_workers, avg_runtime=None):
+        if messages == 0:
+            return 0
+        if avg_runtime is None:
+            return super().target_workers(actor_id, messages, workers, max_workers)
+        return max(math.ceil(messages * avg_runtime / self.drain_time), 1)
+
+
+class EwmaPolicy(ScalingPolicy):
+    """
+    Tracks an exponentially weighted moving average of the change in each actor's queue length between ticks.
+    Adds a worker while the queue is growing (the average is positive), holds while it is draining, and removes
+    the workers once the queue is empty and no longer growing.
+    """
+    def __init__(self):
+        self.alpha = get_autoscaler_config('ewma_alpha', 0.5, float)
+        self._lock = threading.Lock()
+        self.last_messages = {}
+        self.rates = {}
+
+    def update(self, actor_id, messages):
+        """Updates and returns the average change in the queue length of the actor."""
+        with self._lock:
+            change_rate = metrics_utils.calc_change_rate(messages, self.last_messages, actor_id)
+            self.last_messages[actor_id] = messages
+            rate = self.alpha * change_rate + (1 - self.alpha) * self.rates.get(actor_id, 0)
+            self.rates[actor_id] = rate
+        return rate
+
+    def target_workers(self, actor_id, messages, workers, max_workers, avg_runtime=None):
+        rate = self.update(actor_id, messages)
+        logger.debug(f"actor {actor_id}; queue length change rate (ewma): {rate}")
+        if messages == 0 and rate <= 0:
+            return 0
+        if rate > 0 or workers == 0:
+            return workers + 1
+        return workers
+
+
+POLICIES = {'backlog': BacklogPolicy,
+            'threshold': ThresholdPolicy,
+            'messages_per_worker': MessagesPerWorkerPolicy,
+            'ewma': EwmaPolicy}
+
+
+def get_policy(name):
+    """
+    Returns an instance of the policy `name`; either one of the POLICIES or the path to a ScalingPolicy subclass
+    (e.g., my_module.MyPolicy).
+    """
+    if name in POLICIES:
+        return POLICIES[name]()
+    module_name, _, class_name = name.rpartition('.')
+    if not module_name:
+        raise ValueError(f"Unknown autoscaler policy: {name}. Options are: {list(POLICIES.keys())} or the path to "
+                         f"a ScalingPolicy subclass.")
+    cls = getattr(importlib.import_module(module_name), class_name)
+    return cls()
+
+
+class Autoscaler(object):
+
+    def __init__(self):
+        self.tick = get_autoscaler_config('tick', 5)
+        self.concurrency = max(get_autoscaler_config('concurrency', 10), 1)
+        self.cooldown = get_autoscaler_config('cooldown', 30)
+        self.dry_run = get_autoscaler_config('dry_run', False, bool)
+        self.policy = get_policy(get_autoscaler_config('policy', 'backlog', str))
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        # time of the last scale up of each actor; workers are not shut down within cooldown seconds of a scale up.
+        self.last_scale_up = {}
+        # lengths of the command channels and the remaining capacity of the worker hosts; updated as workers are
+        # requested during a tick.
+        self.cmd_lengths = {}
+        self.host_capacity = 0
+        self.max_cmd_length = metrics_utils.get_max_cmd_length()
+        self._lock = threading.Lock()
+        logger.info(f"Autoscaler running with tick: {self.tick}s; concurrency: {self.concurrency}; "
+                    f"cooldown: {self.cooldown}s; policy: {type(self.policy).__name__}; dry_run: {self.dry_run}")
+
+    def get_actors(self):
+        """Returns the actors that are autoscaled: stateless actors not in ERROR or SHUTTING_DOWN status."""
+        return [actor for actor in actors_store.items()
+                if actor.get('stateless')
+                and not actor.get('status') == 'ERROR'
+                and not actor.get('status') == SHUTTING_DOWN]
+
+    def run(self):
+        while True:
+            start = time.time()
+            try:
+                self.run_tick()
+            except Exception as e:
+                logger.error(f"Autoscaler got an unexpected exception running a tick; e: {e}")
+            elapsed = time.time() - start
+            if elapsed > self.tick:
+                logger.warning(f"Autoscaler tick took {elapsed:.3f}s; longer than the configured tick ({self.tick}s).")
+            time.sleep(max(self.tick - elapsed, 0))
+
+    def run_tick(self):
+        logger.debug("AUTOSCALER initiating new run --------")
+        if not autoscaling_enabled():
+            logger.debug("Autoscaler turned off in Abaco configuration.")
+            return
+        actors = self.get_actors()
+        if not actors:
+            return
+        host_queues = metrics_utils.get_host_queues()
+        inbox_lengths, self.cmd_lengths, worker_counts = metrics_utils.get_actor_metrics(actors, host_queues)
+        self.host_capacity = metrics_utils.get_host_capacity()
+        self.max_cmd_length = metrics_utils.get_max_cmd_length()
+        avg_runtimes = {rollup['actor_id']: rollup['avg_runtime'] for rollup in ExecutionsRollup.get_all()}
+        # the busy workers are only needed for the actors that keep idle workers.
+        min_idle_ids = [actor['db_id'] for actor in actors if metrics_utils.get_min_idle_workers(actor)]
+        busy_counts = Worker.get_worker_counts(min_idle_ids, status=BUSY) if min_idle_ids else {}
+        futures = [self.executor.submit(self.evaluate, actor, inbox_lengths[actor['db_id']],
+                                        worker_counts[actor['db_id']], avg_runtimes.get(actor['db_id']),
+                                        host_queues, busy_counts.get(actor['db_id'], 0))
+                   for actor in actors]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Autoscaler got an unexpected exception evaluating an actor; e: {e}")
+        logger.debug("AUTOSCALER run complete --------")
+
+    def evaluate(self, actor, messages, workers, avg_runtime, host_queues, busy=0):
+        actor_id = actor['db_id']
+        max_workers = metrics_utils.get_max_workers(actor)
+        min_idle = metrics_utils.get_min_idle_workers(actor)
+        target = self.policy.target_workers(actor_id, messages, workers, max_workers, avg_runtime)
+        if min_idle:
+            # actors with min_idle_workers keep that many workers idle on top of the busy ones, even with an empty
+            # queue, so that a burst of messages does not wait on new workers to start.
+            target = max(target if messages > 0 else 0, busy + min_idle)
+        target = min(target, max_workers)
+        logger.debug(f"actor {actor_id}; messages: {messages}; workers: {workers}; max workers: {max_workers}; "
+                     f"avg runtime: {avg_runtime}; min idle: {min_idle}; busy: {busy}; target workers: {target}")
+        if target > workers and (messages > 0 or min_idle):
+            self.scale_up(actor, workers, target, max_workers, host_queues)
+        elif target < workers and messages == 0:
+            self.scale_down(actor, keep=min_idle)
+
+    def scale_up(self, actor, workers, target, max_workers, host_queues):
+        """
+        Requests the workers needed to reach `target` in one pass, bounded by the room left on the actor's command
+        channel and the capacity left on the worker hosts.
+        """
+        actor_id = actor['db_id']
+        queue = metrics_utils.get_actor_queue(actor, host_queues)
+        with self._lock:
+            cmd_length = self.cmd_lengths.get(queue, 0)
+            if not metrics_utils.allow_autoscaling(max_workers, workers, cmd_length):
+                return
+            delta = min(target - workers, self.max_cmd_length - cmd_length, self.host_capacity)
+            if delta <= 0:
+                logger.info(f"Will NOT scale up actor {actor_id}: no room on command channel {queue} "
+                            f"({cmd_length}/{self.max_cmd_length}) or on the worker hosts ({self.host_capacity}).")
+                return
+            # reserve the room on the command channel and hosts before releasing the lock
+            self.cmd_lengths[queue] = cmd_length + delta
+            self.host_capacity -= delta
+            self.last_scale_up[actor_id] = time.time()
+        if self.dry_run:
+            logger.info(f"AUTOSCALER DRY RUN: would request {delta} worker(s) for actor {actor_id} on queue {queue}.")
+            return
+        logger.info(f"AUTOSCALER requesting {delta} worker(s) for actor {actor_id} on queue {queue}; "
+                    f"workers: {workers}; target: {target}.")
+        metrics_utils.scale_up(actor_id, delta)
+
+    def scale_down(self, actor, keep=0):
+        actor_id = actor['db_id']
+        last_scale_up = self.last_scale_up.get(actor_id, 0)
+        if time.time() - last_scale_up < self.cooldown:
+            logger.debug(f"actor {actor_id} was scaled up within the last {self.cooldown}s; not scaling down.")
+            return
+        if self.dry_run:
+            logger.info(f"AUTOSCALER DRY RUN: would shut down the idle workers of actor {actor_id}, keeping {keep}.")
+            return
+        metrics_utils.scale_down(actor_id, metrics_utils.is_sync_actor(actor), keep)
+
+
+def main():
+    # errors talking to rabbit or mongo are logged and retried on the next tick.
+    Autoscaler().run()
+
+
+if __name__ == '__main__':
+    main()
@@ -174,17 +174,22 @@ class EventsChannel(BinaryTaskQueue):
 
 
 class CommandChannel(BinaryTaskQueue):
-    """Work with commands on the command channel."""
+    """
+    Work with commands on the command channel. Pass a `host_id` to work with the command channel of the queue that
+    is only read by the spawners on that host (used when workers are placed on specific hosts).
+    """
 
-    def __init__(self, name='default'):
+    def __init__(self, name='default', host_id=None):
         self.uri = Config.get('rabbit', 'uri')
         queues_list = Config.get('spawner', 'host_queues').replace(' ', '')
         valid_queues = queues_list.split(',')
         if name not in valid_queues:
             raise Exception('Invalid Queue name.')
 
-
-        super().__init__(name='command_channel_{}'.format(name))
+        ch_name = 'command_channel_{}'.format(name)
+        if host_id is not None:
+            ch_name = '{}_host_{}'.format(ch_name, host_id)
+        super().__init__(name=ch_name)
 
     def put_cmd(self, actor_id, worker_id, image, revision, tenant, stop_existing=True):
         """Put a new command on the command channel."""
@@ -237,6 +242,43 @@ class ActorMsgChannel(BinaryTaskQueue):
             d[k] = v
         self.put(d)
 
+    def put_msgs(self, messages, ds):
+        """
+        Put several messages on the actor's queue with publisher confirms. `ds` is a list of the message
+        dictionaries (the `d` of put_msg), one per message. Returns the list of dictionaries that were not confirmed.
+        """
+        msgs = []
+        for message, d in zip(messages, ds):
+            d['message'] = message
+            msgs.append(d)
+        return self.put_many(msgs)
+
+
+class ExecutionCompleteChannel(BinaryTaskQueue):
+    """
+    Reply queue on which a worker announces the end of a synchronous execution to the API request waiting on it.
+    The queue is deleted by the broker if it is left unused for 20 minutes (e.g., when the request timed out).
+    """
+    def __init__(self, actor_id, execution_id):
+        super().__init__(name='complete_{}_{}'.format(actor_id, execution_id), expires=1200000)
+
+    def put_complete(self, status):
+        """Announce that the execution finished with the final `status`."""
+        self.put({'status': status})
+
+    def wait(self, timeout):
+        """
+        Wait at most `timeout` seconds for the end of the execution. Returns the final status of the execution and
+        deletes the queue, or returns None if the execution did not finish in time.
+        """
+        result = self.get(timeout=timeout)
+        if result is None:
+            return None
+        msg, msg_obj = result
+        msg_obj.ack()
+        self.delete()
+        return msg['status']
+
 
 class FiniteRabbitConnection(RabbitConnection):
     """Override the channelpy.connections.RabbitConnection to provide TTL functionality,"""
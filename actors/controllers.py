@@ -9,7 +9,6 @@ import timeit
 import base64
 import re
 
-from channelpy.exceptions import ChannelClosedException, ChannelTimeoutException
 from flask import g, request, render_template, make_response, Response
 from flask_restful import Resource, Api, inputs
 from werkzeug.exceptions import BadRequest
@@ -17,11 +16,11 @@ from agaveflask.utils import RequestParser, ok
 from parse import parse
 
 from auth import check_permissions, check_config_permissions, get_uid_gid_homedir, get_token_default
-from channels import ActorMsgChannel, CommandChannel, ExecutionResultsChannel, WorkerChannel
-from codes import SUBMITTED, COMPLETE, SHUTTING_DOWN, PERMISSION_LEVELS, ALIAS_NONCE_PERMISSION_LEVELS, READ, UPDATE, EXECUTE, PERMISSION_LEVELS, PermissionLevel
+from channels import ActorMsgChannel, CommandChannel, ExecutionCompleteChannel, ExecutionResultsChannel, WorkerChannel
+from codes import SUBMITTED, SHUTTING_DOWN, PERMISSION_LEVELS, ALIAS_NONCE_PERMISSION_LEVELS, READ, UPDATE, EXECUTE, PERMISSION_LEVELS, PermissionLevel
 from config import Config
 from errors import DAOError, ResourceError, PermissionsException, WorkerException
-from models import dict_to_camel, display_time, is_hashid, Actor, ActorConfig, Alias, Execution, ExecutionsSummary, Nonce, Worker, Search, get_permissions, \
+from models import dict_to_camel, display_time, is_hashid, Actor, ActorConfig, Alias, Execution, ExecutionsRollup, ExecutionsSummary, Nonce, Worker, Search, get_permissions, \
     get_config_permissions, set_permission, get_current_utc_time, set_config_permission
 
 from mounts import get_all_mounts
@@ -131,129 +130,28 @@ class CronResource(Resource):
 
 
 class MetricsResource(Resource):
+    """
+    Prometheus exporter for the actor queue lengths and worker counts. This resource is read-only; autoscaling is
+    done by the autoscaler process (see autoscaler.py).
+    """
     def get(self):
-        logger.debug("AUTOSCALER initiating new run --------")
-        do_autoscaling = True
-        enable_autoscaling = Config.get('workers', 'autoscaling')
-        if hasattr(enable_autoscaling, 'lower'):
-            if not enable_autoscaling.lower() == 'true':
-                logger.debug("Autoscaler turned off in Abaco configuration; exiting.")
-                do_autoscaling = False
-        else:
-            logger.debug("No autoscaler configuration found; exiting.")
-            do_autoscaling = False
+        logger.debug("top of GET /metrics")
         try:
-            actor_ids, inbox_lengths, cmd_length = self.get_metrics()
+            self.get_metrics()
         except Exception as e:
-            logger.error(f"MetricsResource got exception from get_metrics(); e: {e}."
-                         f"Responding without running check_metrics."
-                         f"Autoscaling is broken!!!!!!")
+            logger.error(f"MetricsResource got exception from get_metrics(); e: {e}.")
             return Response("Unhandled exception in get_metrics of MetricsResource!")
-        if len(actor_ids) == 0:
-            do_autoscaling = False
-        if not do_autoscaling:
-            logger.debug("AUTOSCALER run complete --------")
-            return
-        try:
-            self.check_metrics(actor_ids, inbox_lengths, cmd_length)
-        except Exception as e:
-            logger.error(f"MetricsResource got exception from check_metrics(); e: {e}."
-                         f"Responding with an error."
-                         f"Autoscaling is likely broken!!!")
-            return Response("Unhandled exception in check_metrics MetricsResource!")
-
-        # self.add_workers(actor_ids)
-        logger.debug("AUTOSCALER run complete --------")
         return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
     def get_metrics(self):
         logger.debug("top of get_metrics")
-        actor_ids = [actor['db_id'] for actor in actors_store.items()
+        actors = [actor for actor in actors_store.items()
             if actor.get('stateless')
             and not actor.get('status') == 'ERROR'
             and not actor.get('status') == SHUTTING_DOWN]
-        logger.debug(f"autoscaler found {len(actor_ids)} actors.")
-        if len(actor_ids) == 0:
-            return [], {}, None
-        try:
-            # Create a gauge for each actor id
-            actor_ids, inbox_lengths, cmd_length = metrics_utils.create_gauges(actor_ids)
-            # return the actor_ids so we can use them again for check_metrics
-            return actor_ids, inbox_lengths, cmd_length
-        except Exception as e:
-            logger.info("Got exception in call to create_gauges; skipping autoscaler; e: {}".format(e))
-            return [], {}, None
-
-    def check_metrics(self, actor_ids, inbox_lengths, cmd_length):
-        logger.debug("top of check_metrics")
-        for actor_id in actor_ids:
-            current_message_count = 0
-            try:
-                current_message_count = inbox_lengths[actor_id]
-            except KeyError as e:
-                logger.info("Got KeyError trying to get current_message_count. Exception: {}".format(e))
-                # don't try to process the actor any further
-                continue
-            except Exception as e:
-                logger.error(f"Uncaught exception in check_metrics; e: {e}")
-                # don't try to process the actor any further
-                continue
-            workers = Worker.get_workers(actor_id)
-            current_workers = len(workers)
-            logger.debug(f"actor {actor_id}; Current message count: {current_message_count}; "
-                         f"Current workers: {current_workers}")
-
-            # If this actor has a custom max_workers, use that. Otherwise use default.
-            actor = actors_store[actor_id]
-            max_workers = None
-            if actor.get('max_workers'):
-                try:
-                    max_workers = int(actor['max_workers'])
-                except Exception as e:
-                    logger.error("max_workers defined for actor_id {} but could not cast to int. "
-                                 "Exception: {}".format(actor_id, e))
-            if not max_workers:
-                try:
-                    conf = Config.get('spawner', 'max_workers_per_actor')
-                    max_workers = int(conf)
-                except Exception as e:
-                    logger.error("Unable to get/cast max_workers_per_actor config ({}) to int. "
-                                 "Exception: {}".format(conf, e))
-                    max_workers = 1
-            logger.debug(f"actor: {actor_id}; Max workers: {max_workers}")
-            # Add an additional worker if message count reaches a given number
-            try:
-                if metrics_utils.allow_autoscaling(max_workers, current_workers, cmd_length):
-                    if current_message_count >= 1:
-                        channel = metrics_utils.scale_up(actor_id)
-                        if channel == 'default':
-                            cmd_length = cmd_length + 1
-                else:
-                    # todo -- this is not necessarily true... the actor's current workers could just be
-                    # at the max workers for this actor.
-                    logger.warning('METRICS - COMMAND QUEUE is getting full. Skipping autoscale.')
-                if current_message_count == 0:
-                    logger.debug("current message count was 0; checking whether to scale down...")
-                    # first check if this is a "sync" actor
-                    is_sync_actor = False
-                    try:
-                        hints = list(actor.get("hints"))
-                    except:
-                        hints = []
-                    for hint in hints:
-                        if hint == Actor.SYNC_HINT:
-                            is_sync_actor = True
-                            break
-                    logger.debug(f"actor {actor_id} was a SYNC actor (T/F): {is_sync_actor}.")
-                    metrics_utils.scale_down(actor_id, is_sync_actor)
-                    logger.debug("autoscaler returned from scale_down() call.")
-                else:
-                    logger.warning('METRICS - COMMAND QUEUE is getting full. Skipping autoscale.')
-            except Exception as e:
-                logger.debug("METRICS - ANOTHER ERROR: {} - {} - {}".format(type(e), e, e.args))
-
-    def test_metrics(self):
-        logger.debug("METRICS TESTING")
+        logger.debug(f"metrics found {len(actors)} actors.")
+        # Set the gauges for each actor; the series of actors no longer in the list are removed
+        return metrics_utils.create_gauges(actors)
 
 
 class AdminActorsResource(Resource):
@@ -272,7 +170,8 @@ class AdminActorsResource(Resource):
                 ch = ActorMsgChannel(actor_id=actor.db_id)
                 actor.messages = len(ch._queue._queue)
                 ch.close()
-                summary = ExecutionsSummary(db_id=actor.db_id)
+                # only the totals are needed here, so do not list the executions
+                summary = ExecutionsSummary(db_id=actor.db_id, limit=0)
                 actor.executions = summary.total_executions
                 actor.runtime = summary.total_runtime
                 if case == 'camel':
@@ -353,48 +252,35 @@ class AdminExecutionsResource(Resource):
         }
         case = Config.get('web', 'case')
         actor_stats = {}
-        actor_does_not_exist = []
-        for execution in executions_store.items():
-            actor_id = execution['actor_id']
-            actor_cpu = execution['cpu']
-            actor_io = execution['io']
-            actor_runtime = execution['runtime']
-            if actor_id in actor_does_not_exist:
-                pass
-            else:
-                try:
-                    # checks if actor existance has already been tested
-                    if not actor_id in actor_stats:
-                        result['summary']['total_actors_all_with_executions'] += 1
-                        # determine if actor still exists:
-                        actor = Actor.from_db(actors_store[actor_id])
-                        # creates dict if actor does exist
-                        actor_stats[actor_id] = {'actor_id': actor.get('id'),
-                                                'owner': actor.get('owner'),
-                                                'image': actor.get('image'),
-                                                'total_executions': 0,
-                                                'total_execution_cpu': 0,
-                                                'total_execution_io': 0,
-                                                'total_execution_runtime': 0}
-                        result['summary']['total_actors_existing_with_executions'] += 1
-
-                    # write actor information if actor does exist
-                    actor_stats[actor_id]['total_executions'] += 1
-                    actor_stats[actor_id]['total_execution_runtime'] += actor_runtime
-                    actor_stats[actor_id]['total_execution_io'] += actor_io
-                    actor_stats[actor_id]['total_execution_cpu'] += actor_cpu
-                    # write result information if actor does exist
-                    result['summary']['total_executions_existing'] += 1
-                    result['summary']['total_execution_runtime_existing'] += actor_runtime
-                    result['summary']['total_execution_io_existing'] += actor_io
-                    result['summary']['total_execution_cpu_existing'] += actor_cpu
-                except KeyError:
-                    actor_does_not_exist.append(actor_id)
+        # the executions rollups include the actors that have since been deleted
+        rollups = ExecutionsRollup.get_all()
+        existing_actors = {}
+        for actor in actors_store.items({'_id': {'$in': [rollup['actor_id'] for rollup in rollups]}},
+                                        proj_inp={'_id': True, 'id': True, 'owner': True, 'image': True}):
+            existing_actors[actor['_id']] = actor
+        for rollup in rollups:
+            actor_id = rollup['actor_id']
+            result['summary']['total_actors_all_with_executions'] += 1
             # always add these to the totals:
-            result['summary']['total_executions_all'] += 1
-            result['summary']['total_execution_runtime_all'] += actor_runtime
-            result['summary']['total_execution_io_all'] += actor_io
-            result['summary']['total_execution_cpu_all'] += actor_cpu
+            result['summary']['total_executions_all'] += rollup['total_executions']
+            result['summary']['total_execution_runtime_all'] += rollup['total_runtime']
+            result['summary']['total_execution_io_all'] += rollup['total_io']
+            result['summary']['total_execution_cpu_all'] += rollup['total_cpu']
+            actor = existing_actors.get(actor_id)
+            if not actor:
+                continue
+            actor_stats[actor_id] = {'actor_id': actor.get('id'),
+                                     'owner': actor.get('owner'),
+                                     'image': actor.get('image'),
+                                     'total_executions': rollup['total_executions'],
+                                     'total_execution_cpu': rollup['total_cpu'],
+                                     'total_execution_io': rollup['total_io'],
+                                     'total_execution_runtime': rollup['total_runtime']}
+            result['summary']['total_actors_existing_with_executions'] += 1
+            result['summary']['total_executions_existing'] += rollup['total_executions']
+            result['summary']['total_execution_runtime_existing'] += rollup['total_runtime']
+            result['summary']['total_execution_io_existing'] += rollup['total_io']
+            result['summary']['total_execution_cpu_existing'] += rollup['total_cpu']
 
         result['summary']['total_actors_all'] += abaco_metrics_store['stats', 'actor_total']
         result['summary']['total_actors_existing'] += len(actors_store)
@@ -764,6 +650,40 @@ def validate_link(args):
     check_for_link_cycles(g.db_id, link_dbid)
 
 
+def validate_min_idle_workers(min_idle_workers, max_workers, stateless):
+    """
+    Method to validate the min_idle_workers of an actor. Called for both POSTs (new actors)
+    and PUTs (updates to existing actors).
+    """
+    if not min_idle_workers:
+        return
+    if min_idle_workers < 0:
+        raise DAOError("Invalid actor description: min_idle_workers cannot be negative.")
+    if not stateless:
+        raise DAOError("Invalid actor description: stateful actors cannot have min_idle_workers.")
+    if max_workers and min_idle_workers > int(max_workers):
+        raise DAOError("Invalid actor description: min_idle_workers cannot be greater than max_workers.")
+
+
+def validate_concurrency(concurrency, stateless):
+    """
+    Method to validate the concurrency of an actor. Called for both POSTs (new actors)
+    and PUTs (updates to existing actors).
+    """
+    if concurrency is None:
+        return
+    try:
+        max_concurrency = int(Config.get('workers', 'max_concurrency'))
+    except:
+        max_concurrency = 10
+    if concurrency < 1:
+        raise DAOError("Invalid actor description: concurrency must be at least 1.")
+    if concurrency > 1 and not stateless:
+        raise DAOError("Invalid actor description: stateful actors cannot have a concurrency greater than 1.")
+    if concurrency > max_concurrency:
+        raise DAOError(f"Invalid actor description: concurrency cannot be greater than {max_concurrency}.")
+
+
 class AbacoUtilizationResource(Resource):
 
     def get(self):
@@ -899,11 +819,17 @@ class ActorsResource(Resource):
         if Config.get('web', 'case') == 'camel':
             max_workers = args.get('maxWorkers')
             args['max_workers'] = max_workers
+            min_idle_workers = args.get('minIdleWorkers')
+            args['min_idle_workers'] = min_idle_workers
         else:
             max_workers = args.get('max_workers')
             args['maxWorkers'] = max_workers
+            min_idle_workers = args.get('min_idle_workers')
+            args['minIdleWorkers'] = min_idle_workers
         if max_workers and 'stateless' in args and not args.get('stateless'):
             raise DAOError("Invalid actor description: stateful actors can only have 1 worker.")
+        validate_min_idle_workers(min_idle_workers, max_workers, args.get('stateless', True))
+        validate_concurrency(args.get('concurrency'), args.get('stateless', True))
         args['mounts'] = get_all_mounts(args)
         logger.debug("create args: {}".format(args))
         actor = Actor(**args)
@@ -949,14 +875,9 @@ class ActorResource(Resource):
         if actor:
             # first set actor status to SHUTTING_DOWN so that no further autoscaling takes place
             actor.set_status(id, SHUTTING_DOWN)
-            # delete all logs associated with executions -
-            try:
-                executions_by_actor = executions_store.items({'actor_id': id})
-                for execution in executions_by_actor:
-                    del logs_store[execution['id']]
-            except KeyError as e:
-                logger.info("got KeyError {} trying to retrieve actor or executions with id {}".format(
-                    e, id))
+            # delete all logs associated with executions; the head and chunk documents of the logs all carry the
+            # actor id -
+            logs_store.delete_many({'actor_id': id})
         # shutdown workers ----
         logger.info("calling shutdown_workers() for actor: {}".format(id))
         shutdown_workers(id)
@@ -1102,16 +1023,8 @@ class ActorResource(Resource):
 
         logger.info("updated actor {} stored in db.".format(actor_id))
         if update_image:
-            worker_id = Worker.request_worker(tenant=g.tenant, actor_id=actor.db_id)
-            # get actor queue name
-            ch = CommandChannel(name=actor.queue)
-            # stop_existing defaults to True, so this command will also stop existing workers:
-            ch.put_cmd(actor_id=actor.db_id,
-                       worker_id=worker_id,
-                       image=actor.image,
-                       revision=actor.revision,
-                       tenant=args['tenant'])
-            ch.close()
+            # stop_existing is True, so this command will also stop existing workers:
+            actor.request_workers(tenant=args['tenant'], stop_existing=True)
             logger.debug("put new command on command channel to update actor.")
         # put could have been issued by a user with
         if not previous_owner == g.user:
@@ -1131,6 +1044,7 @@ class ActorResource(Resource):
             actor.pop('use_container_uid')
             actor.pop('default_environment')
             actor.pop('max_workers')
+            actor.pop('min_idle_workers')
             actor.pop('mem_limit')
             actor.pop('max_cpus')
             actor.pop('log_ex')
@@ -1150,6 +1064,10 @@ class ActorResource(Resource):
             raise DAOError("Invalid actor description: an actor that was not stateless cannot be updated to be stateless.")
         if not actor.stateless and (new_fields.get('max_workers') or new_fields.get('maxWorkers')):
             raise DAOError("Invalid actor description: stateful actors can only have 1 worker.")
+        validate_min_idle_workers(new_fields.get('min_idle_workers') or new_fields.get('minIdleWorkers'),
+                                  new_fields.get('max_workers') or new_fields.get('maxWorkers'),
+                                  actor.stateless)
+        validate_concurrency(new_fields.get('concurrency'), actor.stateless)
         if new_fields['hints']:
             for hint in new_fields['hints']:
                 for bad_char in ['"', "'", '{', '}', '[', ']']:
@@ -1265,6 +1183,7 @@ class ActorConfigsResource(Resource):
         # save the config to the db
         config_id = ActorConfig.get_config_db_key(tenant_id=g.tenant, name=actor_config.name)
         configs_store[config_id] = actor_config.to_db()
+        ActorConfig.set_lookup_fields(config_id, actors_list)
         # set permissions for this config
         set_config_permission(g.user, config_id, UPDATE)
         return ok(result=actor_config.display(), msg="Actor config created successfully.")
@@ -1361,6 +1280,8 @@ class ActorConfigResource(Resource):
         logger.debug("Actor Config object instantiated; updating actor config in configs_store. "
                      "config: {}".format(new_config_obj))
         configs_store[config_id] = new_config_obj
+        # a new revision invalidates the decrypted value cached by workers
+        ActorConfig.set_lookup_fields(config_id, actors_list)
         logger.debug(f"NEW CONFIG OBJ {new_config_obj}")
         logger.info(f"actor config updated for config: {config_id}.")
         return ok(result=new_config_obj.display(), msg="Actor config updated successfully.")
@@ -1392,7 +1313,8 @@ class ActorConfigResource(Resource):
 class ActorExecutionsResource(Resource):
     def get(self, actor_id):
         logger.debug("top of GET /actors/{}/executions".format(actor_id))
-        if len(request.args) > 1 or (len(request.args) == 1 and not 'x-nonce' in request.args):
+        # the limit and cursor parameters page the executions summary; any other parameter is a search.
+        if set(request.args.keys()) - {'x-nonce', 'limit', 'cursor'}:
             args_given = request.args
             args_full = {'actor_id': f'{g.tenant}_{actor_id}'}
             args_full.update(args_given)
@@ -1406,8 +1328,18 @@ class ActorExecutionsResource(Resource):
                 logger.debug("did not find actor: {}.".format(actor_id))
                 raise ResourceError(
                     "No actor found with id: {}.".format(actor_id), 404)
+            limit = request.args.get('limit')
+            if limit is not None:
+                try:
+                    limit = int(limit)
+                except ValueError:
+                    raise ResourceError(f"Invalid limit: {limit}; limit must be an integer.", 400)
+                if limit < 0:
+                    raise ResourceError(f"Invalid limit: {limit}; limit must be positive.", 400)
             try:
-                summary = ExecutionsSummary(db_id=dbid)
+                summary = ExecutionsSummary(db_id=dbid, limit=limit, cursor=request.args.get('cursor'))
+            except ValueError as e:
+                raise ResourceError(str(e), 400)
             except DAOError as e:
                 logger.debug("did not find executions summary: {}".format(actor_id))
                 raise ResourceError("Could not retrieve executions summary for actor: {}. "
@@ -1565,7 +1497,9 @@ class ActorExecutionResource(Resource):
         logger.debug("issuing force quit to worker: {} "
                      "for actor_id: {} execution_id: {}".format(exc.worker_id, actor_id, execution_id))
         ch = WorkerChannel(worker_id=exc.worker_id)
-        ch.put('force_quit')
+        # only the execution is halted; the worker may be running other executions (see the actor's concurrency).
+        ch.put({'command': 'force_quit', 'execution_id': execution_id})
+        ch.close()
         msg = 'Issued force quit command for execution {}.'.format(execution_id)
         return ok(result=None, msg=msg)
 
@@ -1608,9 +1542,10 @@ class ActorExecutionLogsResource(Resource):
                                 'execution': '{}/actors/v2/{}/executions/{}'.format(actor.api_server, actor.id, exc.id)},
                     }
         logger.debug("top of GET /actors/{}/executions/{}/logs.".format(actor_id, execution_id))
-        if len(request.args) > 1 or (len(request.args) == 1 and not 'x-nonce' in request.args):
+        # the offset, limit and tail parameters select a range of the logs; any other parameter is a search.
+        if set(request.args.keys()) - {'x-nonce', 'offset', 'limit', 'tail'}:
             args_given = request.args
-            args_full = {'actor_id': f'{g.tenant}_{actor_id}', '_id': execution_id}
+            args_full = {'actor_id': f'{g.tenant}_{actor_id}', 'execution_id': execution_id}
             args_full.update(args_given)
             result = Search(args_full, 'logs', g.tenant, g.user).search()
             return ok(result=result, msg="Log search completed successfully.")
@@ -1627,14 +1562,123 @@ class ActorExecutionLogsResource(Resource):
             except KeyError:
                 logger.debug(f"did not find execution with actor id of {actor_id} and execution id of {execution_id}.")
                 raise ResourceError(f"No executions found with actor id of {actor_id} and execution id of {execution_id}.")
+            offset, limit, tail, ranged = get_logs_range()
             try:
-                logs = logs_store[execution_id]['logs']
+                result = Execution.get_logs(execution_id, offset=offset, limit=limit, tail=tail)
             except KeyError:
                 logger.debug("did not find logs. execution: {}. actor: {}.".format(execution_id, actor_id))
-                logs = ""
-            result={'logs': logs}
+                result = {'logs': "", 'offset': 0, 'length': 0}
+            if ranged and not result['logs']:
+                response = ok(result={'length': result['length']}, msg="Requested range not satisfiable.")
+                response.status_code = 416
+                response.headers['Content-Range'] = f"chars */{result['length']}"
+                return response
             result.update(get_hypermedia(actor, exc))
-            return ok(result, msg="Logs retrieved successfully.")
+            response = ok(result, msg="Logs retrieved successfully.")
+            response.headers['Accept-Ranges'] = 'chars'
+            if ranged:
+                response.status_code = 206
+                end = result['offset'] + len(result['logs']) - 1
+                response.headers['Content-Range'] = f"chars {result['offset']}-{end}/{result['length']}"
+            return response
+
+
+def get_logs_stream_max_time():
+    """
+    Maximum number of seconds a logs stream is kept open; clients reconnect with the Last-Event-ID header to resume.
+    Should be lower than the timeout of the web server workers.
+    """
+    try:
+        return int(Config.get('web', 'logs_stream_max_time'))
+    except:
+        return 25
+
+
+class ActorExecutionLogsStreamResource(Resource):
+    # seconds between keep-alive comments sent while the execution produces no output.
+    KEEP_ALIVE = 15
+
+    def get(self, actor_id, execution_id):
+        """
+        Streams the logs of an execution as Server-Sent Events while it runs. Each event holds the new output of the
+        execution, one `data` line per line of output, and its `id` is the offset of the end of the output; a final
+        `end` event with the status of the execution is sent once it is COMPLETE or ERROR.
+        """
+        logger.debug("top of GET /actors/{}/executions/{}/logs/stream.".format(actor_id, execution_id))
+        dbid = g.db_id
+        try:
+            executions_store.get_fields(f'{dbid}_{execution_id}', ['status'])
+        except KeyError:
+            logger.debug(f"did not find execution with actor id of {actor_id} and execution id of {execution_id}.")
+            raise ResourceError(f"No executions found with actor id of {actor_id} and execution id of {execution_id}.",
+                                404)
+        # EventSource clients send the id of the last event they received when they reconnect.
+        offset = request.headers.get('Last-Event-ID') or request.args.get('offset') or 0
+        try:
+            offset = int(offset)
+        except ValueError:
+            raise ResourceError(f"Invalid offset: {offset}; offset must be an integer.", 400)
+        max_time = get_logs_stream_max_time()
+
+        def events():
+            start = last_sent = time.time()
+            # the client waits this many milliseconds before reconnecting after the stream is closed.
+            yield 'retry: 1000\n\n'
+            for end, logs in Execution.stream_logs(dbid, execution_id, offset=offset):
+                end += len(logs)
+                now = time.time()
+                if logs:
+                    data = ''.join(f'data: {line}\n' for line in logs.split('\n'))
+                    yield f'id: {end}\n{data}\n'
+                    last_sent = now
+                elif now - last_sent >= self.KEEP_ALIVE:
+                    yield ': keep-alive\n\n'
+                    last_sent = now
+                if now - start >= max_time:
+                    logger.debug(f"closing logs stream of execution {execution_id} after {max_time} seconds.")
+                    return
+            try:
+                status = executions_store.get_fields(f'{dbid}_{execution_id}', ['status']).get('status')
+            except KeyError:
+                status = None
+            yield f'event: end\ndata: {status}\n\n'
+
+        response = Response(events(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # keep proxies such as nginx from buffering the events.
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+
+def get_logs_range():
+    """
+    Returns the (offset, limit, tail, ranged) of the range of the execution logs requested, either through the offset,
+    limit and tail query parameters or an HTTP Range header in the `chars` range unit (chars=<first>-<last>,
+    chars=<first>- or chars=-<suffix>); `ranged` is True for a Range request. Offsets count characters of the log.
+    Range headers in other units, with several ranges or that cannot be parsed are ignored, as RFC 7233 allows.
+    """
+    values = {}
+    for name in ['offset', 'limit', 'tail']:
+        value = request.args.get(name)
+        if value is None:
+            values[name] = None
+            continue
+        try:
+            values[name] = int(value)
+        except ValueError:
+            raise ResourceError(f"Invalid {name}: {value}; {name} must be an integer.", 400)
+        if values[name] < 0:
+            raise ResourceError(f"Invalid {name}: {value}; {name} must be positive.", 400)
+    match = re.fullmatch(r'chars=(\d*)-(\d*)', request.headers.get('Range', '').strip())
+    if match and (match.group(1) or match.group(2)):
+        first, last = match.group(1), match.group(2)
+        if not first:
+            return 0, None, int(last), True
+        if not last:
+            return int(first), None, None, True
+        if int(last) >= int(first):
+            return int(first), int(last) - int(first) + 1, None, True
+    return values['offset'] or 0, values['limit'], values['tail'], False
 
 
 def get_messages_hypermedia(actor):
@@ -1834,75 +1878,200 @@ class MessagesResource(Resource):
             return ok(dict_to_camel(result))
 
     def do_synch_message(self, execution_id):
-        """Monitor for the termination of a synchronous message execution."""
+        """
+        Wait for the end of a synchronous message execution and return its first result, or its logs if it did not
+        send a result. The worker announces the end of the execution on a reply queue; if the execution does not
+        finish within the sync_timeout, a 202 pointing to the execution is returned instead.
+        """
         logger.debug("top of do_synch_message")
         dbid = g.db_id
-        ch = ExecutionResultsChannel(actor_id=dbid, execution_id=execution_id)
+        timeout = get_sync_timeout()
+        complete_ch = ExecutionCompleteChannel(actor_id=dbid, execution_id=execution_id)
+        try:
+            status = complete_ch.wait(timeout=timeout)
+        finally:
+            complete_ch.close()
+        if status is None:
+            logger.info(f"synchronous execution {execution_id} did not finish within {timeout} seconds.")
+            try:
+                status = executions_store.get_fields(f'{dbid}_{execution_id}', ['status']).get('status')
+            except KeyError:
+                status = None
+            actor = Actor.from_db(actors_store[dbid])
+            result = {'execution_id': execution_id,
+                      'status': status,
+                      '_links': {'self': '{}/actors/v2/{}/executions/{}'.format(actor.api_server, actor.id,
+                                                                                execution_id),
+                                 'logs': '{}/actors/v2/{}/executions/{}/logs'.format(actor.api_server, actor.id,
+                                                                                     execution_id)}}
+            if Config.get('web', 'case') == 'camel':
+                result = dict_to_camel(result)
+            response = ok(result, msg=f"Execution did not finish within {timeout} seconds; it is still running.")
+            response.status_code = 202
+            return response
+        logger.debug(f"execution finished with status: {status}")
+        if status == codes.ERROR:
+            raise ResourceError(f"Synchronous execution {execution_id} ended in {codes.ERROR} status.", 500)
+        # the worker publishes the results of the execution before finalizing it, so any result is already queued.
         result = None
-        complete = False
-        check_results_channel = True
         binary_result = False
-        timeout = 0.1
-        while not complete:
-            # check for a result on the results channel -
-            if check_results_channel:
-                logger.debug("checking for result on the results channel...")
-                try:
-                    result = ch.get(timeout=timeout)
-                    ch.close()
-                    complete = True
-                    binary_result = True
-                    logger.debug("check_results_channel thread got a result.")
-                except ChannelClosedException as e:
-                    # the channel unexpectedly closed, so just return
-                    logger.info("unexpected ChannelClosedException in check_results_channel thread: {}".format(e))
-                    check_results_channel = False
-                except ChannelTimeoutException:
-                    pass
-                except Exception as e:
-                    logger.info("unexpected exception in check_results_channel thread: {}".format(e))
-                    check_results_channel = False
-
-            # check to see if execution has completed:
-            if not complete:
-                try:
-                    exc = Execution.from_db(executions_store[f'{dbid}_{execution_id}'])
-                    complete = exc.status == COMPLETE
-                except Exception as e:
-                    logger.info("got exception trying to check execution status: {}".format(e))
-            if complete:
-                logger.debug("execution is complete")
-                if not result:
-                    # first try one more time to get a result -
-                    if check_results_channel:
-                        logger.debug("looking for result on results channel.")
-                        try:
-                            result = ch.get(timeout=timeout)
-                            binary_result = True
-                            logger.debug("got binary result.")
-                        except Exception as e:
-                            logger.debug(f"got exception: {e} -- did not get binary result")
-                            pass
-                    # if we still have no result, get the logs -
-                    if not result:
-                        logger.debug("stll don't have result; looking for logs...")
-                        try:
-                            result = logs_store[execution_id]['logs']
-                            logger.debug("got logs; returning result.")
-                        except KeyError:
-                            logger.debug("did not find logs. execution: {}. actor: {}.".format(execution_id, dbid))
-                            result = ""
+        ch = ExecutionResultsChannel(actor_id=dbid, execution_id=execution_id)
+        try:
+            result = ch.get(timeout=0.1)
+            binary_result = True
+            logger.debug("got binary result.")
+        except Exception as e:
+            logger.debug(f"got exception: {e} -- did not get binary result")
+        finally:
+            try:
+                ch.close()
+            except:
+                pass
+        # if we have no result, get the logs -
+        if not result:
+            logger.debug("no result; looking for logs...")
+            try:
+                result = Execution.get_logs(execution_id)['logs']
+                logger.debug("got logs; returning result.")
+            except KeyError:
+                logger.debug("did not find logs. execution: {}. actor: {}.".format(execution_id, dbid))
+                result = ""
         response = make_response(result)
         if binary_result:
             response.headers['content-type'] = 'application/octet-stream'
-        try:
-            ch.close()
-        except:
-            pass
         logger.debug("returning synchronous response.")
         return response
 
 
+def get_sync_timeout():
+    """
+    Maximum number of seconds a synchronous message request waits for its execution to finish. Should be lower than
+    the timeout of the web server workers.
+    """
+    try:
+        return int(Config.get('web', 'sync_timeout'))
+    except:
+        return 25
+
+
+def get_max_batch_messages():
+    """Maximum number of messages that can be sent in a single request to the messages batch endpoint."""
+    try:
+        return int(Config.get('web', 'max_batch_messages'))
+    except:
+        return 1000
+
+
+class MessagesBatchResource(Resource):
+    def validate_post(self):
+        """
+        Returns the list of messages in the POST body. The body must either be a JSON list or newline-delimited
+        JSON (content type application/x-ndjson), with one message per element (line).
+        """
+        logger.debug("validating batch message payload.")
+        content_type = request.headers.get('Content-Type') or ''
+        if 'ndjson' in content_type:
+            messages = []
+            for idx, line in enumerate(request.get_data(as_text=True).splitlines()):
+                if not line.strip():
+                    continue
+                try:
+                    messages.append(json.loads(line))
+                except json.decoder.JSONDecodeError:
+                    raise DAOError(f"Line {idx + 1} of the POST body could not be serialized as JSON.")
+        else:
+            messages = request.get_json(silent=True)
+            if messages is None:
+                try:
+                    messages = json.loads(request.data)
+                except (TypeError, json.decoder.JSONDecodeError):
+                    raise DAOError("batch message POST body could not be serialized. Pass a JSON list or "
+                                   "newline-delimited JSON (application/x-ndjson).")
+        if not isinstance(messages, list):
+            raise DAOError("batch message POST body must be a JSON list of messages.")
+        if not messages:
+            raise DAOError("batch message POST body must contain at least one message.")
+        max_messages = get_max_batch_messages()
+        if len(messages) > max_messages:
+            raise DAOError(f"Too many messages in batch; the maximum is {max_messages}.")
+        return messages
+
+    def post(self, actor_id):
+        start_timer = timeit.default_timer()
+        logger.debug("top of POST /actors/{}/messages/batch.".format(actor_id))
+        dbid = g.db_id
+        try:
+            actor = Actor.from_db(actors_store[dbid])
+        except KeyError:
+            logger.debug("did not find actor: {}.".format(actor_id))
+            raise ResourceError("No actor found with id: {}.".format(actor_id), 404)
+        messages = self.validate_post()
+        if request.args.get('_abaco_synchronous', '').lower() == 'true':
+            raise DAOError("Synchronous executions are not supported for batch messages.")
+        base_d = {}
+        # query parameters are added to every message in the batch, as in the single message endpoint.
+        for k, v in request.args.items():
+            if k == 'message' or k == '_abaco_synchronous':
+                continue
+            base_d[k] = v
+        if hasattr(g, 'user'):
+            base_d['_abaco_username'] = g.user
+        if hasattr(g, 'api_server'):
+            base_d['_abaco_api_server'] = g.api_server
+        if hasattr(g, 'jwt_header_name'):
+            base_d['_abaco_jwt_header_name'] = g.jwt_header_name
+        before_exc_timer = timeit.default_timer()
+        exc_ids = Execution.add_executions(dbid, [{'cpu': 0,
+                                                   'io': 0,
+                                                   'runtime': 0,
+                                                   'status': SUBMITTED,
+                                                   'executor': g.user} for _ in messages])
+        after_exc_timer = timeit.default_timer()
+        logger.info("{} executions added for actor {}".format(len(exc_ids), actor_id))
+        ds = []
+        for exc_id, message in zip(exc_ids, messages):
+            d = dict(base_d)
+            d['_abaco_execution_id'] = exc_id
+            if isinstance(message, str):
+                d['_abaco_Content_Type'] = 'str'
+            else:
+                d['_abaco_Content_Type'] = 'application/json'
+            d['_abaco_actor_revision'] = actor.revision
+            ds.append(d)
+        ch = ActorMsgChannel(actor_id=dbid)
+        try:
+            failed = ch.put_msgs(messages=messages, ds=ds)
+        finally:
+            ch.close()
+        after_put_msgs_timer = timeit.default_timer()
+        failed_ids = [d['_abaco_execution_id'] for d in failed]
+        for exc_id in failed_ids:
+            logger.error(f"Message for execution {exc_id} was not confirmed by the broker; actor: {actor_id}.")
+            Execution.update_status(dbid, exc_id, codes.ERROR)
+        logger.debug("Messages added to actor inbox. id: {}.".format(actor_id))
+        actor.ensure_one_worker()
+        end_timer = timeit.default_timer()
+        time_data = {'total': (end_timer - start_timer) * 1000,
+                     'add_executions': (after_exc_timer - before_exc_timer) * 1000,
+                     'put_msgs_ch': (after_put_msgs_timer - after_exc_timer) * 1000,
+                     'ensure_1_worker': (end_timer - after_put_msgs_timer) * 1000,
+                     }
+        logger.info("Times to process batch of {} messages: {}".format(len(messages), time_data))
+        result = {'execution_ids': [exc_id for exc_id in exc_ids if exc_id not in failed_ids],
+                  'failed_execution_ids': failed_ids,
+                  '_links': {'messages': '{}/actors/v2/{}/messages'.format(actor.api_server, actor.id),
+                             'executions': '{}/actors/v2/{}/executions'.format(actor.api_server, actor.id),
+                             'owner': '{}/profiles/v2/{}'.format(actor.api_server, actor.owner)}}
+        msg = "{} messages sent.".format(len(result['execution_ids']))
+        if failed_ids:
+            msg = "{} Could not send {} messages.".format(msg, len(failed_ids))
+        case = Config.get('web', 'case')
+        if not case == 'camel':
+            return ok(result=result, msg=msg)
+        else:
+            return ok(result=dict_to_camel(result), msg=msg)
+
+
 class WorkersResource(Resource):
     def get(self, actor_id):
         logger.debug("top of GET /actors/{}/workers for tenant {}.".format(actor_id, g.tenant))
@@ -1967,21 +2136,10 @@ class WorkersResource(Resource):
                                                                                                  actor_id))
             num_to_add = int(num) - len(workers)
             logger.info("adding {} more workers for actor {}".format(num_to_add, actor_id))
-            for idx in range(num_to_add):
-                # send num_to_add messages to add 1 worker so that messages are spread across multiple
-                # spawners.
-                worker_id = Worker.request_worker(tenant=g.tenant,
-                                                  actor_id=dbid)
-                logger.info("New worker id: {}".format(worker_id[0]))
-                ch = CommandChannel(name=actor.queue)
-                ch.put_cmd(actor_id=actor.db_id,
-                           worker_id=worker_id,
-                           image=actor.image,
-                           revision=actor.revision,
-                           tenant=g.tenant,
-                           stop_existing=False)
-            ch.close()
-            logger.info("Message put on command channel for new worker ids: {}".format(worker_id))
+            # send num_to_add messages to add 1 worker so that messages are spread across multiple
+            # spawners.
+            worker_ids = actor.request_workers(tenant=g.tenant, num=num_to_add)
+            logger.info("Message put on command channel for new worker ids: {}".format(worker_ids))
             return ok(result=None, msg="Scheduled {} new worker(s) to start. Previously, there were {} workers.".format(num_to_add, current_number_workers))
         else:
             return ok(result=None, msg="Actor {} already had {} worker(s).".format(actor_id, num))
@@ -1,3 +1,4 @@
+import calendar
 import configparser
 import json
 import os
@@ -6,8 +7,10 @@ import time
 import timeit
 import datetime
 import random
+import threading
 
 import docker
+from prometheus_client import Histogram
 from requests.packages.urllib3.exceptions import ReadTimeoutError
 from requests.exceptions import ReadTimeout, ConnectionError
 
@@ -19,7 +22,7 @@ from config import Config
 from codes import BUSY, READY, RUNNING
 import encrypt_utils
 import globals
-from models import Actor, Execution, get_current_utc_time, display_time, ActorConfig
+from models import Actor, Execution, get_current_utc_time, display_time, ActorConfig, LOG_TRUNCATED_MESSAGE
 from stores import workers_store, alias_store, configs_store
 
 
@@ -34,6 +37,18 @@ RESULTS_SOCKET_TIMEOUT = 0.1
 # max frame size, in bytes, for a single result
 MAX_RESULT_FRAME_SIZE = 131072
 
+# interval (in seconds) at which a running execution is checked for a force quit and the max_run_time
+SUPERVISION_INTERVAL = 1
+
+# interval (in seconds) at which the logs of a running execution are saved
+LOGS_INTERVAL = 5
+
+# timeout (in seconds) for reads on the docker stats stream of an actor container
+STATS_TIMEOUT = 10
+
+# label set on actor containers to the id of the worker that started them
+CONTAINER_WORKER_LABEL = 'org.abaco.worker_id'
+
 max_run_time = int(Config.get('workers', 'max_run_time'))
 
 dd = Config.get('docker', 'dd')
@@ -42,6 +57,55 @@ logger.debug("host_id: {}".format(host_id))
 host_ip = Config.get('spawner', 'host_ip')
 
 
+# time spent pulling actor images; only pulls that actually reach the registry are observed.
+IMAGE_PULL_TIME = Histogram('abaco_image_pull_seconds', 'Time spent pulling actor images from the registry.')
+
+# cache of config values for this worker, keyed by config id; each value is a tuple of the config revision and the
+# (decrypted) value. a config update sets a new revision, which invalidates the cached value.
+config_cache = {}
+
+
+def get_actor_configs(actor_id, tenant):
+    """
+    Returns a dictionary of the configs that apply to an actor (directly or through one of its aliases), mapping each
+    config name to its (decrypted) value.
+    :param actor_id: the dbid of the actor.
+    :param tenant: the tenant of the actor.
+    """
+    actor_configs = {}
+    # the actor_id passed in is the dbid
+    actor_human_id = Actor.get_display_id(tenant, actor_id)
+    # list of all aliases for the actor
+    alias_list = [alias['alias'] for alias in alias_store.items({'actor_id': actor_human_id, 'tenant': tenant},
+                                                                proj_inp={'alias': True, '_id': False})]
+    logger.debug(f"alias_list: {alias_list}")
+    # look up the configs that apply to this actor without retrieving their values; values are only read for configs
+    # that are not in the cache or whose revision has changed.
+    config_list = configs_store.items({'tenant': tenant, 'actors_list': {'$in': [actor_human_id] + alias_list}},
+                                      proj_inp={'name': True, 'is_secret': True, 'revision': True})
+    logger.debug(f"got config_list: {config_list}")
+    misses = [config['_id'] for config in config_list
+              if config['_id'] not in config_cache or not config_cache[config['_id']][0] == config.get('revision')]
+    if misses:
+        for config in configs_store.items({'_id': {'$in': misses}},
+                                          proj_inp={'value': True, 'is_secret': True, 'revision': True}):
+            # for each config, need to check for secrets and decrypt ---
+            try:
+                if config['is_secret']:
+                    value = encrypt_utils.decrypt(config['value'])
+                else:
+                    value = config['value']
+                config_cache[config['_id']] = (config.get('revision'), value)
+            except Exception as e:
+                logger.error(f"something went wrong checking is_secret for config: {config['_id']}; e: {e}")
+    for config in config_list:
+        try:
+            actor_configs[config['name']] = config_cache[config['_id']][1]
+        except KeyError:
+            pass
+    return actor_configs
+
+
 class DockerError(Exception):
     def __init__(self, message):
         Exception.__init__(self, message)
@@ -150,6 +214,108 @@ def pull_image(image):
     return rsp
 
 
+def get_image_digest(image):
+    """Returns the repo digest of the local copy of `image`, or its id if it has no repo digest."""
+    cli = docker.APIClient(base_url=dd, version="auto")
+    try:
+        info = cli.inspect_image(image)
+    except Exception as e:
+        msg = "Error inspecting image {} - exception: {} ".format(image, e)
+        logger.info(msg)
+        raise DockerError(msg)
+    digests = info.get('RepoDigests') or []
+    return digests[0] if digests else info.get('Id')
+
+
+def get_image_refresh_interval():
+    """Returns how long, in seconds, a pulled image is used before it is pulled again (the image_refresh_interval)."""
+    try:
+        return int(Config.get('spawner', 'image_refresh_interval'))
+    except:
+        return 300
+
+
+class ImagePullCache(object):
+    """
+    Cache of the actor images pulled on this host, keyed by image and actor revision. An image is not pulled again
+    until its last pull is older than the refresh interval; since updating an actor's image increments its revision,
+    the new image is always pulled. Concurrent pulls of the same image and revision are coalesced into one pull.
+    """
+
+    def __init__(self, refresh_interval=None):
+        if refresh_interval is None:
+            refresh_interval = get_image_refresh_interval()
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        # (image, revision) -> (time of the last pull, digest)
+        self._pulls = {}
+        # (image, revision) -> the pull in progress; a dictionary with an event that is set when the pull finishes
+        # and the resulting digest or error.
+        self._pending = {}
+
+    def is_fresh(self, image, revision=None):
+        """Whether `image` was pulled for `revision` within the refresh interval."""
+        with self._lock:
+            return self._is_fresh((image, revision))
+
+    def _is_fresh(self, key):
+        pull = self._pulls.get(key)
+        return pull is not None and time.time() - pull[0] < self.refresh_interval
+
+    def pull(self, image, revision=None):
+        """
+        Make sure an up to date copy of `image` is on this host, pulling it only if needed.
+        :return: the digest of the image.
+        """
+        key = (image, revision)
+        with self._lock:
+            if self._is_fresh(key):
+                logger.debug("image {} (revision {}) pulled recently; not pulling.".format(image, revision))
+                return self._pulls[key][1]
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = {'event': threading.Event(), 'digest': None, 'error': None}
+                self._pending[key] = pending
+        if not owner:
+            logger.debug("waiting on the pull of image {} (revision {}) in progress.".format(image, revision))
+            pending['event'].wait()
+            if pending['error'] is not None:
+                raise pending['error']
+            return pending['digest']
+        try:
+            start = timeit.default_timer()
+            pull_image(image)
+            IMAGE_PULL_TIME.observe(timeit.default_timer() - start)
+            pending['digest'] = get_image_digest(image)
+            with self._lock:
+                previous = [digest for (i, r), (t, digest) in self._pulls.items() if i == image]
+                self._pulls[key] = (time.time(), pending['digest'])
+            if previous and pending['digest'] not in previous:
+                logger.info("image {} updated; new digest: {}".format(image, pending['digest']))
+            return pending['digest']
+        except Exception as e:
+            # waiters re-raise the error of the pull, whatever it is, rather than carry on without the image.
+            pending['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            pending['event'].set()
+
+
+def get_host_resources():
+    """Returns the number of cores and the memory, in bytes, of the docker host."""
+    cli = docker.APIClient(base_url=dd, version="auto")
+    try:
+        info = cli.info()
+    except Exception as e:
+        msg = "Error getting the docker host info - exception: {}".format(e)
+        logger.error(msg)
+        raise DockerError(msg)
+    return info.get('NCPU'), info.get('MemTotal')
+
+
 def list_all_containers():
     """Returns a list of all containers """
     cli = docker.APIClient(base_url=dd, version="auto")
@@ -383,18 +549,7 @@ def run_worker(image,
 
     logger.info("Final fifo_host_path_dir: {}; socket_host_path_dir: {}".format(fifo_host_path_dir,
                                                                                 socket_host_path_dir))
-    try:
-        auto_remove = Config.get('workers', 'auto_remove')
-    except (configparser.NoSectionError, configparser.NoOptionError) as e:
-        logger.debug("no auto_remove in the workers stanza.")
-        auto_remove = True
-    if hasattr(auto_remove, 'lower'):
-        if auto_remove.lower() == 'false':
-            auto_remove = False
-        else:
-            auto_remove = True
-    elif not auto_remove == True:
-        auto_remove = False
+    auto_remove = get_worker_auto_remove()
     container = run_container_with_docker(
         image=AE_IMAGE,
         command=command,
@@ -418,17 +573,107 @@ def run_worker(image,
     # don't catch errors -- if we get an error trying to run a worker, let it bubble up.
     # TODO - determines worker structure; should be placed in a proper DAO class.
     logger.info("worker container running. worker_id: {}. container: {}".format(worker_id, container))
+    return get_worker_dict(image, worker_id, container.get('Id'))
+
+
+def get_worker_auto_remove():
+    """Returns whether worker containers should be removed by docker when they exit (the auto_remove config)."""
+    try:
+        auto_remove = Config.get('workers', 'auto_remove')
+    except (configparser.NoSectionError, configparser.NoOptionError) as e:
+        logger.debug("no auto_remove in the workers stanza.")
+        auto_remove = True
+    if hasattr(auto_remove, 'lower'):
+        if auto_remove.lower() == 'false':
+            auto_remove = False
+        else:
+            auto_remove = True
+    elif not auto_remove == True:
+        auto_remove = False
+    return auto_remove
+
+
+def get_worker_dict(image, worker_id, cid):
+    """Returns the description of a new worker running in container `cid`, as stored in the workers_store."""
     return { 'image': image,
              # @todo - location will need to change to support swarm or cluster
              'location': dd,
              'id': worker_id,
-             'cid': container.get('Id'),
+             'cid': cid,
              'status': READY,
              'host_id': host_id,
              'host_ip': host_ip,
              'last_execution_time': 0,
              'last_health_check_time': get_current_utc_time() }
 
+def run_warm_worker(warm_id, name):
+    """
+    Run a generic worker container for a spawner's warm pool. The container waits on the spawner worker channel of
+    `warm_id` until the spawner binds it to an actor (see bind_warm_worker()). Since the id of the worker it will be
+    bound to is not known yet, the fifo and socket directories of the container are named after `warm_id`; the worker
+    keeps using them once bound (the `ipc_id` of the worker).
+    :return: the id of the container.
+    """
+    logger.debug("top of run_warm_worker(); warm_id: {}".format(warm_id))
+    command = 'python3 -u /actors/worker.py'
+    mounts = []
+    for section_option in ['fifo_host_path_dir', 'socket_host_path_dir']:
+        try:
+            path = Config.get('workers', section_option)
+        except (configparser.NoSectionError, configparser.NoOptionError):
+            continue
+        mounts.append({'host_path': os.path.join(path, warm_id),
+                       'container_path': os.path.join(path, warm_id),
+                       'format': 'rw'})
+    container = run_container_with_docker(
+        image=AE_IMAGE,
+        command=command,
+        environment={
+            'worker_id': warm_id,
+            'ipc_id': warm_id,
+            '_abaco_secret': os.environ.get('_abaco_secret')},
+        mounts=mounts,
+        log_file=None,
+        auto_remove=get_worker_auto_remove(),
+        name=name
+    )
+    logger.info("warm worker container running. warm_id: {}. container: {}".format(warm_id, container))
+    return container.get('Id')
+
+
+def bind_warm_worker(cid, warm_id, image, actor_id, worker_id):
+    """
+    Bind the warm worker container `cid` to the worker `worker_id` of an actor. The container is renamed to the name
+    of a regular worker container; the worker itself receives the rest of its configuration from the spawner and keeps
+    the fifo and socket directories of the warm worker.
+    :return: the worker dictionary, as returned by run_worker(), with the `ipc_id` of the warm worker.
+    """
+    cli = docker.APIClient(base_url=dd, version="auto")
+    try:
+        cli.rename(cid, 'worker_{}_{}'.format(actor_id, worker_id))
+    except Exception as e:
+        msg = "Got exception trying to rename warm worker container {}. Exception: {}".format(cid, e)
+        logger.info(msg)
+        raise DockerError(msg)
+    worker_dict = get_worker_dict(image, worker_id, cid)
+    worker_dict['ipc_id'] = warm_id
+    return worker_dict
+
+
+def rm_containers(name):
+    """Remove all containers, running or not, whose name contains the string `name`."""
+    cli = docker.APIClient(base_url=dd, version="auto")
+    try:
+        containers = cli.containers(all=True, filters={'name': name})
+    except Exception as e:
+        msg = "There was an error listing containers for name: {}. Exception: {}".format(name, e)
+        logger.error(msg)
+        raise DockerError(msg)
+    for container in containers:
+        rm_container(container.get('Id'))
+    return len(containers)
+
+
 def stop_container(cli, cid):
     """
     Attempt to stop a running container, with retry logic. Should only be called with a running container.
@@ -447,6 +692,289 @@ def stop_container(cli, cid):
             continue
     raise DockerStopContainerError
 
+class ContainerEvents(object):
+    """
+    Subscription to the docker events of the actor containers started by a worker, which are labeled with the
+    worker's id (CONTAINER_WORKER_LABEL). The `die` event of a watched container sets the Event returned by watch().
+    The subscription is opened with the first watched container and reopened if the stream drops; a container that
+    exits while it is down is still detected by the wait() on the container (see wait_container).
+    """
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._watched = {}
+        self._thread = None
+
+    def watch(self, cid):
+        """Return an Event set when the container `cid` exits."""
+        finished = threading.Event()
+        with self._lock:
+            self._watched[cid] = finished
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return finished
+
+    def unwatch(self, cid):
+        with self._lock:
+            self._watched.pop(cid, None)
+
+    def _run(self):
+        cli = docker.APIClient(base_url=dd, version="auto")
+        filters = {'type': 'container',
+                   'event': ['die', 'oom'],
+                   'label': '{}={}'.format(CONTAINER_WORKER_LABEL, self.worker_id)}
+        while True:
+            try:
+                for event in cli.events(filters=filters, decode=True):
+                    cid = event.get('id')
+                    action = event.get('Action') or event.get('status')
+                    if action == 'oom':
+                        logger.info("actor container {} ran out of memory; worker: {}".format(cid, self.worker_id))
+                        continue
+                    with self._lock:
+                        finished = self._watched.get(cid)
+                    if finished:
+                        finished.set()
+            except Exception as e:
+                logger.error("Got exception reading the docker events of worker {}; "
+                             "will resubscribe. Exception: {}".format(self.worker_id, e))
+                time.sleep(1)
+
+
+_container_events = {}
+_container_events_lock = threading.Lock()
+
+
+def get_container_events(worker_id):
+    """Return the ContainerEvents subscription of the worker `worker_id`, creating it if needed."""
+    with _container_events_lock:
+        if worker_id not in _container_events:
+            _container_events[worker_id] = ContainerEvents(worker_id)
+        return _container_events[worker_id]
+
+
+def wait_container(cid, finished, worker_id, execution_id):
+    """Block on a wait() for the container `cid` to exit, then set `finished`. Target for a thread."""
+    cli = docker.APIClient(base_url=dd, version="auto")
+    while not finished.is_set():
+        try:
+            cli.wait(cid)
+        except docker.errors.NotFound:
+            logger.info("container {} no longer exists. (worker {};{})".format(cid, worker_id, execution_id))
+        except Exception as e:
+            # the connection to the docker daemon could be dropped under load; wait again unless the container
+            # exit was seen on the events stream in the meantime.
+            logger.error("Got exception waiting on container {}; Exception: {}; "
+                         "(worker {};{})".format(cid, e, worker_id, execution_id))
+            time.sleep(1)
+            continue
+        finished.set()
+
+
+def read_stats(cid, result, worker_id, execution_id):
+    """
+    Read the docker stats stream of the container `cid`, adding the cpu and io of each stats object to `result`,
+    until the stream ends with the container. Target for a thread.
+    """
+    stats_cli = docker.APIClient(base_url=dd, timeout=STATS_TIMEOUT, version="auto")
+    # under load, we can see UnixHTTPConnectionPool ReadTimeout's trying to create the stats_obj
+    # so here we are trying up to 3 times to create the stats object
+    ct = 0
+    stats_obj = None
+    while ct < 3:
+        try:
+            stats_obj = stats_cli.stats(container=cid, decode=True)
+            break
+        except ReadTimeout:
+            ct += 1
+        except Exception as e:
+            logger.error("Unexpected exception creating stats_obj. Exception: {}; (worker {};{})".format(e, worker_id,
+                                                                                                         execution_id))
+            return
+    if not stats_obj:
+        return
+    try:
+        for stats in stats_obj:
+            try:
+                result['cpu'] += stats['cpu_stats']['cpu_usage']['total_usage']
+            except KeyError as e:
+                logger.info("Got a KeyError trying to fetch the cpu object: {}; "
+                            "(worker {};{})".format(e, worker_id, execution_id))
+            try:
+                result['io'] += stats['networks']['eth0']['rx_bytes']
+            except KeyError as e:
+                logger.info("Got KeyError exception trying to grab the io object. "
+                            "Exception: {}; (worker {};{})".format(e, worker_id, execution_id))
+    except (ReadTimeout, ReadTimeoutError, ConnectionError) as e:
+        # the stream can time out once the container has exited or when the docker daemon is under load; stats
+        # collected so far are kept.
+        logger.info("stats stream ended: {}; (worker {};{})".format(e, worker_id, execution_id))
+    except Exception as e:
+        logger.error("Unexpected exception reading stats. Exception: {}; (worker {};{})".format(e, worker_id,
+                                                                                                execution_id))
+
+
+def read_results(server, results_ch, finished, worker_id, execution_id):
+    """
+    Read the results socket of an execution, putting each datagram on the results channel, until `finished` is set
+    and the socket has been drained. Target for a thread.
+    """
+    while True:
+        datagram = None
+        try:
+            datagram = server.recv(MAX_RESULT_FRAME_SIZE)
+        except socket.timeout:
+            if finished.is_set():
+                break
+        except Exception as e:
+            logger.error("Got exception from server.recv: {}; (worker {};{})".format(e, worker_id, execution_id))
+            if finished.is_set():
+                break
+            time.sleep(RESULTS_SOCKET_TIMEOUT)
+        if datagram:
+            try:
+                results_ch.put(datagram)
+            except Exception as e:
+                logger.error("Error trying to put datagram on results channel. "
+                             "Exception: {}; (worker {};{})".format(e, worker_id, execution_id))
+
+
+# number of consecutive attempts to follow the log stream of a container, without receiving output, before the
+# capture gives up.
+LOG_STREAM_TRIES = 10
+LOG_CAPTURE_FAILED_MESSAGE = " LOG CAPTURE FAILED; this execution log was TRUNCATED!"
+
+
+def get_log_timestamp(timestamp):
+    """Convert the RFC3339 timestamp docker prefixes log lines with to nanoseconds since the epoch."""
+    seconds, _, fraction = timestamp.rstrip('Z').partition('.')
+    stamp = calendar.timegm(time.strptime(seconds, '%Y-%m-%dT%H:%M:%S'))
+    return stamp * 10**9 + int(fraction[:9].ljust(9, '0'))
+
+
+class LogCapture(object):
+    """
+    Incremental capture of the logs of an actor container. A reader thread follows the container's log stream and
+    buffers the new output; flush() appends the buffered output to the execution's logs, so each write only carries
+    the output produced since the previous one. The logs are capped at max_log_length as they are captured: output
+    past the limit is dropped and the truncation notice is appended once.
+    """
+
+    def __init__(self, cid, actor_id, execution_id, tenant, worker_id, log_ex):
+        self.cid = cid
+        self.actor_id = actor_id
+        self.execution_id = execution_id
+        self.tenant = tenant
+        self.worker_id = worker_id
+        self.log_ex = log_ex
+        self.max_log_length = Execution.get_max_log_length()
+        # number of characters captured so far, flushed or not.
+        self.length = 0
+        self.truncated = False
+        self._buffer = []
+        self._flushed = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        # the log stream stays open while the container runs, which can be silent for long periods, so reads on it
+        # must not time out.
+        cli = docker.APIClient(base_url=dd, timeout=None, version="auto")
+        # each line of the stream is prefixed with its timestamp; after a reconnect, the stream is resumed from the
+        # second of the last line captured and the lines up to that line are skipped.
+        last = None
+        # consecutive attempts to follow the stream that failed without receiving a line.
+        tries = 0
+        while tries < LOG_STREAM_TRIES:
+            tries += 1
+            since = last // 10**9 if last else None
+            partial = ''
+            try:
+                for chunk in cli.logs(self.cid, stream=True, follow=True, timestamps=True, since=since):
+                    if type(chunk) == bytes:
+                        chunk = chunk.decode('utf-8', errors='replace')
+                    lines = (partial + chunk).split('\n')
+                    partial = lines.pop()
+                    for line in lines:
+                        last = self._add_line(line + '\n', last)
+                    if lines:
+                        tries = 0
+                # the stream ends when the container exits.
+                if partial:
+                    self._add_line(partial, last)
+                return
+            except Exception as e:
+                logger.error("Got exception following the logs of container {}; Exception: {}; "
+                             "(worker {};{})".format(self.cid, e, self.worker_id, self.execution_id))
+                time.sleep(1)
+        logger.error("Giving up following the logs of container {} after {} failed attempts; the logs of the "
+                     "execution are truncated. (worker {};{})".format(self.cid, LOG_STREAM_TRIES, self.worker_id,
+                                                                      self.execution_id))
+        self.truncate(LOG_CAPTURE_FAILED_MESSAGE)
+
+    def _add_line(self, line, last):
+        """
+        Add a timestamped line of the log stream unless it is not newer than the line captured last (whose timestamp,
+        in nanoseconds, is `last`).
+        :return: the timestamp of the line captured last.
+        """
+        timestamp, _, line = line.partition(' ')
+        stamp = get_log_timestamp(timestamp)
+        if last is not None and stamp <= last:
+            return last
+        self.add(line)
+        return stamp
+
+    def add(self, chunk):
+        """Add new output of the container, applying the max_log_length limit."""
+        # in some environments, perhaps depending on OS or docker version, the logs object is of type bytes.
+        if type(chunk) == bytes:
+            chunk = chunk.decode('utf-8', errors='replace')
+        with self._lock:
+            if self.truncated:
+                return
+            room = self.max_log_length - self.length
+            if len(chunk) > room:
+                logger.info("truncating log for execution: {}".format(self.execution_id))
+                chunk = chunk[:room] + LOG_TRUNCATED_MESSAGE
+                self.truncated = True
+            self._buffer.append(chunk)
+            self.length += len(chunk)
+
+    def truncate(self, message):
+        """Stop capturing output, appending `message` to the logs once."""
+        with self._lock:
+            if self.truncated:
+                return
+            self._buffer.append(message)
+            self.length += len(message)
+            self.truncated = True
+
+    def flush(self):
+        """Append the output captured since the last flush to the execution's logs."""
+        with self._lock:
+            logs = ''.join(self._buffer)
+            self._buffer = []
+        if not logs and self._flushed:
+            return
+        # the first flush replaces any logs left by an earlier attempt of the execution.
+        Execution.append_logs(self.execution_id, logs, self.actor_id, self.tenant, self.log_ex,
+                              reset=not self._flushed)
+        self._flushed = True
+
+    def close(self, timeout=None):
+        """Wait for the log stream to end (the container has exited) and flush the rest of the output."""
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self.flush()
+
+
 def execute_actor(actor_id,
                   worker_id,
                   execution_id,
@@ -461,7 +989,8 @@ def execute_actor(actor_id,
                   socket_host_path=None,
                   mem_limit=None,
                   max_cpus=None,
-                  tenant=None):
+                  tenant=None,
+                  log_ex=None):
     """
     Creates and runs an actor container and supervises the execution, collecting statistics about resource consumption
     from the Docker daemon.
@@ -481,58 +1010,21 @@ def execute_actor(actor_id,
     :param socket_host_path: If not None, a string representing a path on the host to a socket used for collecting results from the actor.
     :param mem_limit: The maximum amount of memory the Actor container can use; should be the same format as the --memory Docker flag.
     :param max_cpus: The maximum number of CPUs each actor will have available to them. Does not guarantee these CPU resources; serves as upper bound.
-    :return: result (dict), logs (str) - `result`: statistics about resource consumption; `logs`: output from docker logs.
+    :param log_ex: The log expiry for the actor, if already known to the caller; otherwise, it is looked up.
+    :return: result (dict), final state (dict), exit code, start time - `result`: statistics about resource
+    consumption. The logs of the execution are saved as they are produced, before this function returns.
     """
     logger.debug(f"top of execute_actor(); actor_id: {actor_id}; tenant: {tenant} (worker {worker_id};{execution_id})")
 
     # get any configs for this actor
-    actor_configs = {}
-    config_list = []
-    # list of all aliases for the actor
-    alias_list = []
-    # the actor_id passed in is the dbid
-    actor_human_id = Actor.get_display_id(tenant, actor_id)
-
-    for alias in alias_store.items():
-        logger.debug(f"checking alias: {alias}")
-        if actor_human_id == alias['actor_id'] and tenant == alias['tenant']:
-            alias_list.append(alias['alias'])
-    logger.debug(f"alias_list: {alias_list}")
-    # loop through configs to look for any that apply to this actor
-    for config in configs_store.items():
-        # first look for the actor_id itself
-        if actor_human_id in config['actors']:
-            logger.debug(f"actor_id matched; adding config {config}")
-            config_list.append(config)
-        else:
-            logger.debug("actor id did not match; checking aliases...")
-            # if we didn't find the actor_id, look for ay of its aliases
-            for alias in alias_list:
-                if alias in config['actors']:
-                    # as soon as we find it, append and get out (only want to add once)
-                    logger.debug(f"alias {alias} matched; adding config: {config}")
-                    config_list.append(config)
-                    break
-    logger.debug(f"got config_list: {config_list}")
-    # for each config, need to check for secrets and decrypt ---
-    for config in config_list:
-        logger.debug('checking for secrets')
-        try:
-            if config['is_secret']:
-                value = encrypt_utils.decrypt(config['value'])
-                actor_configs[config['name']] = value
-            else:
-                actor_configs[config['name']] = config['value']
-
-        except Exception as e:
-            logger.error(f'something went wrong checking is_secret for config: {config}; e: {e}')
-
+    actor_configs = get_actor_configs(actor_id, tenant)
     logger.debug(f"final actor configs: {actor_configs}")
     d['_actor_configs'] = actor_configs
 
 
-    # initially set the global force_quit variable to False
-    globals.force_quit = False
+    # note: the global force_quit is not reset here. it is only set when the worker is shutting down, and a worker
+    # running several executions at once (see the actor's concurrency) must halt all of them. a force quit of a
+    # single execution is requested through globals.force_quit_executions instead.
 
     # initial stats object, environment, binds and volumes
     result = {'cpu': 0,
@@ -664,7 +1156,11 @@ def execute_actor(actor_id,
                                      environment=d,
                                      user=user,
                                      volumes=volumes,
-                                     host_config=host_config)
+                                     host_config=host_config,
+                                     labels={CONTAINER_WORKER_LABEL: worker_id})
+    # watch the container before starting it so that its exit cannot be missed.
+    container_events = get_container_events(worker_id)
+    finished = container_events.watch(container.get('Id'))
     # get the UTC time stamp
     start_time = get_current_utc_time()
     # start the timer to track total execution time.
@@ -676,166 +1172,61 @@ def execute_actor(actor_id,
     except Exception as e:
         # if there was an error starting the container, user will need to debug
         logger.info("Got exception starting actor container: {}; (worker {};{})".format(e, worker_id, execution_id))
+        container_events.unwatch(container.get('Id'))
         raise DockerStartContainerError("Could not start container {}. Exception {}".format(container.get('Id'), str(e)))
 
     # local bool tracking whether the actor container is still running
     running = True
     Execution.update_status(actor_id, execution_id, RUNNING)
 
-    logger.debug("right before creating stats_cli: {}; (worker {};{})".format(timeit.default_timer(),
-                                                                              worker_id, execution_id))
-    # create a separate cli for checking stats objects since these should be fast and we don't want to wait
-    stats_cli = docker.APIClient(base_url=dd, timeout=1, version="auto")
-    logger.debug("right after creating stats_cli: {}; (worker {};{})".format(timeit.default_timer(),
-                                                                             worker_id, execution_id))
-
-    # under load, we can see UnixHTTPConnectionPool ReadTimeout's trying to create the stats_obj
-    # so here we are trying up to 3 times to create the stats object for a possible total of 3s
-    # timeouts
-    ct = 0
-    stats_obj = None
-    logs = None
-    while ct < 3:
-        try:
-            stats_obj = stats_cli.stats(container=container.get('Id'), decode=True)
-            break
-        except ReadTimeout:
-            ct += 1
-        except Exception as e:
-            logger.error("Unexpected exception creating stats_obj. Exception: {}; (worker {};{})".format(e, worker_id,
-                                                                                                         execution_id))
-            # in this case, we need to kill the container since we cannot collect stats;
-            # UPDATE - 07-2018: under load, a errors can occur attempting to create the stats object.
-            # the container could still be running; we need to explicitly check the container status
-            # to be sure.
-    logger.debug("right after attempting to create stats_obj: {}; (worker {};{})".format(timeit.default_timer(),
-                                                                                         worker_id, execution_id))
-    # a counter of the number of iterations through the main "running" loop;
-    # this counter is used to determine when less frequent actions, such as log aggregation, need to run.
-    loop_idx = 0
-    log_ex = Actor.get_actor_log_ttl(actor_id)
-    while running and not globals.force_quit:
-        loop_idx += 1
-        logger.debug("top of while running loop; loop_idx: {}".format(loop_idx))
-        datagram = None
-        stats = None
-        try:
-            datagram = server.recv(MAX_RESULT_FRAME_SIZE)
-        except socket.timeout:
-            pass
-        except Exception as e:
-            logger.error("got exception from server.recv: {}; (worker {};{})".format(e, worker_id, execution_id))
-        logger.debug("right after try/except datagram block: {}; (worker {};{})".format(timeit.default_timer(),
-                                                                                        worker_id, execution_id))
-        if datagram:
-            try:
-                results_ch.put(datagram)
-            except Exception as e:
-                logger.error("Error trying to put datagram on results channel. "
-                             "Exception: {}; (worker {};{})".format(e, worker_id, execution_id))
-        logger.debug("right after results ch.put: {}; (worker {};{})".format(timeit.default_timer(),
-                                                                             worker_id, execution_id))
-
-        # only try to collect stats if we have a stats_obj:
-        if stats_obj:
-            logger.debug("we have a stats_obj; trying to collect stats. (worker {};{})".format(worker_id, execution_id))
-            try:
-                logger.debug("waiting on a stats obj: {}; (worker {};{})".format(timeit.default_timer(),
-                                                                                 worker_id, execution_id))
-                stats = next(stats_obj)
-                logger.debug("got the stats obj: {}; (worker {};{})".format(timeit.default_timer(),
-                                                                            worker_id, execution_id))
-            except StopIteration:
-                # we have read the last stats object - no need for processing
-                logger.debug("Got StopIteration; no stats object. (worker {};{})".format(worker_id, execution_id))
-            except ReadTimeoutError:
-                # this is a ReadTimeoutError from docker, not requests. container is finished.
-                logger.info("next(stats) just timed out: {}; (worker {};{})".format(timeit.default_timer(),
-                                                                                    worker_id, execution_id))
-                # UPDATE - 07-2018: under load, a ReadTimeoutError from the attempt to get a stats object
-                # does NOT imply the container has stopped; we need to explicitly check the container status
-                # to be sure.
-
-        # if we got a stats object, add it to the results; it is possible stats collection timed out and the object
-        # is None
-        if stats:
-            logger.debug("adding stats to results; (worker {};{})".format(worker_id, execution_id))
-            try:
-                result['cpu'] += stats['cpu_stats']['cpu_usage']['total_usage']
-            except KeyError as e:
-                logger.info("Got a KeyError trying to fetch the cpu object: {}; "
-                            "(worker {};{})".format(e, worker_id, execution_id))
-            try:
-                result['io'] += stats['networks']['eth0']['rx_bytes']
-            except KeyError as e:
-                logger.info("Got KeyError exception trying to grab the io object. "
-                            "running: {}; Exception: {}; (worker {};{})".format(running, e, worker_id, execution_id))
-
-        # grab the logs every 5th iteration --
-        if loop_idx % 5 == 0:
-            logs = cli.logs(container.get('Id'))
-            Execution.set_logs(execution_id, logs, actor_id, tenant, worker_id, log_ex)
-            logs = None
+    # the container is supervised without polling the docker daemon: `finished` is set by the worker's subscription
+    # to the docker events of its containers (see ContainerEvents) or by a wait() on the container, whichever sees
+    # the container exit first. stats and results are collected by their own readers.
+    waiter = threading.Thread(target=wait_container, args=(container.get('Id'), finished, worker_id, execution_id),
+                              daemon=True)
+    waiter.start()
+    stats_reader = threading.Thread(target=read_stats, args=(container.get('Id'), result, worker_id, execution_id),
+                                    daemon=True)
+    stats_reader.start()
+    results_reader = threading.Thread(target=read_results, args=(server, results_ch, finished, worker_id, execution_id),
+                                      daemon=True)
+    results_reader.start()
+
+    # the logs are followed as the container writes them and appended to the execution's logs every LOGS_INTERVAL
+    # seconds; see LogCapture.
+    if log_ex is None:
+        log_ex = Actor.get_actor_log_ttl(actor_id)
+    log_capture = LogCapture(container.get('Id'), actor_id, execution_id, tenant, worker_id, log_ex)
+    log_capture.start()
+    last_logs_time = timeit.default_timer()
+    while running:
+        if finished.wait(timeout=SUPERVISION_INTERVAL):
+            logger.debug("container finished: {}; (worker {};{})".format(timeit.default_timer(),
+                                                                         worker_id, execution_id))
+            running = False
+            continue
 
-        # checking the container status to see if it is still running ----
-        if running:
-            logger.debug("about to check container status: {}; (worker {};{})".format(timeit.default_timer(),
-                                                                                      worker_id, execution_id))
-            # we need to wait for the container id to be available
-            i = 0
-            c = None
-            while i < 10:
-                try:
-                    c = cli.containers(all=True, filters={'id': container.get('Id')})[0]
-                    break
-                except IndexError:
-                    logger.error("Got an IndexError trying to get the container object. "
-                                 "(worker {};{})".format(worker_id, execution_id))
-                    time.sleep(0.1)
-                    i += 1
-            logger.debug("done checking status: {}; i: {}; (worker {};{})".format(timeit.default_timer(), i,
-                                                                                  worker_id, execution_id))
-            # if we were never able to get the container object, we need to stop processing and kill this
-            # worker; the docker daemon could be under heavy load, but we need to not launch another
-            # actor container with this worker, because the existing container may still be running,
-            if i == 10 or not c:
-                # we'll try to stop the container
-                logger.error("Never could retrieve the container object! Attempting to stop container; "
-                             "container id: {}; (worker {};{})".format(container.get('Id'), worker_id, execution_id))
-                # stop_container could raise an exception - if so, we let it pass up and have the worker
-                # shut itself down.
-                stop_container(cli, container.get('Id'))
-                logger.info("container {} stopped. (worker {};{})".format(container.get('Id'), worker_id, execution_id))
-
-                # if we were able to stop the container, we can set running to False and keep the
-                # worker running
-                running = False
-                continue
-            state = c.get('State')
-            if not state == 'running':
-                logger.debug("container finished, final state: {}; (worker {};{})".format(state,
-                                                                                          worker_id, execution_id))
-                running = False
-                continue
+        # save the new logs every LOGS_INTERVAL seconds --
+        if timeit.default_timer() - last_logs_time > LOGS_INTERVAL:
+            log_capture.flush()
+            last_logs_time = timeit.default_timer()
+
+        # container still running; check if a force_quit has been sent OR we are beyond the max_run_time
+        runtime = timeit.default_timer() - start
+        force_quit = globals.force_quit or execution_id in globals.force_quit_executions
+        if force_quit or (max_run_time > 0 and max_run_time < runtime):
+            if force_quit:
+                logger.info("issuing force quit: {}; (worker {};{})".format(timeit.default_timer(),
+                                                                       worker_id, execution_id))
             else:
-                # container still running; check if a force_quit has been sent OR
-                # we are beyond the max_run_time
-                runtime = timeit.default_timer() - start
-                if globals.force_quit or (max_run_time > 0 and max_run_time < runtime):
-                    logs = cli.logs(container.get('Id'))
-                    if globals.force_quit:
-                        logger.info("issuing force quit: {}; (worker {};{})".format(timeit.default_timer(),
-                                                                               worker_id, execution_id))
-                    else:
-                        logger.info("hit runtime limit: {}; (worker {};{})".format(timeit.default_timer(),
-                                                                               worker_id, execution_id))
-                    cli.stop(container.get('Id'))
-                    running = False
-            logger.debug("right after checking container state: {}; (worker {};{})".format(timeit.default_timer(),
-                                                                                           worker_id, execution_id))
+                logger.info("hit runtime limit: {}; (worker {};{})".format(timeit.default_timer(),
+                                                                       worker_id, execution_id))
+            cli.stop(container.get('Id'))
+            running = False
+
     logger.info("container stopped:{}; (worker {};{})".format(timeit.default_timer(), worker_id, execution_id))
+    globals.force_quit_executions.discard(execution_id)
     stop = timeit.default_timer()
-    globals.force_quit = False
 
     # get info from container execution, including exit code; Exceptions from any of these commands
     # should not cause the worker to shutdown or prevent starting subsequent actor containers.
@@ -871,31 +1262,24 @@ def execute_actor(actor_id,
                      f"Exception: {e}; (worker {worker_id};{execution_id})")
     logger.debug("right after getting container_info: {}; (worker {};{})".format(timeit.default_timer(),
                                                                                  worker_id, execution_id))
-    # get logs from container
-    if not logs:
-        logs = cli.logs(container.get('Id'))
-    if not logs:
+    # save the rest of the logs; only the output not saved yet is written.
+    try:
+        log_capture.close(timeout=STATS_TIMEOUT)
+    except Exception as e:
+        logger.error("Got exception trying to set logs for execution {}; "
+                     "Exception: {}; (worker {};{})".format(execution_id, e, worker_id, execution_id))
+    if not log_capture.length:
         # there are issues where container do not have logs associated with them when they should.
         logger.info("Container id {} had NO logs associated with it. "
                     "(worker {};{})".format(container.get('Id'), worker_id, execution_id))
     logger.debug("right after getting container logs: {}; (worker {};{})".format(timeit.default_timer(),
                                                                                  worker_id, execution_id))
 
-    # get any additional results from the execution:
-    while True:
-        datagram = None
-        try:
-            datagram = server.recv(MAX_RESULT_FRAME_SIZE)
-        except socket.timeout:
-            break
-        except Exception as e:
-            logger.error("Got exception from server.recv: {}; (worker {};{})".format(e, worker_id, execution_id))
-        if datagram:
-            try:
-                results_ch.put(datagram)
-            except Exception as e:
-                logger.error("Error trying to put datagram on results channel. "
-                             "Exception: {}; (worker {};{})".format(e, worker_id, execution_id))
+    # wait for the readers to collect the last results and stats of the execution:
+    finished.set()
+    container_events.unwatch(container.get('Id'))
+    results_reader.join()
+    stats_reader.join(timeout=STATS_TIMEOUT)
     logger.debug("right after getting last execution results from datagram socket: {}; "
                  "(worker {};{})".format(timeit.default_timer(), worker_id, execution_id))
     if socket_host_path:
@@ -958,4 +1342,4 @@ def execute_actor(actor_id,
     result['runtime'] = int(stop - start)
     logger.debug("right after removing fifo; about to return: {}; (worker {};{})".format(timeit.default_timer(),
                                                                                          worker_id, execution_id))
-    return result, logs, container_state, exit_code, start_time
+    return result, container_state, exit_code, start_time
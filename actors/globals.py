@@ -13,3 +13,8 @@ keep_running = True
 global force_quit
 force_quit = False
 
+
+# ids of the executions the worker has been asked to force quit; unlike force_quit, only these executions are halted
+# and the worker keeps running. The execution monitoring thread removes the id once the execution has stopped.
+global force_quit_executions
+force_quit_executions = set()
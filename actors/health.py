@@ -52,10 +52,10 @@ def check_workers_store(ttl):
 
 def get_worker(wid):
     """
-    Check to see if a string `wid` is the id of a worker in the worker store.
-    If so, return it; if not, return None.
+    Check to see if a string `wid` is the id of a worker in the worker store, or the id of the warm worker it was
+    bound from (the name of its fifo and socket directories). If so, return it; if not, return None.
     """
-    worker = workers_store.items({'id': wid})
+    worker = workers_store.items({'$or': [{'id': wid}, {'ipc_id': wid}]})
     if worker:
         return worker
     return None
@@ -67,7 +67,8 @@ def clean_up_socket_dirs():
     for p in os.listdir(socket_dir):
         # check to see if p is a worker
         worker = get_worker(p)
-        if not worker:
+        # the directories of warm workers not bound yet are named after the warm worker's container.
+        if not worker and not container_running(name=p):
             path = os.path.join(socket_dir, p)
             logger.debug("Determined that {} was not a worker; deleting directory: {}.".format(p, path))
             shutil.rmtree(path)
@@ -79,7 +80,8 @@ def clean_up_fifo_dirs():
     for p in os.listdir(fifo_dir):
         # check to see if p is a worker
         worker = get_worker(p)
-        if not worker:
+        # the directories of warm workers not bound yet are named after the warm worker's container.
+        if not worker and not container_running(name=p):
             path = os.path.join(fifo_dir, p)
             logger.debug("Determined that {} was not a worker; deleting directory: {}.".format(p, path))
             shutil.rmtree(path)
@@ -283,8 +285,11 @@ def hard_delete_worker(actor_id, worker_id, worker_container_id=None, reason_str
                          f"container: {worker_container_id}; exception: {e}")
 
 
-def check_workers(actor_id, ttl):
-    """Check health of all workers for an actor."""
+def check_workers(actor_id, ttl, keep_idle=True):
+    """
+    Check health of all workers for an actor. Unless `keep_idle` is False, the actor's min_idle_workers idle workers
+    are not shut down when beyond the ttl.
+    """
     logger.info("Checking health for actor: {}".format(actor_id))
     try:
         workers = Worker.get_workers(actor_id)
@@ -292,6 +297,13 @@ def check_workers(actor_id, ttl):
         logger.error("Got exception trying to retrieve workers: {}".format(e))
         return None
     logger.debug("workers: {}".format(workers))
+    min_idle = 0
+    if keep_idle:
+        try:
+            min_idle = int(actors_store.get_fields(actor_id, ['min_idle_workers']).get('min_idle_workers') or 0)
+        except Exception as e:
+            logger.debug("Could not get min_idle_workers for actor {}; e: {}".format(actor_id, e))
+    idle = len([worker for worker in workers if worker.get('status') == codes.READY])
     host_id = os.environ.get('SPAWNER_HOST_ID', Config.get('spawner', 'host_id'))
     logger.debug("host_id: {}".format(host_id))
     for worker in workers:
@@ -367,9 +379,14 @@ def check_workers(actor_id, ttl):
                 logger.error("Time received for TTL measurements is not of type datetime.")
                 last_execution = datetime.datetime.min
             if last_execution + datetime.timedelta(seconds=ttl) < datetime.datetime.utcnow():
-                # shutdown worker
-                logger.info("Shutting down worker beyond ttl.")
-                shutdown_worker(actor_id, worker['id'])
+                if worker['status'] == codes.READY and idle <= min_idle:
+                    logger.info("Worker beyond ttl but actor keeps {} idle worker(s); leaving worker.".format(min_idle))
+                else:
+                    # shutdown worker
+                    logger.info("Shutting down worker beyond ttl.")
+                    shutdown_worker(actor_id, worker['id'])
+                    if worker['status'] == codes.READY:
+                        idle -= 1
             else:
                 logger.info("Still time left for this worker.")
 
@@ -485,7 +502,7 @@ def shutdown_all_workers():
         actors_with_workers.add(worker['actor_id'])
 
     for actor_id in actors_with_workers:
-        check_workers(actor_id, 0)
+        check_workers(actor_id, 0, keep_idle=False)
 
 def main():
     logger.info("Running abaco health checks. Now: {}".format(time.time()))
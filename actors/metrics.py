@@ -15,7 +15,7 @@ def main():
     for actor_id in actor_ids:
         logger.debug("TOP OF CHECK METRICS")
         query = {
-            'query': 'message_count_for_actor_{}'.format(actor_id.decode("utf-8").replace('-', '_')),
+            'query': 'message_count_for_actor{{actor_id="{}"}}'.format(actor_id),
             'time': datetime.datetime.utcnow().isoformat() + "Z"
         }
         r = requests.get(PROMETHEUS_URL + '/api/v1/query', params=query)
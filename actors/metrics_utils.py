@@ -4,18 +4,16 @@ import datetime
 import time
 
 from config import Config
-from models import dict_to_camel, Actor, Execution, ExecutionsSummary, Nonce, Worker, get_permissions, \
-    set_permission
+from models import dict_to_camel, Actor, Execution, ExecutionsSummary, HostCapacity, Nonce, Worker, \
+    get_permissions, set_permission
 from worker import shutdown_workers, shutdown_worker
 from stores import actors_store, executions_store, logs_store, nonce_store, permissions_store
 from prometheus_client import start_http_server, Summary, MetricsHandler, Counter, Gauge, generate_latest
-from channels import ActorMsgChannel, CommandChannel, ExecutionResultsChannel
+from channels import ExecutionResultsChannel
+from queues import get_queue_depths
 from agaveflask.logs import get_logger
 logger = get_logger(__name__)
 
-message_gauges = {}
-worker_gaueges = {}
-cmd_channel_gauges = {}
 PROMETHEUS_URL = 'http://172.17.0.1:9090'
 DEFAULT_SYNC_MAX_IDLE_TIME = 600 # defaults to 10*60 = 600 s = 10 min
 
@@ -26,128 +24,122 @@ command_gauge = Gauge(
     'Number of messages currently in this command channel',
     ['name'])
 
-def create_gauges(actor_ids):
+message_gauge = Gauge(
+    'message_count_for_actor',
+    'Number of messages currently in the actor\'s queue',
+    ['actor_id', 'tenant', 'queue'])
+
+worker_gauge = Gauge(
+    'worker_count_for_actor',
+    'Number of workers for the actor',
+    ['actor_id', 'tenant', 'queue'])
+
+COLLECTION_TIME = Summary(
+    'abaco_metrics_collection_seconds',
+    'Time spent collecting the actor queue lengths and worker counts.')
+
+# label values (actor_id, tenant, queue) currently exported for each actor, keyed by actor db_id; used to remove
+# the series of actors that are deleted or are no longer tracked.
+actor_labels = {}
+
+
+def get_host_queues():
+    """Returns the list of command channel names configured in the host_queues setting."""
+    return Config.get('spawner', 'host_queues').replace(' ', '').split(',')
+
+
+def get_actor_queue(actor, host_queues):
+    """Returns the name of the command channel used by `actor`."""
+    queue = actor.get('queue')
+    if not queue or queue not in host_queues:
+        return 'default'
+    return queue
+
+
+def remove_actor_labels(actor_id):
+    """Stop exporting the message and worker series of the actor `actor_id`."""
+    labels = actor_labels.pop(actor_id, None)
+    if labels is None:
+        return
+    for g in (message_gauge, worker_gauge):
+        try:
+            g.remove(*labels)
+        except KeyError:
+            pass
+
+
+def get_actor_metrics(actors, host_queues):
     """
-    Creates a Prometheus gauge for each actor id. The gauge is used to track the number of
-    pending messages in the actor's queue.
-    :param actor_ids: list of actors that should be processed. Does not include stateful actors or
-    actors in a shutting down state.
-    :return:
+    Retrieves the number of messages queued for, and the number of workers of, each actor in `actors`, as well as
+    the number of messages in each command channel in `host_queues`. The queue lengths and worker counts of all
+    actors are each retrieved at once.
+    :return: inbox_lengths (actor_id -> number of messages), cmd_lengths (command channel name -> number
+    of messages) and worker_counts (actor_id -> number of workers).
     """
+    actor_ids = [actor['db_id'] for actor in actors]
+    with COLLECTION_TIME.time():
+        queue_depths = get_queue_depths(['actor_msg_{}'.format(actor_id) for actor_id in actor_ids] +
+                                        ['command_channel_{}'.format(name) for name in host_queues])
+        worker_counts = Worker.get_worker_counts(actor_ids)
+    # the actor's queue is only created once a message is sent or a worker subscribes.
+    inbox_lengths = {actor_id: queue_depths.get('actor_msg_{}'.format(actor_id), 0) for actor_id in actor_ids}
+    cmd_lengths = {name: queue_depths.get('command_channel_{}'.format(name), 0) for name in host_queues}
+    return inbox_lengths, cmd_lengths, worker_counts
+
+
+def create_gauges(actors):
+    """
+    Sets the Prometheus gauges tracking the number of pending messages in each actor's queue and the number of
+    workers of each actor, as well as the number of messages in each command channel.
+    :param actors: list of actor documents that should be processed. Does not include stateful actors or
+    actors in a shutting down state. The series of actors not in this list are removed.
+    :return: actor_ids, inbox_lengths (actor_id -> number of messages), cmd_lengths (command channel name -> number
+    of messages) and worker_counts (actor_id -> number of workers).
+    """
+    actor_ids = [actor['db_id'] for actor in actors]
     logger.debug("top of create_gauges; actor_ids: {}".format(actor_ids))
-    # dictionary mapping actor_ids to their message queue lengths
-    inbox_lengths = {}
-    for actor_id in actor_ids:
-        logger.debug("top of for loop for actor_id: {}".format(actor_id))
-        # first, make sure the actor still exists in the actor store
-        try:
-            actor = actors_store[actor_id]
-        except KeyError:
-            logger.info(f"actor {actor_id} does not exist in store; continuing to next actor.")
-            continue
-        # If the actor doesn't have a gauge, add one
-        if actor_id not in message_gauges.keys():
-            try:
-                g = Gauge(
-                    'message_count_for_actor_{}'.format(actor_id.replace('-', '_')),
-                    'Number of messages for actor {}'.format(actor_id.replace('-', '_'))
-                )
-                message_gauges.update({actor_id: g})
-                logger.debug('Created gauge {}'.format(g))
-            except Exception as e:
-                logger.error("got exception trying to create/instantiate the gauge; "
-                             "actor {}; exception: {}".format(actor_id, e))
-                g = None
-        else:
-            # Otherwise, get this actor's existing gauge
-            try:
-                g = message_gauges[actor_id]
-            except Exception as e:
-                logger.info("got exception trying to instantiate an existing gauge; "
-                            "actor: {}: exception:{}".format(actor_id, e))
-                g = None
-        # Update this actor's gauge to its current # of messages
-        try:
-            ch = ActorMsgChannel(actor_id=actor_id)
-            msg_length = len(ch._queue._queue)
-        except Exception as e:
-            logger.error("Exception connecting to ActorMsgChannel: {}".format(e))
-            raise e
-        ch.close()
-        result = {'messages': msg_length}
-        # add the actor's current message queue length to the inbox_lengths in-memory variable
-        inbox_lengths[actor_id] = msg_length
-        # if we were able to create the gauge, set it to the current message:
-        if g:
-            try:
-                g.set(result['messages'])
-            except Exception as e:
-                logger.error(f"Got exception trying to set the messages on the gauge for actor: {actor_id}; "
-                             f"exception: {e}")
-        logger.debug("METRICS: {} messages found for actor: {}.".format(result['messages'], actor_id))
-
-        # add a worker gauge for this actor if one does not exist
-        if actor_id not in worker_gaueges.keys():
-            try:
-                g = Gauge(
-                    'worker_count_for_actor_{}'.format(actor_id.replace('-', '_')),
-                    'Number of workers for actor {}'.format(actor_id.replace('-', '_'))
-                )
-                worker_gaueges.update({actor_id: g})
-                logger.debug('Created worker gauge {}'.format(g))
-            except Exception as e:
-                logger.info("got exception trying to instantiate the Worker Gauge: {}".format(e))
-        else:
-            # Otherwise, get the worker gauge that already exists
-            g = worker_gaueges[actor_id]
+    start_timer = time.time()
+    host_queues = get_host_queues()
+    inbox_lengths, cmd_lengths, worker_counts = get_actor_metrics(actors, host_queues)
+    for actor in actors:
+        actor_id = actor['db_id']
+        labels = (actor_id, actor.get('tenant'), get_actor_queue(actor, host_queues))
+        # the actor's queue or tenant could have changed since the last collection
+        if actor_labels.get(actor_id, labels) != labels:
+            remove_actor_labels(actor_id)
+        actor_labels[actor_id] = labels
+        message_gauge.labels(*labels).set(inbox_lengths[actor_id])
+        worker_gauge.labels(*labels).set(worker_counts[actor_id])
+        logger.debug(f"METRICS: {inbox_lengths[actor_id]} messages and {worker_counts[actor_id]} workers found for "
+                     f"actor: {actor_id}.")
 
-        # Update this actor's worker IDs
-        workers = Worker.get_workers(actor_id)
-        result = {'workers': len(workers)}
-        try:
-            g.set(result['workers'])
-        except Exception as e:
-            logger.error(f"got exception trying to set the worker gauge for actor {actor_id}; exception: {e}")
-        logger.debug(f"METRICS: {result['workers']} workers found for actor: {actor_id}.")
-
-        # Update this actor's command channel metric
-        # channel_name = actor.get("queue")
-        #
-        # queues_list = Config.get('spawner', 'host_queues').replace(' ', '')
-        # valid_queues = queues_list.split(',')
-        #
-        # if not channel_name or channel_name not in valid_queues:
-        #     channel_name = 'default'
-        #
-        # if not channel_name:
-        #     # TODO -- this must be changed. there is no way returning no arguments will result in
-        #     # anythng but an exception. The calling function is expecting 3 arguments...
-        #     # if we really want to blow up right here we should just raise an appropriate exception.
-        #     return
-
-    # TODO -- this code needs to be fixed. What follows is only a partial fix; what I think we want to do
-    # is set the length of all of the different command channels once at the end of this loop. What was
-    # happening instead was that it was only setting one of the command channel's lengths -- whatever command
-    # channel happened to belong to the last actor in the loop.
-    channel_name = 'default'
-    ch = CommandChannel(name=channel_name)
-    cmd_length = len(ch._queue._queue)
-    command_gauge.labels(channel_name).set(cmd_length)
-    logger.debug(f"METRICS COMMAND CHANNEL {channel_name} size: {command_gauge}")
-    ch.close()
+    # remove the series of actors that were deleted or are no longer tracked
+    for actor_id in set(actor_labels.keys()) - set(actor_ids):
+        logger.debug(f"METRICS: removing series for actor: {actor_id}.")
+        remove_actor_labels(actor_id)
+
+    for name, cmd_length in cmd_lengths.items():
+        command_gauge.labels(name).set(cmd_length)
+        logger.debug(f"METRICS COMMAND CHANNEL {name} size: {cmd_length}")
+    logger.info(f"METRICS collected for {len(actor_ids)} actors in {time.time() - start_timer:.3f}s")
 
     # Return actor_ids so we don't have to query for them again later
-    return actor_ids, inbox_lengths, cmd_length
+    return actor_ids, inbox_lengths, cmd_lengths, worker_counts
 
 
 def calc_change_rate(data, last_metric, actor_id):
+    """
+    Returns the change in the number of messages queued for an actor since the previous measurement.
+    :param data: the current number of messages queued for the actor.
+    :param last_metric: dictionary mapping actor ids to their previous number of queued messages.
+    :param actor_id: the actor's id.
+    :return: the change in the number of messages; 0 if there is no previous measurement.
+    """
     change_rate = 0
     try:
-        previous_data = last_metric[actor_id]
-        previous_message_count = int(previous_data[0]['value'][1])
+        previous_message_count = int(last_metric[actor_id])
         try:
-            # what is data?
-            current_message_count = int(data[0]['value'][1])
+            current_message_count = int(data)
             change_rate = current_message_count - previous_message_count
         except:
             logger.debug("Could not calculate change rate.")
@@ -156,6 +148,72 @@ def calc_change_rate(data, last_metric, actor_id):
     return change_rate
 
 
+def get_max_workers(actor):
+    """Returns the maximum number of workers for an actor: the actor's max_workers if set, otherwise the default."""
+    actor_id = actor.get('db_id')
+    max_workers = None
+    if actor.get('max_workers'):
+        try:
+            max_workers = int(actor['max_workers'])
+        except Exception as e:
+            logger.error("max_workers defined for actor_id {} but could not cast to int. "
+                         "Exception: {}".format(actor_id, e))
+    if not max_workers:
+        conf = None
+        try:
+            conf = Config.get('spawner', 'max_workers_per_actor')
+            max_workers = int(conf)
+        except Exception as e:
+            logger.error("Unable to get/cast max_workers_per_actor config ({}) to int. "
+                         "Exception: {}".format(conf, e))
+            max_workers = 1
+    return max_workers
+
+
+def get_min_idle_workers(actor):
+    """Returns the number of idle workers to keep for an actor: the actor's min_idle_workers if set, otherwise 0."""
+    try:
+        return max(int(actor.get('min_idle_workers') or 0), 0)
+    except Exception as e:
+        logger.error("min_idle_workers defined for actor_id {} but could not cast to int. "
+                     "Exception: {}".format(actor.get('db_id'), e))
+        return 0
+
+
+def is_sync_actor(actor):
+    """Returns whether the actor has the SYNC hint."""
+    try:
+        hints = list(actor.get("hints"))
+    except:
+        hints = []
+    return Actor.SYNC_HINT in hints
+
+
+def get_max_cmd_length():
+    """Returns the maximum number of commands allowed on a command channel before autoscaling stops."""
+    try:
+        return int(Config.get('spawner', 'max_cmd_length'))
+    except Exception as e:
+        logger.info(f"Autoscaler got exception trying to compute the max_cmd_lenght; using 10. E"
+                    f"xception: {e}")
+        return 10
+
+
+def get_host_capacity():
+    """
+    Returns the number of workers that can still be started across the worker hosts: the max workers of each host
+    whose spawner published its capacity recently (see HostCapacity), including idle hosts, and max_workers_per_host
+    for any other host running workers, less the workers already running or requested.
+    """
+    counts = Worker.get_host_worker_counts()
+    max_workers = {host['host_id']: host['max_workers'] for host in HostCapacity.get_hosts()}
+    hosts = set(max_workers.keys()) | set(host_id for host_id in counts.keys() if host_id is not None)
+    if not hosts:
+        # no host is known yet; assume a single host.
+        return int(MAX_WORKERS_PER_HOST) - sum(counts.values())
+    return sum(max_workers.get(host_id, int(MAX_WORKERS_PER_HOST)) for host_id in hosts) - sum(counts.values())
+
+
 def allow_autoscaling(max_workers, num_workers, cmd_length):
     """
     This function returns True if the conditions for a specific actor indicate it could be scaled up.
@@ -169,13 +227,7 @@ def allow_autoscaling(max_workers, num_workers, cmd_length):
     logger.debug(f"top of allow_autoscaling; max_workers: {max_workers}, num_workers: {num_workers}, "
                  f"cmd_length: {cmd_length}")
     # first check if the number of messages on the command channel exceeds the limit:
-    try:
-        max_cmd_length = int(Config.get('spawner', 'max_cmd_length'))
-    except Exception as e:
-        logger.info(f"Autoscaler got exception trying to compute the max_cmd_lenght; using 10. E"
-                    f"xception: {e}")
-        max_cmd_length = 10
-
+    max_cmd_length = get_max_cmd_length()
     if cmd_length > max_cmd_length:
         logger.info(f"Will NOT scale up: Current cmd_length ({cmd_length}) is greater than ({max_cmd_length}).")
         return False
@@ -186,45 +238,43 @@ def allow_autoscaling(max_workers, num_workers, cmd_length):
     logger.debug(f'Will scale up: num_workers ({num_workers}) was >= max_workers ({max_workers})')
     return True
 
-def scale_up(actor_id):
+def scale_up(actor_id, num_workers=1):
+    """
+    Requests `num_workers` new workers for an actor, putting a command for each on the actor's command channel
+    (or on the command channel of the host each worker is placed on).
+    Returns the name of the command channel, or None if the workers could not be requested.
+    """
     tenant, aid = actor_id.split('_')
-    logger.debug('METRICS Attempting to create a new worker for {}'.format(actor_id))
+    logger.debug('METRICS Attempting to create {} new worker(s) for {}'.format(num_workers, actor_id))
     try:
-        # create a worker & add to this actor
         actor = Actor.from_db(actors_store[actor_id])
-        worker_id = Worker.request_worker(tenant=tenant, actor_id=actor_id)
-        logger.info("New worker id: {}".format(worker_id))
         if actor.queue:
             channel_name = actor.queue
         else:
             channel_name = 'default'
-        ch = CommandChannel(name=channel_name)
-        ch.put_cmd(actor_id=actor.db_id,
-                   worker_id=worker_id,
-                   image=actor.image,
-                   revision=actor.revision,
-                   tenant=tenant,
-                   stop_existing=False)
-        ch.close()
-        logger.debug('METRICS Added worker successfully for {}'.format(actor_id))
+        worker_ids = actor.request_workers(tenant=tenant, num=num_workers)
+        logger.info("New worker ids: {}".format(worker_ids))
+        logger.debug('METRICS Added {} worker(s) successfully for {}'.format(num_workers, actor_id))
         return channel_name
     except Exception as e:
         logger.debug("METRICS - SOMETHING BROKE: {} - {} - {}".format(type(e), e, e.args))
         return None
 
 
-def scale_down(actor_id, is_sync_actor=False):
+def scale_down(actor_id, is_sync_actor=False, keep=0):
     """
     This function determines whether an actor's worker pool should be scaled down and if so,
     initiates the scaling down.
     :param actor_id: the actor_id
     :param is_sync_actor: whether or not the actor has the SYNC hint.
+    :param keep: the number of idle (READY) workers to leave running.
     :return:
     """
     logger.debug(f"top of scale_down for actor_id: {actor_id}")
     # we retrieve the current workers again as we will need the entire worker ojects (not just the number).
     workers = Worker.get_workers(actor_id)
     logger.debug(f'scale_down number of workers: {len(workers)}')
+    idle = len([worker for worker in workers if worker['status'] == 'READY'])
     try:
         # iterate through all the actor's workers and determine if they should be shut down.
         while len(workers) > 0:
@@ -271,10 +321,14 @@ def scale_down(actor_id, is_sync_actor=False):
             logger.debug('based on TTL, worker could be scaled down.')
             # check status of the worker is ready
             if worker['status'] == 'READY':
+                if idle <= keep:
+                    logger.debug(f'keeping worker; actor has {idle} idle worker(s) and keeps {keep}.')
+                    continue
                 # scale down
                 logger.debug('worker was in READY status; attempting shutdown.')
                 try:
                     shutdown_worker(actor_id, worker['id'], delete_actor_ch=False)
+                    idle -= 1
                     logger.debug('sent worker shutdown message.')
                     continue
                 except Exception as e:
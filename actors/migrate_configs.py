@@ -0,0 +1,28 @@
+"""
+Adds the actors_list and revision fields to the actor configs created before these fields were added. Workers find
+the configs for an actor with an indexed query on actors_list and key their caches of config values by revision, so
+configs without these fields are not applied to any actor until migrated. Configs created or updated since are
+stored with both fields; this only needs to be run once, after upgrading.
+
+Run from within the abaco/core image with:
+    python3 migrate_configs.py
+"""
+from agaveflask.logs import get_logger
+from models import ActorConfig
+from stores import configs_store
+
+logger = get_logger(__name__)
+
+
+def main():
+    configs = configs_store.items({'$or': [{'actors_list': {'$exists': False}}, {'revision': {'$exists': False}}]},
+                                  proj_inp={'actors': True})
+    for config in configs:
+        actors_list = [a.strip() for a in config.get('actors', '').split(',') if a.strip()]
+        ActorConfig.set_lookup_fields(config['_id'], actors_list)
+    print(f"Migrated {len(configs)} configs.")
+    logger.info(f"Configs migrated: {len(configs)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import base64
 from copy import deepcopy
 import datetime
 import json
@@ -17,7 +18,7 @@ from agaveflask.utils import RequestParser
 
 from channels import CommandChannel, EventsChannel
 from codes import REQUESTED, READY, ERROR, SHUTDOWN_REQUESTED, SHUTTING_DOWN, SUBMITTED, EXECUTE, PermissionLevel, \
-    SPAWNER_SETUP, PULLING_IMAGE, CREATING_CONTAINER, UPDATING_STORE, BUSY
+    SPAWNER_SETUP, PULLING_IMAGE, CREATING_CONTAINER, UPDATING_STORE, BUSY, RUNNING
 from config import Config
 import errors
 import codes
@@ -33,6 +34,9 @@ HASH_SALT = 'eJa5wZlEX4eWU'
 
 # default max length for an actor execution log - 1MB
 DEFAULT_MAX_LOG_LENGTH = 1000000
+LOG_TRUNCATED_MESSAGE = " LOG LIMIT EXCEEDED; this execution log was TRUNCATED!"
+# max length of a single chunk of an execution log; see Execution.append_logs
+LOG_CHUNK_SIZE = 65536
 
 def is_hashid(identifier):
     """ 
@@ -119,18 +123,67 @@ class Search():
         logger.info(f'Received a request to search. Search type: {self.search_type}')
 
         queried_store, security = self.get_db_specific_sections()
-        search, query, skip, limit = self.arg_parser()
+        search, query, skip, limit, cursor, exact_total = self.arg_parser()
 
-        # Pipeline initially made use of 'project', I've opted to instead
-        # do all post processing in 'post_processing()' for simplicity.
+        # Paging and projection are done within the pipeline so that only the requested page of results is
+        # returned from mongo. Results are sorted by textScore and then _id so that the order is stable and can be
+        # used for keyset (cursor) paging. The sort and the cursor come before the permissions lookup, which keeps
+        # the order, so that the results before the cursor are not looked up again. One extra result is requested
+        # to know whether there is a next page.
         pipeline = search + query + security
+        paging = [{'$sort': {'_score': -1, '_id': 1}}]
+        if cursor:
+            paging += [{'$match': {'$or': [{'_score': {'$lt': cursor['score']}},
+                                           {'_score': cursor['score'], '_id': {'$gt': cursor['id']}}]}}]
+        page = search + query + paging + security + [{'$skip': skip},
+                                                     {'$limit': limit + 1},
+                                                     {'$project': self.get_projection()}]
         start = time.time()
-        full_search_res = list(queried_store.aggregate(pipeline))
+        full_search_res = list(queried_store.aggregate(page))
         logger.info(f'Got search response in {time.time() - start} seconds.'\
-                    f'Pipeline: {pipeline} First two results: {full_search_res[0:1]}')
-        final_result = self.post_processing(full_search_res, skip, limit)
+                    f'Pipeline: {page} First two results: {full_search_res[0:1]}')
+        next_cursor = None
+        if len(full_search_res) > limit:
+            full_search_res = full_search_res[:limit]
+            last = full_search_res[-1]
+            next_cursor = self.encode_cursor(last['_score'], last['_id'])
+        # The exact total requires a second pass over all matching documents, so it can be turned off with
+        # total_count=false; in that case the total is not returned.
+        total_count = None
+        if exact_total:
+            start = time.time()
+            count_res = list(queried_store.aggregate(pipeline + [{'$count': 'total_count'}]))
+            total_count = count_res[0]['total_count'] if count_res else 0
+            logger.info(f'Got search total count in {time.time() - start} seconds.')
+        final_result = self.post_processing(full_search_res, skip, limit, total_count, next_cursor)
         return final_result
 
+    def get_projection(self):
+        """
+        Fields that are never returned in a search result for the search_type, removed within the pipeline.
+        """
+        projection = {'permissions': False}
+        if self.search_type == 'actors':
+            projection['executions'] = False
+        elif self.search_type == 'logs':
+            projection['exp'] = False
+        return projection
+
+    @staticmethod
+    def encode_cursor(score, _id):
+        """Returns an opaque cursor token pointing just after the result with textScore `score` and id `_id`."""
+        token = json.dumps({'score': score, 'id': _id})
+        return base64.urlsafe_b64encode(token.encode('utf-8')).decode('utf-8')
+
+    @staticmethod
+    def decode_cursor(token):
+        """Returns the textScore and id encoded in a cursor token."""
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode('utf-8')).decode('utf-8'))
+            return {'score': float(cursor['score']), 'id': str(cursor['id'])}
+        except Exception:
+            raise ValueError(f'Inputted "cursor" parameter is invalid. Received: {token}')
+
     def get_db_specific_sections(self):
         """
         Takes in the search_type and gives the correct store to query.
@@ -161,6 +214,9 @@ class Search():
                         'as' : 'permissions'}},
                     {'$unwind': '$permissions'},
                     {'$match': {'permissions.' + self.user: {'$exists': True}}}]
+        if self.search_type == 'logs':
+            # only the chunks of the logs (and logs stored before chunking) hold log text; see Execution.append_logs
+            security = [{'$match': {'logs': {'$exists': True}}}] + security
 
         return queried_store, security
 
@@ -179,6 +235,8 @@ class Search():
         # Initial paging settings
         skip_amo = 0
         limit_amo = 100
+        cursor = None
+        exact_total = True
 
         # Converts everything to snake case as that's what Mongo holds.
         # This means that snake case input will always work, but not camel case.
@@ -220,6 +278,16 @@ class Search():
                     skip_amo = val
                 if key == "limit":
                     limit_amo = val
+            # Logs stored before chunking are a single document whose _id is the execution id; chunks have an
+            # execution_id field.
+            elif key == "execution_id" and self.search_type == 'logs':
+                query += [{'$match': {'$or': [{'execution_id': val}, {'_id': val}]}}]
+            # Cursor returned as "next_cursor" in the metadata of a previous search
+            elif key == "cursor":
+                cursor = self.decode_cursor(val)
+            # Whether to compute the exact total count of results
+            elif key == "total_count":
+                exact_total = not str(val).lower() == 'false'
             else:
                 # Keys in the mongo db that should neccessitate datetime objects.
                 time_keys = ['start_time', 'message_received_time', 'last_execution_time',
@@ -310,20 +378,21 @@ class Search():
         # As mentioned, search gets added to the stanza and sort is done by
         # textScore. Always is done as search always include tenant for speed.
         search = [{'$match': {'$text': {'$search': search}}},
-                  {'$sort': {'score': {'$meta': 'textScore'}}}]
-        return search, query, skip_amo, limit_amo
+                  {'$addFields': {'_score': {'$meta': 'textScore'}}}]
+        return search, query, skip_amo, limit_amo, cursor, exact_total
 
-    def post_processing(self, search_list, skip, limit):
+    def post_processing(self, search_list, skip, limit, total_count=None, next_cursor=None):
         """
         This function performs post processing on the results. Post processing
         entails fixing times to display_times, changing case, eliminated
         variables, adding '_links', and fixing specific fields. Processing type
-        is dependent on the search_type performed.
+        is dependent on the search_type performed. Skip and limit have already
+        been applied in the pipeline.
         """
         logger.info(f'Starting post_processing for search with search_type: {self.search_type}')
 
-        total_count = len(search_list)
-        search_list = search_list[skip: skip + limit]
+        for result in search_list:
+            result.pop('_score', None)
 
         # Does post processing on execution db searches.
         if self.search_type == 'executions':
@@ -400,11 +469,17 @@ class Search():
 
         # Does post processing on logs db searches.
         elif self.search_type == 'logs':
+            # get all actors for the page of results with one query
+            actor_ids = list(set([result['actor_id'] for result in search_list if result.get('actor_id')]))
+            actors = {}
+            if actor_ids:
+                for actor in actors_store.items({'_id': {'$in': actor_ids}}, proj_inp={'executions': False}):
+                    actors[actor['_id']] = Actor.from_db(actor)
             for i, result in enumerate(search_list):
                 try:
                     actor_id = result['actor_id']
-                    exec_id = result['_id']
-                    actor = Actor.from_db(actors_store[actor_id])
+                    exec_id = result.get('execution_id') or result['_id']
+                    actor = actors[actor_id]
                     search_list[i]['_links'] = {
                         'self': f'{actor.api_server}/actors/v2/{actor.id}/executions/{exec_id}/logs',
                         'owner': f'{actor.api_server}/profiles/v2/{actor.owner}',
@@ -416,6 +491,9 @@ class Search():
                 search_list[i].pop('exp', None)
                 search_list[i].pop('actor_id', None)
                 search_list[i].pop('tenant', None)
+                search_list[i].pop('execution_id', None)
+                search_list[i].pop('seq', None)
+                search_list[i].pop('end', None)
 
         # Adjusts case of the response to match expected case.
         case = Config.get('web', 'case')
@@ -432,6 +510,7 @@ class Search():
         metadata = {"total_count": total_count,
                     "records_skipped": skip,
                     "record_limit": limit,
+                    "next_cursor": next_cursor,
                     "count_returned": len(search_list)}
         if case == 'camel':
             case_corrected_metadata = dict_to_camel(metadata)
@@ -745,6 +824,8 @@ class Actor(AbacoDAO):
         ('description', 'optional', 'description', str,  'Description of this actor', ''),
         ('privileged', 'optional', 'privileged', inputs.boolean, 'Whether this actor runs in privileged mode.', False),
         ('max_workers', 'optional', 'max_workers', int, 'How many workers this actor is allowed at the same time.', None),
+        ('min_idle_workers', 'optional', 'min_idle_workers', int, 'How many idle workers the autoscaler keeps running for this actor, in addition to its busy workers.', None),
+        ('concurrency', 'optional', 'concurrency', int, 'How many messages each worker of this actor processes at the same time.', None),
         ('mem_limit', 'optional', 'mem_limit', str, 'maximum amount of memory this actor can use.', None),
         ('max_cpus', 'optional', 'max_cpus', int, 'Maximum number of CPUs (nanoCPUs) this actor will have available to it.', None),
         ('use_container_uid', 'optional', 'use_container_uid', inputs.boolean, 'Whether this actor runs as the UID set in the container image.', False),
@@ -941,31 +1022,56 @@ class Actor(AbacoDAO):
         return id, Actor.get_dbid(tenant, id)
 
     def ensure_one_worker(self):
-        """This method will check the workers store for the actor and request a new worker if none exist."""
+        """
+        This method will check the workers store for the actor and request a new worker, placed and reserved like
+        the workers from request_workers(), if none exist. Returns the id of the new worker, or None.
+        """
         logger.debug("top of Actor.ensure_one_worker().")
-        worker_id = Worker.ensure_one_worker(self.db_id, self.tenant)
-        logger.debug("Worker.ensure_one_worker returned worker_id: {}".format(worker_id))
-        if worker_id:
-            logger.info("Actor.ensure_one_worker() putting message on command "
-                        "channel for worker_id: {}".format(worker_id))
-            ch = CommandChannel(name=self.queue)
-            ch.put_cmd(actor_id=self.db_id,
-                       worker_id=worker_id,
-                       image=self.image,
-                       revision=self.revision,
-                       tenant=self.tenant,
-                       stop_existing=False)
-            ch.close()
-            return worker_id
-        else:
+        if workers_store.count({'actor_id': self.db_id}):
             logger.debug("Actor.ensure_one_worker() returning None.")
             return None
+        worker_id = self.request_workers(self.tenant)[0]
+        logger.info("Actor.ensure_one_worker() put message on command channel for worker_id: {}".format(worker_id))
+        return worker_id
+
+    def request_workers(self, tenant, num=1, stop_existing=False):
+        """
+        Request `num` new workers for this actor and put a command for each on the command channel of the host the
+        worker is placed on (see HostCapacity.place()). Returns the ids of the new workers.
+        """
+        reserved_memory, reserved_cpus = HostCapacity.get_worker_reservation(self)
+        worker_ids = []
+        channels = {}
+        try:
+            for host_id in HostCapacity.place(self, num):
+                worker_id = Worker.request_worker(tenant=tenant,
+                                                  actor_id=self.db_id,
+                                                  fields={'placement_host_id': host_id,
+                                                          'reserved_memory': reserved_memory,
+                                                          'reserved_cpus': reserved_cpus})
+                if host_id not in channels:
+                    channels[host_id] = CommandChannel(name=self.queue or 'default', host_id=host_id)
+                channels[host_id].put_cmd(actor_id=self.db_id,
+                                          worker_id=worker_id,
+                                          image=self.image,
+                                          revision=self.revision,
+                                          tenant=tenant,
+                                          stop_existing=stop_existing)
+                worker_ids.append(worker_id)
+        finally:
+            for ch in channels.values():
+                ch.close()
+        return worker_ids
 
     @classmethod
-    def get_actor_log_ttl(cls, actor_id):
-        """Returns the log time to live, looking at both the config file and logEx if passed"""
+    def get_actor_log_ttl(cls, actor_id, actor=None):
+        """
+        Returns the log time to live, looking at both the config file and logEx if passed. Callers that already hold
+        the actor can pass it to avoid reading it from the actors_store again.
+        """
         logger.debug("In get_actor_log_ttl")
-        actor = Actor.from_db(actors_store[actor_id])
+        if actor is None:
+            actor = Actor.from_db(actors_store[actor_id])
         # Find the proper log expiry time, starting with user input, then tenant-specific, then global expiry
         tenant = actor['tenant']
         if actor['log_ex'] is not None:
@@ -1401,6 +1507,7 @@ class Execution(AbacoDAO):
             {'$inc': {'executions_total': 1},
              '$addToSet': {'execution_dbids': f'{actor_id}_{execution.id}'}},
              upsert=True)
+        ExecutionsRollup.add(actor_id, 1, execution.message_received_time)
 
         stop_timer = timeit.default_timer()
         ms = (stop_timer - start_timer) * 1000
@@ -1409,6 +1516,44 @@ class Execution(AbacoDAO):
         logger.info("Execution: {} saved for actor: {}.".format(ex, actor_id))
         return execution.id
 
+    @classmethod
+    def add_executions(cls, actor_id, exs):
+        """
+        Add several executions to an actor with a single write to the executions store.
+        :param actor_id: str; the dbid of the actor
+        :param exs: list of dicts, each describing an execution.
+        :return: list of the new execution ids, in the same order as `exs`.
+        """
+        logger.debug("top of add_executions for actor: {}; number of executions: {}.".format(actor_id, len(exs)))
+        actor = Actor.from_db(actors_store[actor_id])
+        executions = {}
+        ids = []
+        for ex in exs:
+            ex.update({'actor_id': actor_id,
+                       'tenant': actor.tenant,
+                       'api_server': actor['api_server']
+                       })
+            execution = Execution(**ex)
+            executions[f'{actor_id}_{execution.id}'] = execution
+            ids.append(execution.id)
+        start_timer = timeit.default_timer()
+
+        executions_store.insert_many(executions)
+        abaco_metrics_store.full_update(
+            {'_id': 'stats'},
+            {'$inc': {'executions_total': len(ids)},
+             '$addToSet': {'execution_dbids': {'$each': list(executions.keys())}}},
+             upsert=True)
+        ExecutionsRollup.add(actor_id, len(ids), max([ex.message_received_time for ex in executions.values()]))
+
+        stop_timer = timeit.default_timer()
+        ms = (stop_timer - start_timer) * 1000
+        if ms > 2500:
+            logger.critical(f"Execution.add_executions took {ms} to run for actor {actor_id}, "
+                            f"number of executions: {len(ids)}")
+        logger.info("{} executions saved for actor: {}.".format(len(ids), actor_id))
+        return ids
+
     @classmethod
     def add_worker_id(cls, actor_id, execution_id, worker_id):
         """
@@ -1421,7 +1566,7 @@ class Execution(AbacoDAO):
             actor_id, execution_id, worker_id))
         start_timer = timeit.default_timer()
         try:
-            executions_store[f'{actor_id}_{execution_id}', 'worker_id'] = worker_id
+            executions_store.set_fields(f'{actor_id}_{execution_id}', {'worker_id': worker_id})
             logger.debug("worker added to execution: {} actor: {} worker: {}".format(
             execution_id, actor_id, worker_id))
         except KeyError as e:
@@ -1446,13 +1591,14 @@ class Execution(AbacoDAO):
             actor_id, execution_id, status))
         start_timer = timeit.default_timer()
         try:
-            executions_store[f'{actor_id}_{execution_id}', 'status'] = status
+            old_status = executions_store.getset((f'{actor_id}_{execution_id}', 'status'), status)
             logger.debug("status updated for execution: {} actor: {}. New status: {}".format(
             execution_id, actor_id, status))
         except KeyError as e:
             logger.error("Could not update status. KeyError: {}. actor: {}. ex: {}. status: {}".format(
                 e, actor_id, execution_id, status))
             raise errors.ExecutionException("Execution {} not found.".format(execution_id))
+        ExecutionsRollup.change_status(actor_id, old_status, status)
         stop_timer = timeit.default_timer()
         ms = (stop_timer - start_timer) * 1000
         if ms > 2500:
@@ -1483,33 +1629,37 @@ class Execution(AbacoDAO):
         if not 'runtime' in stats:
             logger.error("Could not finalize execution. runtime missing. Params: {}".format(params_str))
             raise errors.ExecutionException("'runtime' parameter required to finalize execution.")
-        start_timer = timeit.default_timer()
-        try:
-            executions_store[f'{actor_id}_{execution_id}', 'status'] = status
-            executions_store[f'{actor_id}_{execution_id}', 'io'] = stats['io']
-            executions_store[f'{actor_id}_{execution_id}', 'cpu'] = stats['cpu']
-            executions_store[f'{actor_id}_{execution_id}', 'runtime'] = stats['runtime']
-            executions_store[f'{actor_id}_{execution_id}', 'final_state'] = final_state
-            executions_store[f'{actor_id}_{execution_id}', 'exit_code'] = exit_code
-            executions_store[f'{actor_id}_{execution_id}', 'start_time'] = start_time
-        except KeyError:
-            logger.error("Could not finalize execution. execution not found. Params: {}".format(params_str))
-            raise errors.ExecutionException("Execution {} not found.".format(execution_id))
-
         try:
             finish_time = final_state.get('FinishedAt')
             # we rely completely on docker for the final_state object which includes the FinishedAt time stamp;
             # under heavy load, we have seen docker fail to set this time correctly and instead set it to 1/1/0001.
             # in that case, we should use the total_runtime to back into it.
             if finish_time == datetime.datetime.min:
-                derived_finish_time = start_time + datetime.timedelta(seconds=stats['runtime'])
-                executions_store[f'{actor_id}_{execution_id}', 'finish_time'] = derived_finish_time
-            else:
-                executions_store[f'{actor_id}_{execution_id}', 'finish_time'] = finish_time
+                finish_time = start_time + datetime.timedelta(seconds=stats['runtime'])
         except Exception as e:
             logger.error(f"Could not finalize execution. Error: {e}")
             raise errors.ExecutionException(f"Could not finalize execution. Error: {e}")
 
+        start_timer = timeit.default_timer()
+        try:
+            executions_store.set_fields(f'{actor_id}_{execution_id}', {'status': status,
+                                                                       'io': stats['io'],
+                                                                       'cpu': stats['cpu'],
+                                                                       'runtime': stats['runtime'],
+                                                                       'final_state': final_state,
+                                                                       'exit_code': exit_code,
+                                                                       'start_time': start_time,
+                                                                       'finish_time': finish_time})
+        except KeyError:
+            logger.error("Could not finalize execution. execution not found. Params: {}".format(params_str))
+            raise errors.ExecutionException("Execution {} not found.".format(execution_id))
+
+        try:
+            ExecutionsRollup.finalize(actor_id, status, stats)
+        except Exception as e:
+            logger.error(f"Could not update the executions rollup for actor {actor_id}; the rollup can be rebuilt with "
+                         f"rollups.py. Error: {e}")
+
         stop_timer = timeit.default_timer()
         ms = (stop_timer - start_timer) * 1000
         if ms > 2500:
@@ -1532,36 +1682,134 @@ class Execution(AbacoDAO):
 
 
     @classmethod
-    def set_logs(cls, exc_id, logs, actor_id, tenant, worker_id, log_ex):
+    def get_max_log_length(cls):
+        """Returns the maximum length of the logs stored for an execution."""
+        try:
+            return int(Config.get('web', 'max_log_length'))
+        except:
+            return DEFAULT_MAX_LOG_LENGTH
+
+    @classmethod
+    def append_logs(cls, exc_id, logs, actor_id, tenant, log_ex, reset=False):
         """
-        Set the logs for an execution.
+        Append to the logs of an execution; pass `reset` to replace any logs already stored for it (e.g., by an
+        earlier attempt of the execution) instead. The caller is responsible for the max_log_length limit.
+
+        The logs of an execution are stored as a head document (`_id` is the execution id) holding the total
+        `length` and number of `chunks`, and ordered chunk documents of at most LOG_CHUNK_SIZE characters holding
+        the `offset` and `end` of their text within the full log. Logs stored before chunking have the full log in
+        the `logs` field of the head document instead.
         :param exc_id: the id of the execution (str)
-        :param logs: dict describing the logs
-        :return:
+        :param logs: the new output of the execution (str)
         """
-        try:
-            max_log_length = int(Config.get('web', 'max_log_length'))
-        except:
-            max_log_length = DEFAULT_MAX_LOG_LENGTH
-        if len(logs) > DEFAULT_MAX_LOG_LENGTH:
-            logger.info("truncating log for execution: {}".format(exc_id))
-            # in some environments, perhaps depending on OS or docker version, the logs object is of type bytes.
-            # in that case we need to convert to be able to concatenate.
-            if type(logs) == bytes:
-                logs = logs.decode('utf-8')
-            if not type(logs) == str:
-                logger.info(f"Got unexpected type for logs object- could not convert to type str; type: {type(logs)}")
-                logs = ''
-            logs = logs[:max_log_length] + " LOG LIMIT EXCEEDED; this execution log was TRUNCATED!"
         start_timer = timeit.default_timer()
-        logger.info("Storing log with expiry of {} seconds".format(log_ex))
-        logs_store.set_with_expiry([exc_id, 'logs'], logs, log_ex)
-        logs_store[exc_id, 'actor_id'] = actor_id
-        logs_store[exc_id, 'tenant'] = tenant
+        pieces = [logs[i:i + LOG_CHUNK_SIZE] for i in range(0, len(logs), LOG_CHUNK_SIZE)]
+        if reset:
+            # the head document is rewritten with the new chunks, and any logs stored before chunking, in one write.
+            logs_store.delete_many({'execution_id': exc_id})
+            logs_store.set_fields(exc_id, {'actor_id': actor_id, 'tenant': tenant,
+                                           'length': len(logs), 'chunks': len(pieces)},
+                                  log_ex=log_ex, unset=['logs'])
+            offset = 0
+            seq = 0
+        elif pieces:
+            # reserve the offsets and sequence numbers of the new chunks on the head document.
+            head = logs_store.inc_fields(exc_id, {'length': len(logs), 'chunks': len(pieces)},
+                                         {'actor_id': actor_id, 'tenant': tenant}, log_ex=log_ex) or {}
+            offset = head.get('length', 0)
+            seq = head.get('chunks', 0)
+        if pieces:
+            chunks = {}
+            for piece in pieces:
+                chunks[f'{exc_id}_{seq}'] = {'execution_id': exc_id,
+                                             'actor_id': actor_id,
+                                             'tenant': tenant,
+                                             'seq': seq,
+                                             'offset': offset,
+                                             'end': offset + len(piece),
+                                             'logs': piece}
+                offset += len(piece)
+                seq += 1
+            logs_store.insert_many(chunks, log_ex=log_ex)
         stop_timer = timeit.default_timer()
         ms = (stop_timer - start_timer) * 1000
         if ms > 2500:
-            logger.critical(f"Execution.set_logs took {ms} to run for execution: {exc_id}.")
+            logger.critical(f"Execution.append_logs took {ms} to run for execution: {exc_id}.")
+
+    @classmethod
+    def get_logs(cls, exc_id, offset=0, limit=None, tail=None):
+        """
+        Get the logs of an execution, or the range of `limit` characters starting at `offset`; pass `tail` to get
+        the last `tail` characters instead. Only the chunks overlapping the range are read.
+        Raises KeyError if no logs were stored for the execution.
+        :return: dictionary with the `logs` in the range, the `offset` of the range and the total `length` of the log.
+        """
+        head = logs_store.get_fields(exc_id, ['logs', 'length'])
+        if 'logs' in head:
+            logs = head['logs'] or ''
+            length = len(logs)
+        else:
+            logs = None
+            length = head.get('length', 0)
+        if tail is not None:
+            offset = max(length - tail, 0)
+        offset = min(max(offset, 0), length)
+        end = length if limit is None else min(offset + max(limit, 0), length)
+        if logs is None:
+            chunks = logs_store.items({'execution_id': exc_id, 'offset': {'$lt': end}, 'end': {'$gt': offset}},
+                                      proj_inp={'_id': False, 'offset': True, 'logs': True},
+                                      sort=[('offset', 1)])
+            if chunks:
+                logs = ''.join(chunk['logs'] for chunk in chunks)
+                start = chunks[0]['offset']
+                logs = logs[offset - start:end - start]
+            else:
+                logs = ''
+        else:
+            logs = logs[offset:end]
+        return {'logs': logs, 'offset': offset, 'length': length}
+
+    @classmethod
+    def stream_logs(cls, actor_id, exc_id, offset=0, interval=1):
+        """
+        Generator of the logs of an execution, starting at `offset`, as they are stored by the worker; yields
+        (offset, logs) tuples and returns once the execution is COMPLETE or ERROR and its remaining logs were yielded.
+
+        New chunks are picked up from a change stream on the logs store, so any number of clients can follow the
+        same execution. When change streams are not available (Mongo is not a replica set), the logs are polled
+        every `interval` seconds instead. Tuples with empty logs are yielded every `interval` seconds while nothing
+        new arrives so that callers can send keep-alives.
+        :param actor_id: the dbid of the actor.
+        """
+        try:
+            stream = logs_store.watch_inserts({'execution_id': exc_id}, max_await=interval)
+        except Exception as e:
+            logger.info(f"Change stream on logs store not available; polling the logs of execution {exc_id}. e: {e}")
+            stream = None
+        try:
+            while True:
+                # read the status before the logs so that the logs flushed as the execution finished are not missed.
+                try:
+                    status = executions_store.get_fields(f'{actor_id}_{exc_id}', ['status']).get('status')
+                except KeyError:
+                    return
+                try:
+                    result = cls.get_logs(exc_id, offset=offset)
+                except KeyError:
+                    result = {'logs': '', 'offset': offset}
+                yield result['offset'], result['logs']
+                offset = result['offset'] + len(result['logs'])
+                if status in [codes.COMPLETE, codes.ERROR]:
+                    return
+                if result['logs']:
+                    continue
+                if stream is None:
+                    time.sleep(interval)
+                else:
+                    stream.try_next()
+        finally:
+            if stream is not None:
+                stream.close()
 
     def get_uuid_code(self):
         """ Return the Agave code for this object.
@@ -1595,6 +1843,163 @@ class Execution(AbacoDAO):
         return self.case()
 
 
+class ExecutionsRollup(object):
+    """
+    Per-actor rollup of execution statistics, stored in the abaco_metrics_store and maintained incrementally by
+    Execution.add_execution(s) and Execution.finalize_execution so that summaries do not need to read every execution.
+    Each rollup document holds the total number of executions, the number of executions in each status (executions
+    that have not been finalized are counted as SUBMITTED), cpu/io/runtime totals for finalized executions, the
+    min and max runtime and the time the last message was received. Rollups are only ever read here; rollups of
+    executions from before rollups existed are built once by the rollups.py migration script.
+    """
+
+    # statuses of executions that have not been finalized
+    PENDING_STATUSES = [SUBMITTED, RUNNING]
+
+    @classmethod
+    def get_rollup_id(cls, actor_id):
+        return f'actor_stats_{actor_id}'
+
+    @classmethod
+    def add(cls, actor_id, count, message_received_time):
+        """Record `count` new executions for an actor."""
+        abaco_metrics_store.full_update(
+            {'_id': cls.get_rollup_id(actor_id)},
+            {'$set': {'type': 'actor_stats', 'actor_id': actor_id},
+             '$setOnInsert': {'rebuild_time': get_current_utc_time()},
+             '$inc': {'total_executions': count, f'status_counts.{SUBMITTED}': count},
+             '$max': {'last_execution_time': message_received_time}},
+            upsert=True)
+
+    @classmethod
+    def finalize(cls, actor_id, status, stats):
+        """Record the final status and stats of an execution of an actor."""
+        runtime = int(stats['runtime'])
+        abaco_metrics_store.full_update(
+            {'_id': cls.get_rollup_id(actor_id)},
+            {'$set': {'type': 'actor_stats', 'actor_id': actor_id},
+             '$inc': {f'status_counts.{SUBMITTED}': -1,
+                      f'status_counts.{status}': 1,
+                      'total_cpu': int(stats['cpu']),
+                      'total_io': int(stats['io']),
+                      'total_runtime': runtime},
+             '$min': {'min_runtime': runtime},
+             '$max': {'max_runtime': runtime}},
+            upsert=True)
+
+    @classmethod
+    def change_status(cls, actor_id, old_status, status):
+        """
+        Record that an execution of an actor moved from `old_status` to `status` outside of finalize_execution (e.g.,
+        to ERROR when its container could not be run).
+        """
+        old_status = SUBMITTED if old_status in cls.PENDING_STATUSES else old_status
+        status = SUBMITTED if status in cls.PENDING_STATUSES else status
+        if old_status == status:
+            return
+        if old_status == SUBMITTED:
+            # the execution was never finalized, so its stats are still the zeros it was added with.
+            cls.finalize(actor_id, status, {'cpu': 0, 'io': 0, 'runtime': 0})
+            return
+        abaco_metrics_store.full_update(
+            {'_id': cls.get_rollup_id(actor_id)},
+            {'$inc': {f'status_counts.{old_status}': -1, f'status_counts.{status}': 1}},
+            upsert=True)
+
+    @classmethod
+    def get(cls, actor_id):
+        """Returns the rollup for an actor as a dictionary."""
+        try:
+            rollup = abaco_metrics_store[cls.get_rollup_id(actor_id)]
+        except KeyError:
+            rollup = None
+        return cls.format(actor_id, rollup)
+
+    @classmethod
+    def format(cls, actor_id, rollup):
+        """Fill in defaults and the derived avg_runtime for a rollup document."""
+        result = {'actor_id': actor_id,
+                  'total_executions': 0,
+                  'status_counts': {},
+                  'total_cpu': 0,
+                  'total_io': 0,
+                  'total_runtime': 0,
+                  'min_runtime': None,
+                  'max_runtime': None,
+                  'avg_runtime': None,
+                  'last_execution_time': None}
+        for k in result.keys():
+            if rollup and rollup.get(k) is not None:
+                result[k] = rollup[k]
+        finalized = result['total_executions'] - sum([result['status_counts'].get(status, 0)
+                                                      for status in cls.PENDING_STATUSES])
+        if finalized > 0:
+            result['avg_runtime'] = result['total_runtime'] / finalized
+        return result
+
+    @classmethod
+    def rebuild(cls, actor_id=None):
+        """
+        Rebuild the rollups from the executions store, for one actor or, if `actor_id` is None, for all actors.
+        Returns a dictionary mapping the actor ids to their rebuilt rollup.
+        The rollups are overwritten with the totals of the executions at the time of the aggregation, so updates to
+        the rollups made while the rebuild runs are lost; only call this from the rollups.py script, while no
+        executions are being added or finalized.
+        """
+        def as_long(field):
+            return {'$convert': {'input': field, 'to': 'long', 'onError': 0, 'onNull': 0}}
+
+        pipeline = []
+        if actor_id:
+            pipeline.append({'$match': {'actor_id': actor_id}})
+        pending = {'$in': ['$_id.status', cls.PENDING_STATUSES]}
+        pipeline += [
+            {'$group': {'_id': {'actor_id': '$actor_id', 'status': '$status'},
+                        'count': {'$sum': 1},
+                        'cpu': {'$sum': as_long('$cpu')},
+                        'io': {'$sum': as_long('$io')},
+                        'runtime': {'$sum': as_long('$runtime')},
+                        'min_runtime': {'$min': as_long('$runtime')},
+                        'max_runtime': {'$max': as_long('$runtime')},
+                        'last_execution_time': {'$max': '$message_received_time'}}},
+            {'$group': {'_id': '$_id.actor_id',
+                        'total_executions': {'$sum': '$count'},
+                        'status_counts': {'$push': {'k': {'$cond': [pending, SUBMITTED, '$_id.status']},
+                                                    'v': '$count'}},
+                        'total_cpu': {'$sum': '$cpu'},
+                        'total_io': {'$sum': '$io'},
+                        'total_runtime': {'$sum': '$runtime'},
+                        'min_runtime': {'$min': {'$cond': [pending, None, '$min_runtime']}},
+                        'max_runtime': {'$max': {'$cond': [pending, None, '$max_runtime']}},
+                        'last_execution_time': {'$max': '$last_execution_time'}}}]
+        rollups = {}
+        now = get_current_utc_time()
+        for rollup in executions_store.aggregate(pipeline):
+            aid = rollup.pop('_id')
+            # pending statuses are all counted as SUBMITTED
+            status_counts = {}
+            for count in rollup['status_counts']:
+                status = str(count['k'])
+                status_counts[status] = status_counts.get(status, 0) + count['v']
+            rollup['status_counts'] = status_counts
+            rollups[aid] = rollup
+        if actor_id and actor_id not in rollups:
+            rollups[actor_id] = {'total_executions': 0, 'status_counts': {}, 'total_cpu': 0, 'total_io': 0,
+                                 'total_runtime': 0, 'min_runtime': None, 'max_runtime': None,
+                                 'last_execution_time': None}
+        for aid, rollup in rollups.items():
+            rollup.update({'type': 'actor_stats', 'actor_id': aid, 'rebuild_time': now})
+            abaco_metrics_store.full_update({'_id': cls.get_rollup_id(aid)}, {'$set': rollup}, upsert=True)
+        return rollups
+
+    @classmethod
+    def get_all(cls):
+        """Returns the rollups for all actors with executions, including deleted actors."""
+        return [cls.format(rollup['actor_id'], rollup)
+                for rollup in abaco_metrics_store.items({'type': 'actor_stats'})
+                if rollup.get('total_executions')]
+
+
 class ExecutionsSummary(AbacoDAO):
     """ Summary information for all executions performed by an actor. """
     PARAMS = [
@@ -1609,9 +2014,17 @@ class ExecutionsSummary(AbacoDAO):
          'Block I/O usage, in number of 512-byte sectors read from and written to, by all executions.', None),
         ('total_runtime', 'derived', 'total_runtime', str, 'Runtime, in milliseconds, of all executions.', None),
         ('total_cpu', 'derived', 'total_cpu', str, 'CPU usage, in user jiffies, of all execution.', None),
+        ('status_counts', 'derived', 'status_counts', dict, 'Number of executions in each status; executions not yet complete are counted as SUBMITTED.', None),
+        ('min_runtime', 'derived', 'min_runtime', str, 'Minimum runtime, in milliseconds, of the completed executions.', None),
+        ('max_runtime', 'derived', 'max_runtime', str, 'Maximum runtime, in milliseconds, of the completed executions.', None),
+        ('avg_runtime', 'derived', 'avg_runtime', str, 'Average runtime, in milliseconds, of the completed executions.', None),
+        ('last_execution_time', 'derived', 'last_execution_time', str, 'Time (UTC) the last message was received.', None),
+        ('limit', 'optional', 'limit', int, 'Maximum number of executions to list; all are listed if not set.', None),
+        ('cursor', 'optional', 'cursor', str, 'List the executions after the execution with this id.', None),
+        ('next_cursor', 'derived', 'next_cursor', str, 'Cursor for the next page of executions, if any.', None),
         ]
 
-    def compute_summary_stats(self, dbid):
+    def compute_summary_stats(self, dbid, limit=None, cursor=None):
         try:
             actor = actors_store[dbid]
         except KeyError:
@@ -1624,18 +2037,36 @@ class ExecutionsSummary(AbacoDAO):
                'total_cpu': 0,
                'total_io': 0,
                'total_runtime': 0,
-               'executions': []}
-        executions = executions_store.items({'actor_id': dbid})
+               'executions': [],
+               'next_cursor': None}
+        # totals come from the actor's executions rollup
+        rollup = ExecutionsRollup.get(dbid)
+        for k in ('total_executions', 'total_cpu', 'total_io', 'total_runtime', 'status_counts', 'min_runtime',
+                  'max_runtime', 'avg_runtime', 'last_execution_time'):
+            tot[k] = rollup[k]
+        if tot['last_execution_time']:
+            tot['last_execution_time'] = display_time(tot['last_execution_time'])
+        if limit == 0:
+            return tot
+        # executions are listed in the order they were received (with the _id to break ties) so that the id of the
+        # last execution listed can be used as a cursor for the next page.
+        filter_inp = {'actor_id': dbid}
+        if cursor:
+            try:
+                received = executions_store[f'{dbid}_{cursor}', 'message_received_time']
+            except KeyError:
+                raise ValueError(f"Invalid cursor; execution not found: {cursor}.")
+            filter_inp['$or'] = [{'message_received_time': {'$gt': received}},
+                                 {'message_received_time': received, '_id': {'$gt': f'{dbid}_{cursor}'}}]
+        executions = executions_store.items(filter_inp,
+                                            proj_inp={'_id': False, 'id': True, 'status': True, 'start_time': True,
+                                                      'finish_time': True, 'message_received_time': True},
+                                            sort=[('message_received_time', 1), ('_id', 1)],
+                                            limit=limit + 1 if limit else 0)
+        if limit and len(executions) > limit:
+            executions = executions[:limit]
+            tot['next_cursor'] = executions[-1].get('id')
         for val in executions:
-            start_time = val.get('start_time')
-            if start_time:
-                start_time = display_time(start_time)
-            finish_time = val.get('finish_time')
-            if finish_time:
-                finish_time = display_time(finish_time)
-            message_received_time = val.get('message_received_time')
-            if message_received_time:
-                message_received_time = display_time(message_received_time)
             execution = {'id': val.get('id'),
                          'status': val.get('status'),
                          'start_time': val.get('start_time'),
@@ -1644,27 +2075,21 @@ class ExecutionsSummary(AbacoDAO):
             if Config.get('web', 'case') == 'camel':
                 execution = dict_to_camel(execution)
             tot['executions'].append(execution)
-            tot['total_executions'] += 1
-            tot['total_cpu'] += int(val['cpu'])
-            tot['total_io'] += int(val['io'])
-            tot['total_runtime'] += int(val['runtime'])
         return tot
 
     def get_derived_value(self, name, d):
         """Compute a derived value for the attribute `name` from the dictionary d of attributes provided."""
-        # first, see if the attribute is already in the object:
-        try:
-            if d[name]:
-                return d[name]
-        except KeyError:
-            pass
+        # first, see if the attribute is already in the object; the summary stats are computed once for all
+        # derived attributes, and several of them can legitimately be 0 or None:
+        if name in d:
+            return d[name]
         # if not, compute and store all values, returning the one requested:
         try:
             dbid = d['db_id']
         except KeyError:
             logger.error("db_id missing from call to get_derived_value. d: {}".format(d))
             raise errors.ExecutionException('db_id is required.')
-        tot = self.compute_summary_stats(dbid)
+        tot = self.compute_summary_stats(dbid, limit=d.get('limit'), cursor=d.get('cursor'))
         d.update(tot)
         return tot[name]
 
@@ -1676,6 +2101,10 @@ class ExecutionsSummary(AbacoDAO):
     def display(self):
         self.update(self.get_hypermedia())
         self.pop('db_id')
+        self.pop('limit', None)
+        self.pop('cursor', None)
+        if self.get('next_cursor') is None:
+            self.pop('next_cursor', None)
         return self.case()
 
 
@@ -1693,6 +2122,11 @@ class Worker(AbacoDAO):
         ('image', 'optional', 'image', list, 'The list of images associated with this worker', None),
         ('location', 'optional', 'location', str, 'The location of the docker daemon used by this worker.', None),
         ('cid', 'optional', 'cid', str, 'The container ID of this worker.', None),
+        ('image_digest', 'optional', 'image_digest', str, 'Digest of the actor image pulled for this worker.', None),
+        ('ipc_id', 'optional', 'ipc_id', str, 'Name of the fifo and socket directories of a worker bound from a warm pool.', None),
+        ('slots', 'optional', 'slots', list, 'Status of each execution slot of the worker (see the actor concurrency).', None),
+        ('reserved_memory', 'optional', 'reserved_memory', int, 'Memory, in bytes, reserved for this worker on its host.', None),
+        ('reserved_cpus', 'optional', 'reserved_cpus', int, 'CPUs, in nanoCPUs, reserved for this worker on its host.', None),
         ('host_id', 'optional', 'host_id', str, 'id of the host where worker is running.', None),
         ('host_ip', 'optional', 'host_ip', str, 'ip of the host where worker is running.', None),
         ('create_time', 'derived', 'create_time', str, "Time (UTC) that this actor was created.", {}),
@@ -1735,6 +2169,42 @@ class Worker(AbacoDAO):
             logger.critical(f"get_workers took {ms} to run for actor {actor_id}")
         return result
 
+    @classmethod
+    def get_worker_counts(cls, actor_ids, status=None):
+        """
+        Retrieve the number of workers for each actor in `actor_ids` (db_ids) with a single aggregation; pass `status`
+        to only count the workers in that status.
+        Returns a dictionary mapping actor db_id to its number of workers; actors with no workers map to 0.
+        """
+        start_timer = timeit.default_timer()
+        counts = {actor_id: 0 for actor_id in actor_ids}
+        match = {'actor_id': {'$in': list(actor_ids)}}
+        if status:
+            match['status'] = status
+        pipeline = [{'$match': match},
+                    {'$group': {'_id': '$actor_id', 'count': {'$sum': 1}}}]
+        for result in workers_store.aggregate(pipeline):
+            counts[result['_id']] = result['count']
+        stop_timer = timeit.default_timer()
+        ms = (stop_timer - start_timer) * 1000
+        if ms > 2500:
+            logger.critical(f"get_worker_counts took {ms} to run for {len(counts)} actors")
+        return counts
+
+    @classmethod
+    def get_host_worker_counts(cls):
+        """
+        Retrieve the number of workers on each worker host with a single aggregation. Returns a dictionary mapping
+        host_id to its number of workers; workers not yet placed on a host are counted under None.
+        """
+        pipeline = [{'$group': {'_id': '$host_id', 'count': {'$sum': 1}}}]
+        return {result['_id']: result['count'] for result in workers_store.aggregate(pipeline)}
+
+    @classmethod
+    def count_host_workers(cls, host_id):
+        """Retrieve the number of workers on the worker host `host_id`."""
+        return workers_store.count({'host_id': host_id})
+
     @classmethod
     def get_worker(cls, actor_id, worker_id):
         """Retrieve a worker from the workers store. Pass db_id as `actor_id` parameter."""
@@ -1764,38 +2234,11 @@ class Worker(AbacoDAO):
             raise errors.WorkerException("Worker not found.")
 
     @classmethod
-    def ensure_one_worker(cls, actor_id, tenant):
-        """
-        Atomically ensure at least one worker exists in the database. If not, adds a worker to the database in
-        requested status.
-        This method returns an id for the worker if a new worker was added and otherwise returns none.
-        """
-        logger.debug("top of ensure_one_worker.")
-        worker_id = Worker.get_uuid()
-        worker = {'status': REQUESTED,
-                  'id': worker_id,
-                  'tenant': tenant,
-                  'create_time': get_current_utc_time(),
-                  'actor_id': actor_id}
-        workers_for_actor = len(workers_store.items({'actor_id': actor_id}))
-        if workers_for_actor:
-            logger.debug("did not get worker from add_if_empty.")
-            return None
-        else:
-            val = workers_store[f'{actor_id}_{worker_id}'] = worker
-            abaco_metrics_store.full_update(
-                {'_id': 'stats'},
-                {'$inc': {'worker_total': 1},
-                 '$addToSet': {'worker_dbids': f'{actor_id}_{worker_id}'}},
-                upsert=True)
-            logger.info(f"got worker: {val} from add_if_empty.")
-            return worker_id
-
-    @classmethod
-    def request_worker(cls, tenant, actor_id):
+    def request_worker(cls, tenant, actor_id, fields=None):
         """
         Add a new worker to the database in requested status. This method returns an id for the worker and
-        should be called before putting a message on the command queue.
+        should be called before putting a message on the command queue. Pass `fields` to store additional fields
+        (e.g., the placement of the worker) with the worker.
         """
         logger.debug("top of request_worker().")
         worker_id = Worker.get_uuid()
@@ -1805,6 +2248,8 @@ class Worker(AbacoDAO):
                   'actor_id': actor_id,
                   'create_time': get_current_utc_time()
                   }
+        if fields:
+            worker.update(fields)
         # it's possible the actor_id is not in the workers_store yet (i.e., new actor with no workers)
         # In that case we need to catch a KeyError:
         try:
@@ -1856,6 +2301,17 @@ class Worker(AbacoDAO):
             logger.critical(f"update_worker_execution_time took {ms} to run for actor {actor_id}, worker: {worker_id}")
         logger.info("worker execution time updated. worker_id: {}".format(worker_id))
 
+    @classmethod
+    def update_worker_slots(cls, actor_id, worker_id, slots):
+        """Pass db_id as `actor_id` parameter. `slots` is the list of the worker's execution slots."""
+        start_timer = timeit.default_timer()
+        workers_store[f'{actor_id}_{worker_id}', 'slots'] = slots
+        stop_timer = timeit.default_timer()
+        ms = (stop_timer - start_timer) * 1000
+        if ms > 2500:
+            logger.critical(f"update_worker_slots took {ms} to run for actor {actor_id}, worker: {worker_id}")
+        logger.debug("worker slots updated. worker_id: {}; slots: {}".format(worker_id, slots))
+
     @classmethod
     def update_worker_health_time(cls, actor_id, worker_id):
         """Pass db_id as `actor_id` parameter."""
@@ -1938,6 +2394,192 @@ class Worker(AbacoDAO):
         self['create_time'] = display_time(create_time_str)
         return self.case()
 
+def get_placement_config(option, default, typ=str):
+    """Returns the `option` setting from the [spawner] stanza, or `default` if it is not set."""
+    try:
+        value = Config.get('spawner', option)
+    except:
+        return default
+    if typ == bool:
+        return value.lower() == 'true'
+    try:
+        return typ(value)
+    except ValueError:
+        logger.error(f"Invalid {option} config: {value}; using {default}.")
+        return default
+
+
+class HostCapacity(object):
+    """
+    Capacity of the worker hosts and placement of new workers on them. Each spawner publishes the cores, memory and
+    max workers of its host, along with the reservations of the workers on it, to the abaco_metrics_store; the
+    autoscaler also uses the published max workers to know the room left on all the hosts, including idle ones. A worker
+    reserves the memory and CPUs of its actor (mem_limit and max_cpus, or the defaults in the [workers] stanza);
+    reservations are stored on the worker so that the reservations on every host can be summed with one aggregation.
+
+    When placement is enabled, new workers are bin-packed (best fit by memory) onto the hosts serving the actor's
+    queue that have room for the reservation, and their commands are put on the command channel of that host.
+    Workers that do not fit on any host, or when no host has published its capacity recently, go on the shared
+    command channel of the queue.
+    """
+
+    # hosts that have not published their capacity for this many seconds are not used for placement.
+    HOST_TTL = 120
+
+    @classmethod
+    def get_capacity_id(cls, host_id):
+        return f'host_capacity_{host_id}'
+
+    @classmethod
+    def placement_enabled(cls):
+        return get_placement_config('placement', False, bool)
+
+    @classmethod
+    def parse_mem_limit(cls, mem_limit):
+        """
+        Returns the number of bytes of a mem_limit in the format of the --memory docker flag (e.g., 512m or 1g); 0 for
+        an unlimited (-1), missing or invalid mem_limit.
+        """
+        units = {'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+        mem_limit = str(mem_limit or '').strip().lower()
+        if mem_limit and mem_limit[-1] in units:
+            number, unit = mem_limit[:-1], units[mem_limit[-1]]
+        else:
+            number, unit = mem_limit, 1
+        try:
+            return max(int(float(number) * unit), 0)
+        except ValueError:
+            return 0
+
+    @classmethod
+    def get_worker_reservation(cls, actor):
+        """Returns the memory (in bytes) and CPUs (in nanoCPUs) reserved by a worker of `actor`."""
+        mem_limit = actor.get('mem_limit')
+        if not mem_limit:
+            try:
+                mem_limit = Config.get('workers', 'mem_limit')
+            except:
+                mem_limit = None
+        max_cpus = actor.get('max_cpus')
+        if not max_cpus:
+            try:
+                max_cpus = Config.get('workers', 'max_cpus')
+            except:
+                max_cpus = None
+        try:
+            cpus = max(int(max_cpus), 0)
+        except (TypeError, ValueError):
+            cpus = 0
+        return cls.parse_mem_limit(mem_limit), cpus
+
+    @classmethod
+    def get_reservations(cls, host_id=None):
+        """
+        Returns the number of workers and the memory and CPUs reserved by the workers running on, or placed on, each
+        host (or on the host `host_id`), as a dictionary mapping host_id to a dictionary with the workers, memory and
+        cpus keys.
+        """
+        pipeline = []
+        if host_id is not None:
+            pipeline.append({'$match': {'$or': [{'host_id': host_id}, {'placement_host_id': host_id}]}})
+        pipeline.extend([
+            {'$project': {'host': {'$ifNull': ['$host_id', '$placement_host_id']},
+                          'reserved_memory': True,
+                          'reserved_cpus': True}},
+            {'$match': {'host': {'$ne': None}}},
+            {'$group': {'_id': '$host',
+                        'workers': {'$sum': 1},
+                        'memory': {'$sum': '$reserved_memory'},
+                        'cpus': {'$sum': '$reserved_cpus'}}}])
+        return {result['_id']: {'workers': result['workers'], 'memory': result['memory'], 'cpus': result['cpus']}
+                for result in workers_store.aggregate(pipeline)}
+
+    @classmethod
+    def publish(cls, host_id, queue, cpus, memory, max_workers):
+        """
+        Publish the capacity of the host `host_id`, served by a spawner for `queue`, and its reservations. This also
+        resets the room left on the host, which place() reserves from, to the capacity less the reservations.
+        """
+        reserved = cls.get_reservations(host_id).get(host_id, {'workers': 0, 'memory': 0, 'cpus': 0})
+        cpu_overcommit = get_placement_config('placement_cpu_overcommit', 4.0, float)
+        abaco_metrics_store.full_update(
+            {'_id': cls.get_capacity_id(host_id)},
+            {'$set': {'type': 'host_capacity',
+                      'host_id': host_id,
+                      'cpus': cpus,
+                      'memory': memory,
+                      'max_workers': max_workers,
+                      'reserved': reserved,
+                      'free': {'workers': max_workers - reserved['workers'],
+                               'memory': memory - reserved['memory'],
+                               'cpus': cpus * 1000000000 * cpu_overcommit - reserved['cpus']},
+                      'update_time': get_current_utc_time()},
+             '$addToSet': {'queues': queue}},
+            upsert=True)
+
+    @classmethod
+    def get_hosts(cls, queue=None):
+        """Returns the capacity of the hosts serving `queue` (or of all hosts) that have published it recently."""
+        since = get_current_utc_time() - datetime.timedelta(seconds=cls.HOST_TTL)
+        filter_inp = {'type': 'host_capacity', 'update_time': {'$gte': since}}
+        if queue is not None:
+            filter_inp['queues'] = queue
+        return abaco_metrics_store.items(filter_inp)
+
+    @classmethod
+    def reserve(cls, host_id, memory, cpus):
+        """
+        Atomically reserves a worker slot, `memory` and `cpus` on the host `host_id` if it has room for them. Returns
+        whether the reservation was made.
+        """
+        res = abaco_metrics_store.full_update(
+            {'_id': cls.get_capacity_id(host_id),
+             'free.workers': {'$gte': 1},
+             'free.memory': {'$gte': memory},
+             'free.cpus': {'$gte': cpus}},
+            {'$inc': {'free.workers': -1, 'free.memory': -memory, 'free.cpus': -cpus}})
+        return bool(res.raw_result['nModified'])
+
+    @classmethod
+    def place(cls, actor, num=1):
+        """
+        Returns the host_id to place each of `num` new workers of `actor` on, or None for the workers that should go
+        on the shared command channel of the actor's queue. The room for each worker is reserved on its host with
+        reserve(), so concurrent callers cannot overcommit a host.
+        """
+        if not cls.placement_enabled():
+            return [None] * num
+        hosts = cls.get_hosts(actor.get('queue') or 'default')
+        if not hosts:
+            logger.info(f"No host has published its capacity for queue {actor.get('queue')}; not placing workers.")
+            return [None] * num
+        memory, cpus = cls.get_worker_reservation(actor)
+        # the room left on each host as last read; only used to order the hosts to try, since reserve() checks the
+        # room again when it reserves.
+        free = {host['host_id']: dict(host['free']) for host in hosts if host.get('free')}
+        placements = []
+        for i in range(num):
+            fits = [host_id for host_id, room in free.items()
+                    if room['workers'] >= 1 and room['memory'] >= memory and room['cpus'] >= cpus]
+            # best fit: the host with the least memory left, then the fewest worker slots left.
+            fits.sort(key=lambda h: (free[h]['memory'] - memory, free[h]['workers']))
+            for host_id in fits:
+                if cls.reserve(host_id, memory, cpus):
+                    free[host_id]['workers'] -= 1
+                    free[host_id]['memory'] -= memory
+                    free[host_id]['cpus'] -= cpus
+                    placements.append(host_id)
+                    break
+                # another caller took the room left on this host.
+                free.pop(host_id)
+            else:
+                logger.info(f"No host has room for a worker of actor {actor.get('db_id')} (memory: {memory}; "
+                            f"cpus: {cpus}); using the shared command channel.")
+                placements.append(None)
+        logger.debug(f"placed {num} worker(s) of actor {actor.get('db_id')} on hosts: {placements}")
+        return placements
+
+
 class PregenClient(AbacoDAO):
     """
     Data access object for pregenerated OAuth clients for worker. Use of these clients requires an initial
@@ -2091,6 +2733,18 @@ class ActorConfig(AbacoDAO):
         """
         return f"{tenant_id}_{name}"
 
+    @classmethod
+    def set_lookup_fields(cls, config_id, actors_list):
+        """
+        Store the parsed list of actor ids and aliases for a config along with a new revision. The actors_list field
+        is indexed and used by workers to find the configs for an actor; a new revision invalidates any copies of the
+        config value cached by workers.
+        :param config_id: The unique id of the config (as returned by get_config_db_key()).
+        :param actors_list: list of actor ids and aliases the config applies to.
+        """
+        configs_store.full_update({'_id': config_id},
+                                  {'$set': {'actors_list': actors_list, 'revision': uuid.uuid4().hex}})
+
     def get_derived_value(self, name, d):
         """Compute a derived value for the attribute `name` from the dictionary d of attributes provided."""
         # first, see if the id attribute is already in the object:
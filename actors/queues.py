@@ -1,9 +1,13 @@
 import cloudpickle
 import json
+import os
+import queue
 import rabbitpy
 import threading
 import time
 
+from prometheus_client import Counter
+
 from config import Config
 
 
@@ -42,6 +46,135 @@ class RabbitConnection(object):
 
 # rconn = RabbitConnection()
 
+
+POOL_HITS = Counter('abaco_rabbit_pool_hits_total', 'Number of channels served from the RabbitMQ channel pool.')
+POOL_MISSES = Counter('abaco_rabbit_pool_misses_total', 'Number of channels that had to be opened because the pool was empty.')
+POOL_RECONNECTS = Counter('abaco_rabbit_pool_reconnects_total', 'Number of times the pooled RabbitMQ connection was (re)opened.')
+
+
+def _get_pool_size():
+    """Maximum number of idle channels kept open by the pool."""
+    try:
+        return int(Config.get('rabbit', 'channel_pool_size'))
+    except:
+        return 10
+
+
+class RabbitConnectionPool(object):
+    """
+    Process-wide pool holding a single long-lived connection to RabbitMQ and a set of idle channels on that
+    connection. TaskQueue instances borrow a channel on creation and hand it back on close(), so that the
+    (expensive) AMQP connection handshake happens once per process instead of once per channel object.
+
+    Forked processes (e.g., gunicorn workers) must not share the parent's socket, so the pool is reset whenever
+    the pid changes.
+    """
+    def __init__(self, retries=100):
+        self.retries = retries
+        self.max_idle = _get_pool_size()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+        self._idle = []
+
+    def _connection_ok(self):
+        return self._conn is not None and self._pid == os.getpid() and self._conn.open
+
+    def _connect(self):
+        """Open a new connection; must be called with the lock held."""
+        if self._conn is not None and self._pid == os.getpid():
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._idle = []
+        uri = Config.get('rabbit', 'uri')
+        tries = 0
+        while tries < self.retries:
+            tries = tries + 1
+            try:
+                self._conn = rabbitpy.Connection(uri)
+                self._pid = os.getpid()
+                POOL_RECONNECTS.inc()
+                return
+            except RuntimeError:
+                time.sleep(0.1)
+        self._conn = None
+        raise RuntimeError("Could not connect to RabbitMQ.")
+
+    def acquire(self):
+        """Return an open channel, reusing an idle one when possible."""
+        with self._lock:
+            if not self._connection_ok():
+                self._connect()
+            while self._idle:
+                ch = self._idle.pop()
+                if ch.open:
+                    POOL_HITS.inc()
+                    return ch
+            POOL_MISSES.inc()
+            ch = self._conn.channel()
+            ch.prefetch_count(value=1)
+            return ch
+
+    def release(self, ch):
+        """Give a channel back to the pool. Broken channels, and channels beyond the pool size, are closed."""
+        with self._lock:
+            if self._connection_ok() and ch.open and len(self._idle) < self.max_idle:
+                self._idle.append(ch)
+                return
+        self.discard(ch)
+
+    @staticmethod
+    def discard(ch):
+        """Close a channel without returning it to the pool."""
+        try:
+            if ch.open:
+                ch.close()
+        except Exception:
+            pass
+
+
+class PooledRabbitConnection(object):
+    """
+    Connection-like wrapper around a channel borrowed from the process-wide pool. Exposes the same _ch attribute
+    and close() method as RabbitConnection so that client code does not need to know about the pool.
+    """
+    def __init__(self, pool):
+        self._pool = pool
+        self._ch = pool.acquire()
+
+    def close(self):
+        self._pool.release(self._ch)
+
+    def discard(self):
+        self._pool.discard(self._ch)
+
+
+pool = RabbitConnectionPool()
+
+
+def get_queue_depths(names):
+    """
+    Returns a dictionary mapping each queue name in `names` to the number of messages ready in the queue, using
+    passive declares on a single pooled channel instead of a channel (and queue declare) per queue.
+    Queues that do not exist are left out of the result.
+    """
+    depths = {}
+    ch = pool.acquire()
+    try:
+        for name in names:
+            try:
+                message_count, _ = rabbitpy.Queue(ch, name=name).declare(passive=True)
+                depths[name] = message_count
+            except rabbitpy.exceptions.AMQPNotFound:
+                # the broker closes the channel on a failed passive declare.
+                pool.discard(ch)
+                ch = pool.acquire()
+    finally:
+        pool.release(ch)
+    return depths
+
 class LegacyQueue(object):
     """
     This class is here to support existing code that expects an _queue object on the Various channel objects (e.g.,
@@ -51,7 +184,7 @@ class LegacyQueue(object):
 
 
 class TaskQueue(object):
-    def __init__(self, name=None):
+    def __init__(self, name=None, expires=None):
         # reuse the singleton rconn
         # self.conn = rconn
         # NOTE -
@@ -59,12 +192,22 @@ class TaskQueue(object):
         # singleton pattern to work, we would need fof individual functions to not call close() directly, but rather
         # have an automated way at the end of each process/thread execution to close the connection.
 
-        # create a new RabbitConnection for this instance of the task queue.
-        self.conn = RabbitConnection()
+        # borrow a channel on the process-wide pooled connection for this instance of the task queue; the channel
+        # is handed back to the pool when the task queue is closed.
+        self.conn = PooledRabbitConnection(pool)
         self._ch = self.conn._ch
+        self._consuming = False
+        self._confirms = False
         self.name = name
-        self.queue = rabbitpy.Queue(self._ch, name=name, durable=True)
-        self.queue.declare()
+        # queues declared with `expires` (in milliseconds) are deleted by the broker once they have been unused for
+        # that long.
+        self.queue = rabbitpy.Queue(self._ch, name=name, durable=True, expires=expires)
+        try:
+            self.queue.declare()
+        except Exception:
+            # the broker closes a channel on a failed declare, so do not hand it back to the pool.
+            self.conn.discard()
+            raise
         # the following added for backwards compatibility so that client code using the ch._queue._queue attribute
         # will continue to work.
         self._queue = LegacyQueue()
@@ -90,15 +233,35 @@ class TaskQueue(object):
         msg = rabbitpy.Message(self.conn._ch, self._pre_process(m), {})
         msg.publish('', self.name)
 
+    def put_many(self, ms):
+        """
+        Publish several messages on this queue's channel with publisher confirms enabled.
+        Returns the list of messages that were not confirmed by the broker.
+        """
+        if not self._confirms:
+            self.conn._ch.enable_publisher_confirms()
+            self._confirms = True
+        failed = []
+        for m in ms:
+            msg = rabbitpy.Message(self.conn._ch, self._pre_process(m), {})
+            if not msg.publish('', self.name):
+                failed.append(m)
+        return failed
+
     # def close(self):
     #     self.conn.close()
 
     def close(self):
-        def _close(this):
-            this.conn.close()
-
-        t = threading.Thread(target=_close, args=(self,))
-        t.start()
+        # a channel with an active consumer (e.g., a get_one() blocked in another thread) cannot be reused, so it is
+        # closed outright; the same is true of a channel left in publisher confirms mode (it cannot be switched off).
+        # otherwise, it goes back to the pool.
+        if self._consuming:
+            t = threading.Thread(target=self.conn.discard)
+            t.start()
+        elif self._confirms:
+            self.conn.discard()
+        else:
+            self.conn.close()
 
     def delete(self):
         self.queue.delete()
@@ -107,8 +270,53 @@ class TaskQueue(object):
         """Blocking method to get a single message without polling."""
         if self._queue is None:
             raise ChannelClosedException()
-        for msg in self.queue.consume(prefetch=1):
-            return self._post_process(msg), msg
+        self._consuming = True
+        try:
+            for msg in self.queue.consume(prefetch=1):
+                return self._post_process(msg), msg
+        finally:
+            self._consuming = False
+
+    def get(self, timeout):
+        """
+        Blocking method to get a single message without polling, waiting at most `timeout` seconds. Returns a
+        (message, msg_obj) tuple, or None if no message arrived in time; the caller must close the task queue after a
+        timeout to cancel the consumer.
+        """
+        results = queue.Queue()
+
+        def consume():
+            try:
+                results.put(self.get_one())
+            except Exception as e:
+                results.put(e)
+
+        # set before the consumer starts so that a close() after a timeout never hands the channel back to the pool
+        # with a consumer attached to it.
+        self._consuming = True
+        t = threading.Thread(target=consume, daemon=True)
+        t.start()
+        try:
+            result = results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def consume(self, prefetch=1):
+        """
+        Blocking generator of (message, msg_obj) tuples from a single consumer that stays open between messages. Up
+        to `prefetch` messages can be delivered to the consumer without being acknowledged.
+        """
+        if self._queue is None:
+            raise ChannelClosedException()
+        self._consuming = True
+        try:
+            for msg in self.queue.consume(prefetch=prefetch):
+                yield self._post_process(msg), msg
+        finally:
+            self._consuming = False
 
 
 class JsonTaskQueue(TaskQueue):
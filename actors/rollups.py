@@ -0,0 +1,33 @@
+"""
+Rebuilds the per-actor executions rollups in the abaco_metrics_store from the executions store.
+
+The rollups are kept up to date incrementally as executions are added and finalized, so this only needs to be run
+once after upgrading from a version without rollups, or if a rollup is suspected to have drifted (e.g., after an
+update to a rollup failed). A rebuild overwrites the rollups with the totals of the executions store, so run it while
+no executions are being added or finalized (e.g., before starting the APIs, spawners and workers).
+
+Run from within the abaco/core image with:
+    python3 rollups.py               # rebuild the rollups for all actors
+    python3 rollups.py <dbid> ...    # rebuild the rollups for specific actors (by dbid; e.g., TACC-PROD_<actor_id>)
+"""
+import sys
+
+from agaveflask.logs import get_logger
+from models import ExecutionsRollup
+
+logger = get_logger(__name__)
+
+
+def main(actor_ids=None):
+    if actor_ids:
+        for actor_id in actor_ids:
+            rollups = ExecutionsRollup.rebuild(actor_id)
+            print(f"Rebuilt rollup for actor {actor_id}; total executions: {rollups[actor_id]['total_executions']}")
+    else:
+        rollups = ExecutionsRollup.rebuild()
+        print(f"Rebuilt rollups for {len(rollups)} actors.")
+    logger.info(f"Executions rollups rebuilt; actor_ids: {actor_ids or 'all'}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,7 +1,12 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
+import threading
 import time
+import timeit
 
+from prometheus_client import start_http_server, Histogram
 import rabbitpy
 
 from channelpy.exceptions import ChannelTimeoutException
@@ -9,9 +14,10 @@ from channelpy.exceptions import ChannelTimeoutException
 from codes import BUSY, ERROR, SPAWNER_SETUP, PULLING_IMAGE, CREATING_CONTAINER, UPDATING_STORE, READY, \
     REQUESTED, SHUTDOWN_REQUESTED, SHUTTING_DOWN
 from config import Config
-from docker_utils import DockerError, run_worker, pull_image
+from docker_utils import DockerError, ImagePullCache, run_worker, run_warm_worker, bind_warm_worker, container_running, \
+    rm_container, rm_containers, get_host_resources
 from errors import WorkerException
-from models import Actor, Worker
+from models import Actor, HostCapacity, Worker
 from stores import actors_store, workers_store
 from channels import ActorMsgChannel, ClientsChannel, CommandChannel, WorkerChannel, SpawnerWorkerChannel
 from health import get_worker
@@ -26,6 +32,40 @@ except:
 MAX_WORKERS = int(MAX_WORKERS)
 logger.info("Spawner running with MAX_WORKERS = {}".format(MAX_WORKERS))
 
+# number of generic worker containers each spawner keeps started and waiting to be bound to an actor; 0 disables
+# the warm pool.
+try:
+    WARM_POOL_SIZE = int(Config.get("spawner", "warm_pool_size"))
+except:
+    WARM_POOL_SIZE = 0
+logger.info("Spawner running with WARM_POOL_SIZE = {}".format(WARM_POOL_SIZE))
+
+# maximum number of commands each spawner processes at the same time; commands for the same actor are always
+# processed one at a time, in order.
+try:
+    CONCURRENCY = int(Config.get("spawner", "concurrency"))
+except:
+    CONCURRENCY = 4
+CONCURRENCY = max(min(CONCURRENCY, MAX_WORKERS), 1)
+logger.info("Spawner running with CONCURRENCY = {}".format(CONCURRENCY))
+
+# how often (in seconds) the spawner recounts the workers on its host; in between, it only counts the workers it
+# starts itself.
+WORKER_COUNT_INTERVAL = 30
+
+# how often (in seconds) the spawner looks for new images to pre-pull for the actors with min_idle_workers.
+PREPULL_INTERVAL = 60
+
+# how often (in seconds) the spawner publishes the capacity of its host; must be well below HostCapacity.HOST_TTL so
+# that idle hosts stay available for placement and autoscaling.
+CAPACITY_INTERVAL = 30
+
+COMMAND_WAIT_TIME = Histogram('abaco_spawner_command_wait_seconds',
+                              'Time commands wait in the spawner, after being read from the command channel, '
+                              'before being processed.')
+COMMAND_PROCESSING_TIME = Histogram('abaco_spawner_command_processing_seconds',
+                                    'Time spent processing a command from the command channel.')
+
 
 class SpawnerException(Exception):
     def __init__(self, message):
@@ -41,13 +81,58 @@ class Spawner(object):
         self.queue = os.environ.get('queue', 'default')
         self.cmd_ch = CommandChannel(name=self.queue)
         self.tot_workers = 0
+        self.last_worker_count = 0
         try:
             self.host_id = Config.get('spawner', 'host_id')
         except Exception as e:
             logger.critical("Spawner not configured with a host_id! Aborting! Exception: {}".format(e))
             raise e
+        self.executor = ThreadPoolExecutor(max_workers=CONCURRENCY)
+        # each command read from the command channel holds a slot until it has been processed.
+        self.slots = threading.Semaphore(CONCURRENCY)
+        self.in_flight = 0
+        # commands waiting on an earlier command for the same actor, keyed by actor; an actor is in the dictionary
+        # while one of its commands is being processed.
+        self.actor_cmds = {}
+        self._lock = threading.Lock()
+        self._fill_lock = threading.Lock()
+        # when workers are placed on specific hosts, the spawner also reads the command channel of its host.
+        self.placement = HostCapacity.placement_enabled()
+        self.host_resources = None
+        # generic worker containers that have been started but not bound to an actor yet.
+        self.warm_pool = []
+        self.warm_name_prefix = 'warm_{}_{}_'.format(self.host_id, self.queue)
+        # actor images pulled on this host; a worker for an image pulled within the image_refresh_interval
+        # skips the pull.
+        self.image_cache = ImagePullCache()
+        if WARM_POOL_SIZE > 0:
+            # warm workers left over by a previous spawner for this queue will never be bound; remove them.
+            try:
+                removed = rm_containers(self.warm_name_prefix)
+                logger.info("Removed {} warm worker(s) left over by a previous spawner.".format(removed))
+            except DockerError as e:
+                logger.error("Spawner got exception trying to remove old warm workers. Exception: {}".format(e))
 
     def run(self):
+        threading.Thread(target=self.prepull_loop, daemon=True).start()
+        # the capacity is published even without placement; the autoscaler uses it to know the room on idle hosts.
+        threading.Thread(target=self.publish_capacity_loop, daemon=True).start()
+        if self.placement:
+            host_ch = CommandChannel(name=self.queue, host_id=self.host_id)
+            threading.Thread(target=self.consume, args=(host_ch,), daemon=True).start()
+        self.consume(self.cmd_ch)
+
+    def publish_capacity_loop(self):
+        """
+        Publish the capacity of this host every CAPACITY_INTERVAL seconds, including while the spawner is idle and
+        blocked waiting for commands.
+        """
+        while True:
+            self.publish_capacity()
+            time.sleep(CAPACITY_INTERVAL)
+
+    def consume(self, cmd_ch):
+        """Read and submit the commands on the command channel `cmd_ch`."""
         while True:
             # check resource threshold before subscribing
             while True:
@@ -57,35 +142,164 @@ class Spawner(object):
                     time.sleep(5)
                 else:
                     break
-            cmd, msg_obj = self.cmd_ch.get_one()
+            self.fill_warm_pool()
+            cmd, msg_obj = cmd_ch.get_one()
             # directly ack the messages from the command channel; problems generated from starting workers are
             # handled downstream; e.g., by setting the actor in an ERROR state; command messages should not be re-queued
             msg_obj.ack()
+            # wait for a free slot before processing the command. the slot is taken after reading the command so that
+            # a consumer blocked on an empty channel does not hold one; each consumer holds at most one command
+            # while it waits.
+            self.slots.acquire()
+            self.submit(cmd)
+
+    def submit(self, cmd):
+        """
+        Process a command on the thread pool; if a command for the same actor is already being processed, the command
+        is queued behind it.
+        """
+        actor_id = cmd.get('actor_id')
+        received = time.time()
+        with self._lock:
+            self.in_flight += 1
+            if actor_id in self.actor_cmds:
+                logger.debug("command for actor {} queued behind a previous command.".format(actor_id))
+                self.actor_cmds[actor_id].append((cmd, received))
+                return
+            self.actor_cmds[actor_id] = collections.deque()
+        self.executor.submit(self.process_actor_cmds, actor_id, cmd, received)
+
+    def process_actor_cmds(self, actor_id, cmd, received):
+        """Process `cmd` and then, in order, the commands queued for the same actor in the meantime."""
+        while True:
+            COMMAND_WAIT_TIME.observe(time.time() - received)
+            start = timeit.default_timer()
             try:
                 self.process(cmd)
             except Exception as e:
                 logger.error("spawner got an exception trying to process cmd: {}. "
                              "Exception type: {}. Exception: {}".format(cmd, type(e), e))
+            finally:
+                COMMAND_PROCESSING_TIME.observe(timeit.default_timer() - start)
+                with self._lock:
+                    self.in_flight -= 1
+                self.slots.release()
+            with self._lock:
+                cmds = self.actor_cmds[actor_id]
+                if not cmds:
+                    del self.actor_cmds[actor_id]
+                    return
+                cmd, received = cmds.popleft()
 
     def get_tot_workers(self):
+        """Recount the workers on this host from the workers_store."""
         logger.debug("top of get_tot_workers")
-        self.tot_workers = 0
         logger.debug('spawner host_id: {}'.format(self.host_id))
-        for worker_info in workers_store.items():
-            try:
-                if worker_info['host_id'] == self.host_id:
-                    self.tot_workers += 1
-            except KeyError:
-                continue
+        tot_workers = Worker.count_host_workers(self.host_id)
+        with self._lock:
+            self.tot_workers = tot_workers
+            self.last_worker_count = time.time()
         logger.debug("returning total workers: {}".format(self.tot_workers))
         return self.tot_workers
 
+    def publish_capacity(self):
+        """Publish the capacity of this host and the reservations of its workers for placement."""
+        try:
+            if not self.host_resources:
+                self.host_resources = get_host_resources()
+            cpus, memory = self.host_resources
+            HostCapacity.publish(self.host_id, self.queue, cpus, memory, MAX_WORKERS)
+        except Exception as e:
+            logger.error("Spawner got exception trying to publish the host capacity. Exception: {}".format(e))
+
     def overloaded(self):
+        """
+        Whether this host has reached MAX_WORKERS. Uses the spawner's own count of the workers on the host, which is
+        recounted every WORKER_COUNT_INTERVAL seconds to pick up the workers that stopped in the meantime.
+        """
         logger.debug("top of overloaded")
-        self.get_tot_workers()
-        logger.info("total workers for this host: {}".format(self.tot_workers))
-        if self.tot_workers >= MAX_WORKERS:
-            return True
+        if time.time() - self.last_worker_count > WORKER_COUNT_INTERVAL:
+            self.get_tot_workers()
+        # workers for commands still being processed are not on the host yet.
+        if self.tot_workers + self.in_flight >= MAX_WORKERS:
+            # the count could include workers that have stopped since it was taken; recount before refusing work.
+            self.get_tot_workers()
+            logger.info("total workers for this host: {}; commands in flight: {}".format(self.tot_workers,
+                                                                                          self.in_flight))
+            return self.tot_workers + self.in_flight >= MAX_WORKERS
+        return False
+
+    def fill_warm_pool(self):
+        """Start generic worker containers until the warm pool has WARM_POOL_SIZE workers."""
+        with self._fill_lock:
+            self._fill_warm_pool()
+
+    def _fill_warm_pool(self):
+        while len(self.warm_pool) < WARM_POOL_SIZE:
+            warm_id = Worker.get_uuid()
+            name = '{}{}'.format(self.warm_name_prefix, warm_id)
+            try:
+                cid = run_warm_worker(warm_id, name)
+            except DockerError as e:
+                logger.error("Spawner got exception trying to start a warm worker. Exception: {}".format(e))
+                return
+            with self._lock:
+                self.warm_pool.append({'id': warm_id, 'name': name, 'cid': cid})
+            logger.info("Started warm worker {}; warm pool size: {}".format(warm_id, len(self.warm_pool)))
+
+    def get_warm_worker(self):
+        """Remove and return a worker from the warm pool whose container is still running; None if there is none."""
+        while True:
+            with self._lock:
+                if not self.warm_pool:
+                    return None
+                warm = self.warm_pool.pop(0)
+            try:
+                if container_running(name=warm['name']):
+                    return warm
+            except DockerError as e:
+                logger.error("Spawner got exception checking warm worker {}. Exception: {}".format(warm['id'], e))
+            logger.info("Warm worker {} is no longer running; discarding it.".format(warm['id']))
+            self.discard_warm_worker(warm)
+
+    def discard_warm_worker(self, warm):
+        """Remove the container and the spawner worker channel of a warm worker that will not be bound."""
+        try:
+            rm_container(warm['cid'])
+        except DockerError:
+            pass
+        try:
+            ch = SpawnerWorkerChannel(worker_id=warm['id'])
+            ch.delete()
+            ch.close()
+        except Exception as e:
+            logger.debug("Got exception trying to delete the channel of warm worker {}: {}".format(warm['id'], e))
+
+    def prepull_loop(self):
+        """Pre-pull images every PREPULL_INTERVAL seconds; runs in its own thread."""
+        while True:
+            try:
+                self.prepull_images()
+            except Exception as e:
+                logger.error("Spawner got an unexpected exception pre-pulling images. Exception: {}".format(e))
+            time.sleep(PREPULL_INTERVAL)
+
+    def prepull_images(self):
+        """
+        Pull the images of the actors on this spawner's queue that have min_idle_workers so that starting their
+        workers does not have to wait on the pull.
+        """
+        try:
+            actors = actors_store.items({'queue': self.queue, 'min_idle_workers': {'$gt': 0}},
+                                        proj_inp={'_id': False, 'image': True, 'revision': True})
+        except Exception as e:
+            logger.error("Spawner got exception retrieving actors with min_idle_workers. Exception: {}".format(e))
+            return
+        for actor in actors:
+            try:
+                self.image_cache.pull(actor.get('image'), actor.get('revision'))
+            except DockerError as e:
+                logger.info("Spawner could not pre-pull image {}. Exception: {}".format(actor.get('image'), e))
 
     def stop_workers(self, actor_id, worker_ids):
         """Stop existing workers; used when updating an actor's image."""
@@ -353,10 +567,11 @@ class Spawner(object):
 
         # start an actor executor container and wait for a confirmation that image was pulled.
         attempts = 0
-        Worker.update_worker_status(actor_id, worker_id, PULLING_IMAGE)
+        if not self.image_cache.is_fresh(image, revision):
+            Worker.update_worker_status(actor_id, worker_id, PULLING_IMAGE)
         try:
             logger.debug("Worker pulling image {}...".format(image))
-            pull_image(image)
+            image_digest = self.image_cache.pull(image, revision)
         except DockerError as e:
             # return a message to the spawner that there was an error pulling image and abort.
             # this is not necessarily an error state: the user simply could have provided an
@@ -364,10 +579,23 @@ class Spawner(object):
             # find that out.
             logger.info("worker got a DockerError trying to pull image. Error: {}.".format(e))
             raise e
-        logger.info("Image {} pulled successfully.".format(image))
+        logger.info("Image {} pulled successfully; digest: {}.".format(image, image_digest))
         # Done pulling image
+        # Bind a worker from the warm pool, if there is one; otherwise, run a new worker container.
+        worker_dict = None
+        warm = self.get_warm_worker()
+        if warm:
+            try:
+                Worker.update_worker_status(actor_id, worker_id, CREATING_CONTAINER)
+                worker_dict = bind_warm_worker(warm['cid'], warm['id'], image, actor_id, worker_id)
+                logger.info("Bound warm worker {} to worker {}_{}.".format(warm['id'], actor_id, worker_id))
+            except DockerError as e:
+                logger.error("Spawner got exception binding warm worker {}; starting a new worker container "
+                             "instead. Exception: {}".format(warm['id'], e))
+                self.discard_warm_worker(warm)
+                warm = None
         # Run Worker Container
-        while True:
+        while not worker_dict:
             try:
                 Worker.update_worker_status(actor_id, worker_id, CREATING_CONTAINER)
                 logger.debug('spawner creating worker container')
@@ -411,6 +639,7 @@ class Spawner(object):
             break
         logger.debug('finished loop')
         worker_dict['ch_name'] = WorkerChannel.get_name(worker_id)
+        worker_dict['image_digest'] = image_digest
         # if the actor is not already in READY status, set actor status to READY before worker status has been
         # set to READY.
         # it is possible the actor status is already READY because this request is the autoscaler starting a new worker
@@ -429,12 +658,33 @@ class Spawner(object):
                 # so, the worker should have a stop message waiting for it. starting subscribe
                 # as usual should allow this process to work as expected.
                 pass
+        # record the resources reserved for the worker on this host.
+        worker_dict['reserved_memory'], worker_dict['reserved_cpus'] = HostCapacity.get_worker_reservation(actor)
         # finalize worker with READY status
         worker = Worker(tenant=tenant, **worker_dict)
         logger.info("calling add_worker for worker: {}.".format(worker))
         Worker.add_worker(actor_id, worker)
-
-        ch.put('READY')  # step 4
+        with self._lock:
+            self.tot_workers += 1
+
+        if warm:
+            # the warm worker waits on the channel of its own id and gets its configuration from the spawner; the
+            # channel for worker_id is not used.
+            ch.delete()
+            warm_ch = SpawnerWorkerChannel(worker_id=warm['id'])
+            warm_ch.put({'worker_id': worker_id,
+                         'actor_id': actor_id,
+                         'image': image,
+                         'revision': revision,
+                         'tenant': tenant,
+                         'api_server': api_server,
+                         'client_id': client_id,
+                         'client_access_token': client_access_token,
+                         'client_refresh_token': client_refresh_token,
+                         'client_secret': client_secret})
+            warm_ch.close()
+        else:
+            ch.put('READY')  # step 4
         logger.info('sent message through channel')
 
     def error_out_actor(self, actor_id, worker_id, message):
@@ -495,6 +745,14 @@ class Spawner(object):
 
 
 def main():
+    # expose the spawner's metrics (e.g., image pull times) to prometheus, if configured.
+    try:
+        metrics_port = int(Config.get('spawner', 'metrics_port'))
+    except:
+        metrics_port = None
+    if metrics_port:
+        start_http_server(metrics_port)
+        logger.info("spawner serving metrics on port {}".format(metrics_port))
     # todo - find something more elegant
     idx = 0
     while idx < 3:
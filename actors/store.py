@@ -1,8 +1,13 @@
 
 import collections
+import copy
 from datetime import datetime, timedelta
+from functools import lru_cache
 import json
+import operator
 import os
+import threading
+import time
 import urllib.parse
 
 import configparser
@@ -10,6 +15,7 @@ import pprint
 import redis
 from pymongo.errors import WriteError, DuplicateKeyError
 from pymongo import MongoClient
+from prometheus_client import Counter
 
 from config import Config
 
@@ -35,6 +41,21 @@ class StoreMutexException(Exception):
     pass
 
 
+@lru_cache(maxsize=1024)
+def path_accessor(path):
+    """
+    Returns a function that gets the value at `path` (a tuple of fields) from a document; i.e., for
+    path ('field1', 'field2'), accessor(doc) returns doc['field1']['field2']. Raises KeyError if a field is missing.
+    Accessors are cached, so each path is only compiled once.
+    """
+    getters = [operator.itemgetter(field) for field in path]
+    def accessor(doc):
+        for getter in getters:
+            doc = getter(doc)
+        return doc
+    return accessor
+
+
 class AbstractStore(collections.MutableMapping):
     """A persitent dictionary."""
 
@@ -126,16 +147,20 @@ class MongoStore(AbstractStore):
         Atomically does either:
         Gets and returns 'self[key]' or 'self[key][field1][field2][...]' as a dictionary
         """
-        key, _, subscripts = self._process_inputs(fields)
+        key, dots, path = self._process_inputs(fields)
+        # only retrieve the requested field from mongo
+        projection = {'_id': False}
+        if path:
+            projection[dots] = True
         result = self._db.find_one(
             {'_id': key},
-            projection={'_id': False})
+            projection=projection)
         if result == None:
             raise KeyError(f"'_id' of '{key}' not found")
         try:
-            return eval('result' + subscripts)
-        except KeyError:
-            raise KeyError(f"Subscript of {subscripts} does not exists in document of '_id' {key}")
+            return path_accessor(path)(result)
+        except (KeyError, TypeError):
+            raise KeyError(f"Subscript of {list(path)} does not exists in document of '_id' {key}")
 
     def __setitem__(self, fields, value):
         """
@@ -168,8 +193,8 @@ class MongoStore(AbstractStore):
         Deletes 'self[key]'
         Unsets 'self[key][field1][field2][...]'
         """
-        key, dots, subscripts = self._process_inputs(fields)
-        if not subscripts:
+        key, dots, path = self._process_inputs(fields)
+        if not path:
             result = self._db.delete_one({'_id': key})
             if result.raw_result['n'] == 0:
                 logger.debug(f"No document with '_id' found. Key:{key}, Fields:{dots}")
@@ -203,20 +228,20 @@ class MongoStore(AbstractStore):
         """
         Takes in fields and returns the key corresponding with '_id', dot notation
         for getting to a specific field in a Mongo query/filter (ex. 'field1.field2.field3.field4')
-        and the subscript notation for returning a specified field from a result dictionary
-        (ex. `['field1']['field2']['field3']['field4']`)
+        and the path, as a tuple, for returning a specified field from a result dictionary with path_accessor()
+        (ex. `('field1', 'field2', 'field3', 'field4')`; empty if no field was specified)
         """
         if isinstance(fields, str):
             key = dots = fields
-            subscripts = ''
+            path = ()
         elif isinstance(fields, list) and len(fields) == 1:
             key = dots = fields[0]
-            subscripts = ''
+            path = ()
         else:
             key = fields[0]
             dots = '.'.join(fields[1:])
-            subscripts = "['" + "']['".join(fields[1:]) + "']"
-        return key, dots, subscripts
+            path = tuple(fields[1:])
+        return key, dots, path
 
     def _prepset(self, value):
         if type(value) is bytes:
@@ -227,8 +252,8 @@ class MongoStore(AbstractStore):
         """
         Atomically pops 'self[key] = value' or 'self[key][field1][field2][...] = value'
         """
-        key, dots, subscripts = self._process_inputs(fields)
-        if not subscripts:
+        key, dots, path = self._process_inputs(fields)
+        if not path:
             result = self._db.find_one(
                 {'_id': key},
                 projection={'_id': False})
@@ -241,11 +266,12 @@ class MongoStore(AbstractStore):
         else:
             result = self._db.find_one_and_update(
                 filter={'_id': key},
-                update={'$unset': {dots: ''}})
+                update={'$unset': {dots: ''}},
+                projection={'_id': False, dots: True})
             try:
-                return eval('result' + subscripts)
-            except KeyError:
-                raise KeyError(f"Subscript of {subscripts} does not exist in document of '_id' {key}")
+                return path_accessor(path)(result)
+            except (KeyError, TypeError):
+                raise KeyError(f"Subscript of {list(path)} does not exist in document of '_id' {key}")
 
     def set_with_expiry(self, fields, value, log_ex):
         """
@@ -255,21 +281,76 @@ class MongoStore(AbstractStore):
         Note: MongoDB TTL checks every 60 secs to delete files
         """
         key, dots, _ = self._process_inputs(fields)
-        log_ex_config = int(Config.get('web','log_ex'))
-        time_change = log_ex_config - log_ex
-        blah = datetime.utcnow()- timedelta(seconds=time_change)
-        logger.debug(f"What time is this being set to: {blah} ")
+        exp = self._get_exp(log_ex)
+        logger.debug(f"What time is this being set to: {exp} ")
         if len(fields) == 1 and isinstance(value, dict):
             result = self._db.update_one(
                 filter={'_id': key},
-                update={'$set': {'exp': datetime.utcnow()- timedelta(seconds=time_change)},
+                update={'$set': {'exp': exp},
                         '$set': value},
                 upsert=True)
         else:
             result = self._db.update_one(
                 filter={'_id': key},
-                update={'$set': {'exp': datetime.utcnow() - timedelta(seconds=time_change), dots: self._prepset(value)}},
+                update={'$set': {'exp': exp, dots: self._prepset(value)}},
+                upsert=True)
+
+    def _get_exp(self, log_ex):
+        """
+        Returns the value for the 'exp' field so that the MongoDB TTL index (configured with the global log_ex)
+        expires the document after `log_ex` seconds.
+        """
+        log_ex_config = int(Config.get('web','log_ex'))
+        time_change = log_ex_config - log_ex
+        return datetime.utcnow() - timedelta(seconds=time_change)
+
+    def set_fields(self, key, values, log_ex=None, unset=None):
+        """
+        Atomically sets several fields of 'self[key]' with a single write:
+        'self[key][field1] = value1', 'self[key][field2][subfield] = value2', ...
+        :param key: the '_id' of the document.
+        :param values: dictionary mapping fields to values; fields can use dot notation (ex. 'field1.field2') or be
+        passed as tuples of fields (ex. ('field1', 'field2')) to set a subfield.
+        :param log_ex: if not None, also sets the 'exp' field as in set_with_expiry().
+        :param unset: list of fields to remove from the document with the same write.
+        """
+        update = {}
+        for fields, value in values.items():
+            if isinstance(fields, (list, tuple)):
+                fields = '.'.join(fields)
+            update[fields] = self._prepset(value)
+        if log_ex is not None:
+            update['exp'] = self._get_exp(log_ex)
+        update = {'$set': update}
+        if unset:
+            update['$unset'] = {'.'.join(f) if isinstance(f, (list, tuple)) else f: '' for f in unset}
+        try:
+            result = self._db.update_one(
+                filter={'_id': key},
+                update=update,
                 upsert=True)
+        except WriteError:
+            raise WriteError(
+                "Likely due to trying to set a subfield of a field that does not exists." +
+                "\n Try setting a dict rather than a value. Ex. store['id_key', 'key', 'field'] = {'subfield': 'value'}")
+        if result.raw_result['nModified'] == 0:
+            if not 'upserted' in result.raw_result:
+                logger.debug(f'Fields not modified, old values likely the same as new. Key: {key}, Values: {values}')
+
+    def get_fields(self, key, fields):
+        """
+        Gets and returns only the listed top-level fields of 'self[key]' as a dictionary with a single read.
+        Fields missing from the document are missing from the result.
+        :param key: the '_id' of the document.
+        :param fields: list of field names; dot notation is allowed.
+        """
+        projection = {'_id': False}
+        for field in fields:
+            projection[field] = True
+        result = self._db.find_one({'_id': key}, projection=projection)
+        if result == None:
+            raise KeyError(f"'_id' of '{key}' not found")
+        return result
 
     def full_update(self, key, value, upsert=False):
         result = self._db.update_one(key, value, upsert)
@@ -281,25 +362,50 @@ class MongoStore(AbstractStore):
         Sets 'self[key] = value' and returns previous 'self[key]'
         Sets 'self[key][field1][field2][...] = value' and returns previous 'self[key][field1][field2][...]'
         """
-        key, dots, subscripts = self._process_inputs(fields)
+        key, dots, path = self._process_inputs(fields)
         result = self._db.find_one_and_update(
             filter={'_id': key, dots: {'$exists': True}},
             update={'$set': {dots: value}})
         if result == None:
-            raise KeyError(f"1Subscript of {subscripts} does not exist in document of '_id' {key}")   
+            raise KeyError(f"1Subscript of {list(path)} does not exist in document of '_id' {key}")
         try:
             if len(fields) == 1:
-                return eval(f"result['{key}']")
+                return result[key]
             else:
-                return eval('result' + subscripts)
-        except KeyError:
-            raise KeyError(f"Subscript of {subscripts} does not exist in document of '_id' {key}")
+                return path_accessor(path)(result)
+        except (KeyError, TypeError):
+            raise KeyError(f"Subscript of {list(path)} does not exist in document of '_id' {key}")
 
-    def items(self, filter_inp=None, proj_inp={'_id': False}):
-        " Either returns all with no inputs, or filters when given filters"
+    def insert_many(self, values, ordered=True, log_ex=None):
+        """
+        Inserts several new documents with a single round trip.
+        :param values: dictionary mapping each key (the '_id' of the new document) to a dictionary of its fields.
+        :param ordered: whether mongo should stop at the first failed insert.
+        :param log_ex: if not None, also sets the 'exp' field of each document as in set_with_expiry().
+        :return: list of the keys inserted.
+        """
+        docs = []
+        for key, value in values.items():
+            doc = dict(value)
+            doc['_id'] = key
+            if log_ex is not None:
+                doc['exp'] = self._get_exp(log_ex)
+            docs.append(doc)
+        if not docs:
+            return []
+        result = self._db.insert_many(docs, ordered=ordered)
+        return result.inserted_ids
+
+    def items(self, filter_inp=None, proj_inp={'_id': False}, sort=None, limit=0):
+        """
+        Either returns all with no inputs, or filters when given filters
+        Optionally, `sort` (list of (key, direction) tuples) and `limit` are applied by mongo.
+        """
         return list(self._db.find(
             filter=filter_inp,
-            projection=proj_inp))
+            projection=proj_inp,
+            sort=sort,
+            limit=limit))
 
     def add_if_empty(self, fields, value):
         """
@@ -340,8 +446,272 @@ class MongoStore(AbstractStore):
         except DuplicateKeyError:
             return None
     
+    def inc_fields(self, key, increments, values=None, log_ex=None):
+        """
+        Atomically increments the numeric fields of 'self[key]' by the amounts in `increments`, and sets the fields
+        in `values`, with a single write; the document is created if it does not exist.
+        :param log_ex: if not None, also sets the 'exp' field as in set_with_expiry().
+        :return: the document as it was before the update, or None if it did not exist.
+        """
+        update = {'$inc': increments}
+        values = dict(values or {})
+        if log_ex is not None:
+            values['exp'] = self._get_exp(log_ex)
+        if values:
+            update['$set'] = values
+        return self._db.find_one_and_update(filter={'_id': key}, update=update, upsert=True)
+
+    def delete_many(self, filter_inp):
+        """Deletes all the documents matching the filter, `filter_inp`, and returns the number deleted."""
+        return self._db.delete_many(filter_inp).deleted_count
+
+    def watch_inserts(self, filter_inp, max_await=1):
+        """
+        Opens and returns a change stream of the documents matching the filter, `filter_inp`, inserted into the store
+        from now on; try_next() on the stream waits at most `max_await` seconds for the next insert. The caller must
+        close the stream. Change streams require Mongo to run as a replica set; pymongo raises an exception otherwise.
+        """
+        match = {'operationType': 'insert'}
+        for field, value in filter_inp.items():
+            match[f'fullDocument.{field}'] = value
+        return self._db.watch([{'$match': match}], max_await_time_ms=int(max_await * 1000))
+
     def aggregate(self, pipeline, options = None):
         return self._db.aggregate(pipeline, options)
 
+    def count(self, filter_inp):
+        """
+        Returns the number of documents matching the filter, `filter_inp`. Unlike len(), the count is exact; the
+        filter should be covered by an index.
+        """
+        return self._db.count_documents(filter_inp)
+
     def create_index(self, index_list):
-        return self._db.create_index(index_list)
\ No newline at end of file
+        return self._db.create_index(index_list)
+
+
+STORE_CACHE_HITS = Counter('abaco_store_cache_hits_total', 'Number of store reads served from the cache.', ['store'])
+STORE_CACHE_MISSES = Counter('abaco_store_cache_misses_total', 'Number of store reads that went to Mongo.', ['store'])
+STORE_CACHE_EVICTIONS = Counter('abaco_store_cache_evictions_total',
+                                'Number of documents dropped from the cache.', ['store', 'reason'])
+
+
+class CachedMongoStore(MongoStore):
+    """
+    MongoStore that keeps an in-process LRU cache of whole documents, for collections of mostly-static documents
+    that are read on hot paths (permissions, aliases, ...). Reads of 'self[key]' and 'self[key][field1][...]' are
+    served from the cached document (including documents that do not exist, so that missing keys are cached too).
+
+    Writes made through the store invalidate the key immediately. Writes made by other processes are picked up from
+    a MongoDB change stream watched by a background thread; entries then live for `ttl` seconds. Change streams
+    require Mongo to run as a replica set; when they are unavailable, entries only live for `fallback_ttl` seconds,
+    which bounds how stale a read can be.
+
+    Only the single-document methods are cached; items(), aggregate(), iteration, etc. always go to Mongo.
+    """
+
+    # seconds to wait before trying to open the change stream again after it failed.
+    WATCH_RETRY = 60
+
+    def __init__(self, host, port, database='abaco', db='0', user=None, password=None,
+                 ttl=300, fallback_ttl=2, max_size=1024, watch=True):
+        """
+        :param ttl: seconds a cached document lives while the change stream is open.
+        :param fallback_ttl: seconds a cached document lives when the change stream is unavailable.
+        :param max_size: maximum number of documents in the cache; the least recently used are evicted first.
+        :param watch: whether to invalidate the cache from a change stream.
+        """
+        super().__init__(host, port, database=database, db=db, user=user, password=password)
+        self.name = db
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.max_size = max_size
+        self.watch = watch
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # incremented on every invalidation so that a document read before an invalidation is not cached after it.
+        self._generation = 0
+        self._watcher = None
+        self._watcher_pid = None
+        self._watch_retry_at = 0
+        self.change_stream_open = False
+
+    # cache management -----
+
+    def invalidate(self, key):
+        """Drop `key` from the cache."""
+        with self._lock:
+            self._generation += 1
+            if self._cache.pop(key, None) is not None:
+                STORE_CACHE_EVICTIONS.labels(self.name, 'invalidated').inc()
+
+    def clear_cache(self):
+        """Drop all documents from the cache."""
+        with self._lock:
+            self._generation += 1
+            if self._cache:
+                STORE_CACHE_EVICTIONS.labels(self.name, 'invalidated').inc(len(self._cache))
+            self._cache.clear()
+
+    def _ensure_watcher(self):
+        """Start the change stream thread if it is not running in this process."""
+        if not self.watch:
+            return
+        if self._watcher_pid == os.getpid() and self._watcher.is_alive():
+            return
+        if time.monotonic() < self._watch_retry_at:
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid() and self._watcher.is_alive():
+                return
+            # a forked process does not inherit the parent's watcher thread, and the parent's cache can no longer be
+            # trusted.
+            if self._watcher_pid != os.getpid():
+                self._cache.clear()
+                self.change_stream_open = False
+            self._watch_retry_at = time.monotonic() + self.WATCH_RETRY
+            self._watcher_pid = os.getpid()
+            self._watcher = threading.Thread(target=self._watch_changes, daemon=True)
+            self._watcher.start()
+
+    def _watch_changes(self):
+        try:
+            with self._db.watch() as stream:
+                self.change_stream_open = True
+                logger.info(f"Cache for store {self.name} is watching the change stream.")
+                for change in stream:
+                    if 'documentKey' in change:
+                        self.invalidate(change['documentKey']['_id'])
+                    else:
+                        # drop, rename, invalidate, ...
+                        self.clear_cache()
+        except Exception as e:
+            logger.info(f"Change stream for store {self.name} is not available; cached documents will expire after "
+                        f"{self.fallback_ttl} seconds. Exception: {e}")
+        finally:
+            # documents cached while the stream was open were cached for the longer ttl.
+            self.change_stream_open = False
+            self.clear_cache()
+
+    def _get_doc(self, key):
+        """Return the document for `key` (without '_id'), or None if there is no such document."""
+        self._ensure_watcher()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                expires, doc = entry
+                if expires > now:
+                    self._cache.move_to_end(key)
+                    STORE_CACHE_HITS.labels(self.name).inc()
+                    return doc
+                del self._cache[key]
+                STORE_CACHE_EVICTIONS.labels(self.name, 'expired').inc()
+            generation = self._generation
+        STORE_CACHE_MISSES.labels(self.name).inc()
+        doc = self._db.find_one({'_id': key}, projection={'_id': False})
+        ttl = self.ttl if self.change_stream_open else self.fallback_ttl
+        with self._lock:
+            if generation == self._generation and ttl > 0:
+                self._cache[key] = (now + ttl, doc)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+                    STORE_CACHE_EVICTIONS.labels(self.name, 'size').inc()
+        return doc
+
+    def stats(self):
+        """Summary of the cache state for the current process."""
+        return {'store': self.name,
+                'size': len(self._cache),
+                'change_stream_open': self.change_stream_open}
+
+    # reads -----
+
+    def __getitem__(self, fields):
+        key, dots, path = self._process_inputs(fields)
+        doc = self._get_doc(key)
+        if doc is None:
+            raise KeyError(f"'_id' of '{key}' not found")
+        try:
+            return copy.deepcopy(path_accessor(path)(doc))
+        except (KeyError, TypeError):
+            raise KeyError(f"Subscript of {list(path)} does not exists in document of '_id' {key}")
+
+    def get_fields(self, key, fields):
+        if any('.' in field for field in fields):
+            return super().get_fields(key, fields)
+        doc = self._get_doc(key)
+        if doc is None:
+            raise KeyError(f"'_id' of '{key}' not found")
+        return {field: copy.deepcopy(doc[field]) for field in fields if field in doc}
+
+    # writes -----
+
+    def __setitem__(self, fields, value):
+        try:
+            super().__setitem__(fields, value)
+        finally:
+            self.invalidate(self._process_inputs(fields)[0])
+
+    def __delitem__(self, fields):
+        try:
+            super().__delitem__(fields)
+        finally:
+            self.invalidate(self._process_inputs(fields)[0])
+
+    def pop_field(self, fields):
+        try:
+            return super().pop_field(fields)
+        finally:
+            self.invalidate(self._process_inputs(fields)[0])
+
+    def set_with_expiry(self, fields, value, log_ex):
+        try:
+            super().set_with_expiry(fields, value, log_ex)
+        finally:
+            self.invalidate(self._process_inputs(fields)[0])
+
+    def set_fields(self, key, values, log_ex=None, unset=None):
+        try:
+            super().set_fields(key, values, log_ex=log_ex, unset=unset)
+        finally:
+            self.invalidate(key)
+
+    def getset(self, fields, value):
+        try:
+            return super().getset(fields, value)
+        finally:
+            self.invalidate(self._process_inputs(fields)[0])
+
+    def add_if_empty(self, fields, value):
+        try:
+            return super().add_if_empty(fields, value)
+        finally:
+            self.invalidate(self._process_inputs(fields)[0])
+
+    def insert_many(self, values, ordered=True, log_ex=None):
+        try:
+            return super().insert_many(values, ordered=ordered, log_ex=log_ex)
+        finally:
+            for key in values:
+                self.invalidate(key)
+
+    def full_update(self, key, value, upsert=False):
+        try:
+            return super().full_update(key, value, upsert=upsert)
+        finally:
+            # `key` is a filter and could match any document.
+            self.clear_cache()
+
+    def inc_fields(self, key, increments, values=None, log_ex=None):
+        try:
+            return super().inc_fields(key, increments, values=values, log_ex=log_ex)
+        finally:
+            self.invalidate(key)
+
+    def delete_many(self, filter_inp):
+        try:
+            return super().delete_many(filter_inp)
+        finally:
+            self.clear_cache()
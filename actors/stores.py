@@ -2,9 +2,9 @@ from functools import partial
 import os
 
 import configparser
-from pymongo import errors, TEXT
+from pymongo import errors, ASCENDING, TEXT
 
-from store import MongoStore
+from store import MongoStore, CachedMongoStore
 from config import Config
 
 from agaveflask.logs import get_logger
@@ -32,6 +32,25 @@ mongo_config_store = partial(
     user=mongo_user,
     password=mongo_password)
 
+
+
+def get_store_cache_setting(option, default):
+    """Integer settings for the stores that opt in to caching (see CachedMongoStore)."""
+    try:
+        return int(Config.get('store', option))
+    except:
+        return default
+
+# stores of mostly-static documents read on hot paths opt in to an in-process cache; see CachedMongoStore.
+cached_mongo_config_store = partial(
+    CachedMongoStore, Config.get('store', 'mongo_host'),
+    Config.getint('store', 'mongo_port'),
+    user=mongo_user,
+    password=mongo_password,
+    ttl=get_store_cache_setting('cache_ttl', 300),
+    fallback_ttl=get_store_cache_setting('cache_fallback_ttl', 2),
+    max_size=get_store_cache_setting('cache_max_size', 1024))
+
 logs_store = mongo_config_store(db='1')
 # create an expiry index for the log store if we want logs to expire
 log_ex = Config.get('web', 'log_ex')
@@ -54,20 +73,33 @@ except (ValueError, configparser.NoOptionError):
     logger.debug("53")
     pass
 
-permissions_store = mongo_config_store(db='2')
+permissions_store = cached_mongo_config_store(db='2')
 executions_store = mongo_config_store(db='3')
 clients_store = mongo_config_store(db='4')
 actors_store = mongo_config_store(db='5')
 workers_store = mongo_config_store(db='6')
 nonce_store = mongo_config_store(db='7')
-alias_store = mongo_config_store(db='8')
+alias_store = cached_mongo_config_store(db='8')
 pregen_clients = mongo_config_store(db='9')
 abaco_metrics_store = mongo_config_store(db='10')
 configs_store = mongo_config_store(db='11')
-configs_permissions_store = mongo_config_store(db='12')
+configs_permissions_store = cached_mongo_config_store(db='12')
 
 # Indexing
 logs_store.create_index([('$**', TEXT)])
 executions_store.create_index([('$**', TEXT)])
 actors_store.create_index([('$**', TEXT)])
-workers_store.create_index([('$**', TEXT)])
\ No newline at end of file
+workers_store.create_index([('$**', TEXT)])
+# execution logs are stored as chunks which are read by execution and offset:
+logs_store.create_index([('execution_id', ASCENDING), ('offset', ASCENDING)])
+# executions are summarized and paged by actor:
+executions_store.create_index([('actor_id', ASCENDING), ('message_received_time', ASCENDING), ('_id', ASCENDING)])
+# workers are listed and counted by actor:
+workers_store.create_index([('actor_id', ASCENDING)])
+# and counted by host by the spawners:
+workers_store.create_index([('host_id', ASCENDING)])
+# per-actor executions rollups are listed by type:
+abaco_metrics_store.create_index([('type', ASCENDING)])
+# aliases and configs are looked up by actor on every execution:
+alias_store.create_index([('actor_id', ASCENDING), ('tenant', ASCENDING)])
+configs_store.create_index([('tenant', ASCENDING), ('actors_list', ASCENDING)])
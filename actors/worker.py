@@ -11,7 +11,8 @@ import configparser
 from aga import Agave
 
 from auth import get_tenant_verify
-from channels import ActorMsgChannel, ClientsChannel, CommandChannel, WorkerChannel, SpawnerWorkerChannel
+from channels import ActorMsgChannel, ClientsChannel, CommandChannel, ExecutionCompleteChannel, WorkerChannel, \
+    SpawnerWorkerChannel
 from codes import SHUTDOWN_REQUESTED, SHUTTING_DOWN, ERROR, READY, BUSY, COMPLETE
 from config import Config
 from docker_utils import DockerError, DockerStartContainerError, DockerStopContainerError, execute_actor, pull_image
@@ -30,6 +31,148 @@ keep_running = True
 # maximum number of consecutive errors a worker can encounter before giving up and moving itself into an ERROR state.
 MAX_WORKER_CONSECUTIVE_ERRORS = 5
 
+
+class ActorCache(object):
+    """
+    Worker-local copy of the actor document. A worker processes every message for the same actor, so instead of
+    reading the full actor on each message, the copy is validated with a single read projecting the revision and
+    last_update_time fields (which change on every update of the actor) along with the actor's state (which is
+    updated on its own and passed to every execution). The full document is only re-read when the copy is stale.
+    """
+    VALIDATION_FIELDS = ['revision', 'last_update_time', 'state']
+
+    def __init__(self, actor_id):
+        self.actor_id = actor_id
+        self._doc = None
+        self.log_ex = None
+        self.refreshes = 0
+
+    def _is_stale(self, fields):
+        if self._doc is None:
+            return True
+        return self._doc.get('revision') != fields.get('revision') or \
+               self._doc.get('last_update_time') != fields.get('last_update_time')
+
+    def get(self):
+        """
+        Return an Actor object for this worker's actor. The Actor is a copy, so callers can modify its attributes
+        (e.g., append to mounts) without affecting the cache.
+        """
+        fields = actors_store.get_fields(self.actor_id, self.VALIDATION_FIELDS)
+        if self._is_stale(fields):
+            self._doc = actors_store[self.actor_id]
+            self.refreshes += 1
+            actor = Actor.from_db(copy.deepcopy(self._doc))
+            self.log_ex = Actor.get_actor_log_ttl(self.actor_id, actor=actor)
+            logger.debug(f"actor cache refreshed; actor_id: {self.actor_id}; refreshes: {self.refreshes}")
+            return actor
+        doc = copy.deepcopy(self._doc)
+        doc['state'] = fields.get('state', {})
+        return Actor.from_db(doc)
+
+
+def get_concurrency(actor):
+    """Returns the number of executions each worker of the actor runs at the same time: the actor's concurrency if
+    set, otherwise 1."""
+    try:
+        return max(int(actor.get('concurrency') or 1), 1)
+    except (TypeError, ValueError):
+        logger.error("concurrency defined for actor_id {} but could not cast to int. "
+                     "concurrency: {}".format(actor.get('id'), actor.get('concurrency')))
+        return 1
+
+
+class ExecutionSlots(object):
+    """
+    Execution slots of a worker. A worker runs up to its actor's concurrency executions at the same time; each slot
+    consumes the actor's messages on a channel of its own and runs their executions one at a time, so that messages
+    are only acknowledged from the thread that consumed them. The worker is BUSY while any of its slots is running an
+    execution and READY otherwise; workers with more than one slot also keep the execution id (or None) of each slot
+    in the `slots` field of the worker.
+    """
+
+    def __init__(self, actor_id, worker_id, concurrency=1):
+        self.actor_id = actor_id
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.executions = [None] * concurrency
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        # consecutive_errors tracks the number of consecutive times the worker has gotten an error trying to process
+        # a message. Even though the message will be requeued, we do not want the worker to continue processing
+        # indefinitely when a compute node is unhealthy.
+        self.consecutive_errors = 0
+        # set by a slot when the worker must stop processing messages; `error` is the exception to re-raise, if any.
+        self.stop = False
+        self.error = None
+
+    def _update_slots(self):
+        if self.concurrency > 1:
+            Worker.update_worker_slots(self.actor_id, self.worker_id,
+                                       [{'slot': slot, 'execution_id': execution_id}
+                                        for slot, execution_id in enumerate(self.executions)])
+
+    def ready(self):
+        """Set the worker and all of its slots to READY."""
+        with self._lock:
+            Worker.update_worker_status(self.actor_id, self.worker_id, READY)
+            self._update_slots()
+
+    def start(self, slot, execution_id):
+        """Mark `slot` as running `execution_id`; the worker becomes BUSY with its first running execution."""
+        with self._lock:
+            if not any(self.executions):
+                Worker.update_worker_status(self.actor_id, self.worker_id, BUSY)
+            self.executions[slot] = execution_id or True
+            self._update_slots()
+
+    def force_quit(self, execution_id):
+        """Ask execute_actor() to halt `execution_id`; returns False, without doing so, if no slot is running it."""
+        with self._lock:
+            if execution_id not in self.executions:
+                return False
+            globals.force_quit_executions.add(execution_id)
+            return True
+
+    def release(self, slot):
+        """Free `slot`; the worker goes back to READY once none of its slots is running an execution."""
+        with self._lock:
+            # a force_quit for the execution that arrived after it finished must not linger.
+            globals.force_quit_executions.discard(self.executions[slot])
+            self.executions[slot] = None
+            try:
+                if not any(self.executions):
+                    Worker.update_worker_status(self.actor_id, self.worker_id, READY)
+                self._update_slots()
+            except Exception as e:
+                logger.error(f"worker {self.worker_id} got exception updating the status of slot {slot}; e: {e}")
+
+    def run(self, target):
+        """
+        Run `target(slot)` for each slot: in the calling thread when the concurrency is 1, otherwise in a fixed pool
+        of one thread per slot. Returns once a slot stops; the exception of a slot that failed is re-raised, so that
+        the worker shuts itself down just as when the execution runs in the main thread.
+        """
+        if self.concurrency == 1:
+            target(0)
+            return
+
+        def _run(slot):
+            try:
+                target(slot)
+            except Exception as e:
+                logger.error(f"worker {self.worker_id} got exception in slot {slot}; e: {e}")
+                self.error = e
+            finally:
+                self.stop = True
+                self._stopped.set()
+        for slot in range(self.concurrency):
+            threading.Thread(target=_run, args=(slot,), daemon=True).start()
+        self._stopped.wait()
+        if self.error:
+            raise self.error
+
+
 def shutdown_worker(actor_id, worker_id, delete_actor_ch=True):
     """Gracefully shutdown a single worker."
     actor_id (str) - the dbid of the associated actor.
@@ -68,7 +211,7 @@ def shutdown_workers(actor_id, delete_actor_ch=True):
         shutdown_worker(actor_id, worker['id'], delete_actor_ch)
 
 
-def process_worker_ch(tenant, worker_ch, actor_id, worker_id, actor_ch, ag_client):
+def process_worker_ch(tenant, worker_ch, actor_id, worker_id, actor_ch, ag_client, slots):
     """ Target for a thread to listen on the worker channel for a message to stop processing.
     :param worker_ch:
     :return:
@@ -104,6 +247,16 @@ def process_worker_ch(tenant, worker_ch, actor_id, worker_id, actor_ch, ag_clien
             globals.force_quit = True
             globals.keep_running = False
 
+        elif isinstance(msg, dict) and msg.get('command') == 'force_quit':
+            # force quit a single execution; the other executions running on the worker are not affected.
+            execution_id = msg.get('execution_id')
+            if slots.force_quit(execution_id):
+                logger.info("Worker with worker_id: {} (actor_id: {}) received a force_quit message for execution "
+                            "{}, forcing the execution to halt...".format(worker_id, actor_id, execution_id))
+            else:
+                logger.info("Worker with worker_id: {} (actor_id: {}) received a force_quit message for execution "
+                            "{}, which it is not running; ignoring.".format(worker_id, actor_id, execution_id))
+
         elif msg == 'stop' or msg == 'stop-no-delete':
             logger.info("Worker with worker_id: {} (actor_id: {}) received stop message, "
                         "stopping worker...".format(worker_id, actor_id))
@@ -233,340 +386,375 @@ def subscribe(tenant,
     else:
         logger.info("Not creating agave client.")
 
+    # worker-local copy of the actor; see ActorCache
+    actor_cache = ActorCache(actor_id)
+
+    # the worker runs up to the actor's concurrency executions at the same time; see ExecutionSlots
+    slots = ExecutionSlots(actor_id, worker_id, get_concurrency(actor_cache.get()))
+
     # start a separate thread for handling messages sent to the worker channel ----
     logger.info("Starting the process worker channel thread.")
     t = threading.Thread(target=process_worker_ch,
-                         args=(tenant, worker_ch, actor_id, worker_id, actor_ch, ag),
+                         args=(tenant, worker_ch, actor_id, worker_id, actor_ch, ag, slots),
                          daemon=True)
     t.start()
 
-    # subscribe to the actor message queue -----
-    logger.info("Worker subscribing to actor channel. worker_id: {}".format(worker_id))
-    # keep track of whether we need to update the worker's status back to READY; otherwise, we
-    # will hit redis with an UPDATE every time the subscription loop times out (i.e., every 2s)
-    update_worker_status = True
-
     # global tracks whether this worker should keep running.
     globals.keep_running = True
 
-    # consecutive_errors tracks the number of consecutive times a worker has gotten an error trying to process a
-    # message. Even though the message will be requeued, we do not want the worker to continue processing
-    # indefinitely when a compute node is unhealthy.
-    consecutive_errors = 0
-
-    # main subscription loop -- processing messages from actor's mailbox
-    while globals.keep_running:
-        logger.debug("top of keep_running; worker id: {}".format(worker_id))
-        if update_worker_status:
-            Worker.update_worker_status(actor_id, worker_id, READY)
-            logger.debug("updated worker status to READY in SUBSCRIBE; worker id: {}".format(worker_id))
-            update_worker_status = False
-
-        # note: the following get_one() call blocks until a message is returned. this means it could be a long time
-        # (i.e., many seconds, or even minutes) between the check above to globals.keep_running (line 252) and the
-        # get_one() function returning. In this time, the worker channel thread could have received a stop. We need to
-        # check this.
-        try:
-            msg, msg_obj = actor_ch.get_one()
-        except channelpy.ChannelClosedException:
-            logger.info("Channel closed, worker exiting. worker id: {}".format(worker_id))
-            globals.keep_running = False
-            sys.exit()
-        logger.info("worker {} processing new msg.".format(worker_id))
-
-        # worker ch thread has received a stop and is already shutting us down (see note above); we need to nack this
-        # message and exit
-        if not globals.keep_running:
-            logger.info("got msg from get_one() but globals.keep_running was False! "
-                        "Requeing message and worker will exit. {}+{}".format(actor_id, worker_id))
-            msg_obj.nack(requeue=True)
-            logger.info("message requeued; worker exiting:{}_{}".format(actor_id, worker_id))
-            time.sleep(5)
-            raise Exception()
-        # if the actor revision is different from the revision assigned to this worker, the worker is stale, so we
-        # need to nack this message and exit.
-        # NOTE: we could also compare the worker's revision to the revision contained in the message itself so that
-        # a given message was always processed by a worker of the same revision, but this would take more work and is
-        # not the requirement.
-        try:
-            actor = Actor.from_db(actors_store[actor_id])
-        except Exception as e:
-            logger.error("unexpected exception retrieving actor to check revision. Nacking message."
-                         "actor_id: {}; worker_id: {}; status: {}; exception: {}".format(actor_id,
-                                                                                         worker_id,
-                                                                                         READY,
-                                                                                         e))
-            msg_obj.nack(requeue=True)
-            logger.info("worker exiting. worker_id: {}".format(worker_id))
-            raise e
-        if not revision == actor.revision:
-            logger.info(f"got msg from get_one() but worker's revision ({revision}) was different "
-                        f"from actor.revision ({actor.revision}). Requeing message and worker will "
-                        f"exit. {actor_id}+{worker_id}")
-            msg_obj.nack(requeue=True)
-            logger.info("message requeued; worker exiting:{}_{}".format(actor_id, worker_id))
-            time.sleep(5)
-            raise Exception()
-
-        try:
-            Worker.update_worker_status(actor_id, worker_id, BUSY)
-        except Exception as e:
-            logger.error("unexpected exception from call to update_worker_status. Nacking message."
-                         "actor_id: {}; worker_id: {}; status: {}; exception: {}".format(actor_id,
-                                                                                         worker_id,
-                                                                                         BUSY,
-                                                                                         e))
-            logger.info("worker exiting. {}_{}".format(actor_id, worker_id))
-            msg_obj.nack(requeue=True)
-            raise e
-        update_worker_status = True
-        logger.info("Received message {}. Starting actor container. worker id: {}".format(msg, worker_id))
-        # the msg object is a dictionary with an entry called message and an arbitrary
-        # set of k:v pairs coming in from the query parameters.
-        message = msg.pop('message', '')
-        try:
-            execution_id = msg['_abaco_execution_id']
-            content_type = msg['_abaco_Content_Type']
-            mounts = actor.mounts
-            logger.debug("actor mounts: {}".format(mounts))
-        except Exception as e:
-            logger.error("unexpected exception retrieving execution, content-type, mounts. Nacking message."
-                         "actor_id: {}; worker_id: {}; status: {}; exception: {}".format(actor_id,
-                                                                                         worker_id,
-                                                                                         BUSY,
-                                                                                         e))
-            msg_obj.nack(requeue=True)
-            logger.info("worker exiting. worker_id: {}".format(worker_id))
-            raise e
-
-        # for results, create a socket in the configured directory.
-        try:
-            socket_host_path_dir = Config.get('workers', 'socket_host_path_dir')
-        except (configparser.NoSectionError, configparser.NoOptionError) as e:
-            logger.error("No socket_host_path configured. Cannot manage results data. Nacking message")
-            Actor.set_status(actor_id, ERROR, status_message="Abaco instance not configured for results data.")
-            msg_obj.nack(requeue=True)
-            logger.info("worker exiting. worker_id: {}".format(worker_id))
-            raise e
-        socket_host_path = '{}.sock'.format(os.path.join(socket_host_path_dir, worker_id, execution_id))
-        logger.info("Create socket at path: {}".format(socket_host_path))
-        # add the socket as a mount:
-        mounts.append({'host_path': socket_host_path,
-                       'container_path': '/_abaco_results.sock',
-                       'format': 'ro'})
-        # for binary data, create a fifo in the configured directory. The configured
-        # fifo_host_path_dir is equal to the fifo path in the worker container:
-        fifo_host_path = None
-        if content_type == 'application/octet-stream':
+    slots.ready()
+    logger.debug("updated worker status to READY in SUBSCRIBE; worker id: {}".format(worker_id))
+
+    def consume_slot(slot):
+        """Subscription loop of a slot -- processing messages from actor's mailbox one at a time."""
+        # subscribe to the actor message queue -----
+        # each slot keeps a single consumer open on its own channel for the life of the worker, with a prefetch of
+        # one message, so that the broker never hands this worker more messages than it has slots to run them in.
+        ch = actor_ch if slot == 0 else ActorMsgChannel(actor_id)
+        msgs = ch.consume(prefetch=1)
+        while globals.keep_running and not slots.stop:
+            logger.debug("top of keep_running; worker id: {}; slot: {}".format(worker_id, slot))
+
+            # note: the following next() call blocks until a message is returned. this means it could be a long time
+            # (i.e., many seconds, or even minutes) between the check above to globals.keep_running and the
+            # next() call returning. In this time, the worker channel thread could have received a stop, or another
+            # slot could have stopped the worker. We need to check this.
+            try:
+                msg, msg_obj = next(msgs)
+            except (channelpy.ChannelClosedException, StopIteration):
+                logger.info("Channel closed, worker exiting. worker id: {}".format(worker_id))
+                globals.keep_running = False
+                sys.exit()
+            logger.info("worker {} processing new msg in slot {}.".format(worker_id, slot))
+
+            # worker ch thread has received a stop and is already shutting us down (see note above); we need to nack
+            # this message and exit
+            if not globals.keep_running:
+                logger.info("got msg from consume() but globals.keep_running was False! "
+                            "Requeing message and worker will exit. {}+{}".format(actor_id, worker_id))
+                msg_obj.nack(requeue=True)
+                logger.info("message requeued; worker exiting:{}_{}".format(actor_id, worker_id))
+                time.sleep(5)
+                raise Exception()
+            # another slot stopped the worker (see note above); the message is requeued for the other workers.
+            if slots.stop:
+                logger.info("got msg from consume() but the worker is stopping. "
+                            "Requeing message. {}+{}".format(actor_id, worker_id))
+                msg_obj.nack(requeue=True)
+                return
+            # if the actor revision is different from the revision assigned to this worker, the worker is stale, so we
+            # need to nack this message and exit.
+            # NOTE: we could also compare the worker's revision to the revision contained in the message itself so
+            # that a given message was always processed by a worker of the same revision, but this would take more
+            # work and is not the requirement.
             try:
-                fifo_host_path_dir = Config.get('workers', 'fifo_host_path_dir')
-            except (configparser.NoSectionError, configparser.NoOptionError) as e:
-                logger.error("No fifo_host_path configured. Cannot manage binary data.")
-                Actor.set_status(actor_id, ERROR, status_message="Abaco instance not configured for binary data. Nacking message.")
+                actor = actor_cache.get()
+            except Exception as e:
+                logger.error("unexpected exception retrieving actor to check revision. Nacking message."
+                             "actor_id: {}; worker_id: {}; status: {}; exception: {}".format(actor_id,
+                                                                                             worker_id,
+                                                                                             READY,
+                                                                                             e))
                 msg_obj.nack(requeue=True)
                 logger.info("worker exiting. worker_id: {}".format(worker_id))
                 raise e
-            fifo_host_path = os.path.join(fifo_host_path_dir, worker_id, execution_id)
+            if not revision == actor.revision:
+                logger.info(f"got msg from consume() but worker's revision ({revision}) was different "
+                            f"from actor.revision ({actor.revision}). Requeing message and worker will "
+                            f"exit. {actor_id}+{worker_id}")
+                msg_obj.nack(requeue=True)
+                logger.info("message requeued; worker exiting:{}_{}".format(actor_id, worker_id))
+                time.sleep(5)
+                raise Exception()
+
             try:
-                os.mkfifo(fifo_host_path)
-                logger.info("Created fifo at path: {}".format(fifo_host_path))
+                slots.start(slot, msg.get('_abaco_execution_id'))
             except Exception as e:
-                logger.error("Could not create fifo_path. Nacking message. Exception: {}".format(e))
+                logger.error("unexpected exception from call to update_worker_status. Nacking message."
+                             "actor_id: {}; worker_id: {}; status: {}; exception: {}".format(actor_id,
+                                                                                             worker_id,
+                                                                                             BUSY,
+                                                                                             e))
+                logger.info("worker exiting. {}_{}".format(actor_id, worker_id))
                 msg_obj.nack(requeue=True)
-                logger.info("worker exiting. worker_id: {}".format(worker_id))
                 raise e
-            # add the fifo as a mount:
-            mounts.append({'host_path': fifo_host_path,
-                           'container_path': '/_abaco_binary_data',
-                           'format': 'ro'})
-
-        # the execution object was created by the controller, but we need to add the worker id to it now that we
-        # know which worker will be working on the execution.
-        logger.debug(f"Adding worker_id to execution. worker_id: {worker_id}")
+            logger.info("Received message {}. Starting actor container. worker id: {}".format(msg, worker_id))
+            try:
+                if process_message(tenant, actor_id, worker_id, image, msg, msg_obj, actor, actor_cache, slots,
+                                   leave_containers, mem_limit, max_cpus, ag, client_id, client_secret):
+                    slots.stop = True
+            finally:
+                slots.release(slot)
+
+    slots.run(consume_slot)
+    logger.info("global.keep_running no longer true. worker is now exited. worker id: {}".format(worker_id))
+
+
+def notify_complete(actor_id, execution_id, msg, status):
+    """
+    Announce the final `status` of a synchronous execution on its reply queue, where the API request that sent the
+    message is waiting for it.
+    """
+    if not str(msg.get('_abaco_synchronous', '')).lower() == 'true':
+        return
+    try:
+        ch = ExecutionCompleteChannel(actor_id, execution_id)
+        ch.put_complete(status)
+        ch.close()
+    except Exception as e:
+        logger.error(f"Could not publish the completion of synchronous execution {execution_id}; e: {e}")
+
+
+def process_message(tenant, actor_id, worker_id, image, msg, msg_obj, actor, actor_cache, slots, leave_containers,
+                    mem_limit, max_cpus, ag, client_id, client_secret):
+    """
+    Run the execution for a single message from the actor's mailbox and finalize it. Runs in one of the worker's
+    execution slots; each execution gets its own results socket (and FIFO, for binary messages) named after the
+    execution id, so executions running in other slots do not interfere with it.
+    :return: True if the worker should stop processing messages.
+    """
+
+    message = msg.pop('message', '')
+    try:
+        execution_id = msg['_abaco_execution_id']
+        content_type = msg['_abaco_Content_Type']
+        mounts = actor.mounts
+        logger.debug("actor mounts: {}".format(mounts))
+    except Exception as e:
+        logger.error("unexpected exception retrieving execution, content-type, mounts. Nacking message."
+                     "actor_id: {}; worker_id: {}; status: {}; exception: {}".format(actor_id,
+                                                                                     worker_id,
+                                                                                     BUSY,
+                                                                                     e))
+        msg_obj.nack(requeue=True)
+        logger.info("worker exiting. worker_id: {}".format(worker_id))
+        raise e
+
+    # for results, create a socket in the configured directory.
+    try:
+        socket_host_path_dir = Config.get('workers', 'socket_host_path_dir')
+    except (configparser.NoSectionError, configparser.NoOptionError) as e:
+        logger.error("No socket_host_path configured. Cannot manage results data. Nacking message")
+        Actor.set_status(actor_id, ERROR, status_message="Abaco instance not configured for results data.")
+        msg_obj.nack(requeue=True)
+        logger.info("worker exiting. worker_id: {}".format(worker_id))
+        raise e
+    # the fifo and socket directories of a worker bound from a warm pool are named after the warm worker's id.
+    ipc_id = os.environ.get('ipc_id') or worker_id
+    socket_host_path = '{}.sock'.format(os.path.join(socket_host_path_dir, ipc_id, execution_id))
+    logger.info("Create socket at path: {}".format(socket_host_path))
+    # add the socket as a mount:
+    mounts.append({'host_path': socket_host_path,
+                   'container_path': '/_abaco_results.sock',
+                   'format': 'ro'})
+    # for binary data, create a fifo in the configured directory. The configured
+    # fifo_host_path_dir is equal to the fifo path in the worker container:
+    fifo_host_path = None
+    if content_type == 'application/octet-stream':
         try:
-            Execution.add_worker_id(actor_id, execution_id, worker_id)
+            fifo_host_path_dir = Config.get('workers', 'fifo_host_path_dir')
+        except (configparser.NoSectionError, configparser.NoOptionError) as e:
+            logger.error("No fifo_host_path configured. Cannot manage binary data.")
+            Actor.set_status(actor_id, ERROR, status_message="Abaco instance not configured for binary data. Nacking message.")
+            msg_obj.nack(requeue=True)
+            logger.info("worker exiting. worker_id: {}".format(worker_id))
+            raise e
+        fifo_host_path = os.path.join(fifo_host_path_dir, ipc_id, execution_id)
+        try:
+            os.mkfifo(fifo_host_path)
+            logger.info("Created fifo at path: {}".format(fifo_host_path))
         except Exception as e:
-            logger.error("Unexpected exception adding working_id to the Execution. Nacking message. Exception: {}".format(e))
+            logger.error("Could not create fifo_path. Nacking message. Exception: {}".format(e))
             msg_obj.nack(requeue=True)
             logger.info("worker exiting. worker_id: {}".format(worker_id))
             raise e
+        # add the fifo as a mount:
+        mounts.append({'host_path': fifo_host_path,
+                       'container_path': '/_abaco_binary_data',
+                       'format': 'ro'})
 
-        # privileged dictates whether the actor container runs in privileged mode and if docker daemon is mounted.
-        privileged = False
-        if type(actor['privileged']) == bool and actor['privileged']:
-            privileged = True
-        logger.debug("privileged: {}; worker_id: {}".format(privileged, worker_id))
-
-        # overlay resource limits if set on actor:
-        if actor.mem_limit:
-            mem_limit = actor.mem_limit
-        if actor.max_cpus:
-            max_cpus = actor.max_cpus
-
-        # retrieve the default environment registered with the actor.
-        environment = actor['default_environment']
-        logger.debug("Actor default environment: {}".format(environment))
-
-        # construct the user field from the actor's uid and gid:
-        user = get_container_user(actor)
-        logger.debug("Final user valiue: {}".format(user))
-        # overlay the default_environment registered for the actor with the msg
-        # dictionary
-        environment.update(msg)
-        environment['_abaco_access_token'] = ''
-        environment['_abaco_actor_dbid'] = actor_id
-        environment['_abaco_actor_id'] = actor.id
-        environment['_abaco_worker_id'] = worker_id
-        environment['_abaco_container_repo'] = actor.image
-        environment['_abaco_actor_state'] = actor.state
-        environment['_abaco_actor_name'] = actor.name or 'None'
-        logger.debug("Overlayed environment: {}; worker_id: {}".format(environment, worker_id))
-
-        # if we have an agave client, get a fresh set of tokens:
-        if ag:
-            need_to_refresh = True
-            refresh_attempts = 0
-            while need_to_refresh and refresh_attempts < 10:
-                refresh_attempts = refresh_attempts + 1
-                logger.debug("About to try and refreh the token; "
-                             "attempt number: {}; {}_{}".format(refresh_attempts, actor_id, worker_id))
+    # the execution object was created by the controller, but we need to add the worker id to it now that we
+    # know which worker will be working on the execution.
+    logger.debug(f"Adding worker_id to execution. worker_id: {worker_id}")
+    try:
+        Execution.add_worker_id(actor_id, execution_id, worker_id)
+    except Exception as e:
+        logger.error("Unexpected exception adding working_id to the Execution. Nacking message. Exception: {}".format(e))
+        msg_obj.nack(requeue=True)
+        logger.info("worker exiting. worker_id: {}".format(worker_id))
+        raise e
+
+    # privileged dictates whether the actor container runs in privileged mode and if docker daemon is mounted.
+    privileged = False
+    if type(actor['privileged']) == bool and actor['privileged']:
+        privileged = True
+    logger.debug("privileged: {}; worker_id: {}".format(privileged, worker_id))
+
+    # overlay resource limits if set on actor:
+    if actor.mem_limit:
+        mem_limit = actor.mem_limit
+    if actor.max_cpus:
+        max_cpus = actor.max_cpus
+
+    # retrieve the default environment registered with the actor.
+    environment = actor['default_environment']
+    logger.debug("Actor default environment: {}".format(environment))
+
+    # construct the user field from the actor's uid and gid:
+    user = get_container_user(actor)
+    logger.debug("Final user valiue: {}".format(user))
+    # overlay the default_environment registered for the actor with the msg
+    # dictionary
+    environment.update(msg)
+    environment['_abaco_access_token'] = ''
+    environment['_abaco_actor_dbid'] = actor_id
+    environment['_abaco_actor_id'] = actor.id
+    environment['_abaco_worker_id'] = worker_id
+    environment['_abaco_container_repo'] = actor.image
+    environment['_abaco_actor_state'] = actor.state
+    environment['_abaco_actor_name'] = actor.name or 'None'
+    logger.debug("Overlayed environment: {}; worker_id: {}".format(environment, worker_id))
+
+    # if we have an agave client, get a fresh set of tokens:
+    if ag:
+        need_to_refresh = True
+        refresh_attempts = 0
+        while need_to_refresh and refresh_attempts < 10:
+            refresh_attempts = refresh_attempts + 1
+            logger.debug("About to try and refreh the token; "
+                         "attempt number: {}; {}_{}".format(refresh_attempts, actor_id, worker_id))
+            try:
+                ag.token.refresh()
+                token = ag.token.token_info['access_token']
+                environment['_abaco_access_token'] = token
+                logger.info("Refreshed the tokens. Passed {} to the environment.".format(token))
+                need_to_refresh = False
+            except Exception as e:
+                logger.error("Got an exception trying to get an access token. Attempt number {} "
+                             "Exception: {}; actor_id: {}; worker_id: {}; execution_id: {}; client_id: {}; "
+                             "client_secret: {}".format(refresh_attempts, e, actor_id, worker_id, execution_id, client_id, client_secret))
+                # try to log the raw response; it is possible the exception object, e, will not have a response object
+                # on it, for instance if one of the other lines above caused the exception.
                 try:
-                    ag.token.refresh()
-                    token = ag.token.token_info['access_token']
-                    environment['_abaco_access_token'] = token
-                    logger.info("Refreshed the tokens. Passed {} to the environment.".format(token))
-                    need_to_refresh = False
-                except Exception as e:
-                    logger.error("Got an exception trying to get an access token. Attempt number {} "
-                                 "Exception: {}; actor_id: {}; worker_id: {}; execution_id: {}; client_id: {}; "
-                                 "client_secret: {}".format(refresh_attempts, e, actor_id, worker_id, execution_id, client_id, client_secret))
-                    # try to log the raw response; it is possible the exception object, e, will not have a response object
-                    # on it, for instance if one of the other lines above caused the exception.
-                    try:
-                        logger.error("content from response: {}".format(e.response.content))
-                    except Exception as e2:
-                        logger.error("got exception trying to log response content: {}".format(e2))
-                    # we hit the limit; give up, nack the message and raise an exception (which will put the actor in
-                    # ERROR state).
-                    if refresh_attempts == 10:
-                        msg_obj.nack(requeue=True)
-                        logger.info("worker exiting. worker_id: {}".format(worker_id))
-                        raise e
-                    else:
-                        # otherwise, wait 2 seconds and then try again:
-                        time.sleep(2)
-        else:
-            logger.info("Agave client `ag` is None -- not passing access token; worker_id: {}".format(worker_id))
-        logger.info("Passing update environment: {}".format(environment))
-        logger.info("About to execute actor; worker_id: {}".format(worker_id))
-        try:
-            stats, logs, final_state, exit_code, start_time = execute_actor(actor_id,
-                                                                            worker_id,
-                                                                            execution_id,
-                                                                            image,
-                                                                            message,
-                                                                            user,
-                                                                            environment,
-                                                                            privileged,
-                                                                            mounts,
-                                                                            leave_containers,
-                                                                            fifo_host_path,
-                                                                            socket_host_path,
-                                                                            mem_limit,
-                                                                            max_cpus,
-                                                                            tenant)
-        except DockerStartContainerError as e:
-            logger.error("Worker {} got DockerStartContainerError: {} trying to start actor for execution {}."
-                         "Placing message back on queue.".format(worker_id, e, execution_id))
-            # if we failed to start the actor container, we leave the worker up and re-queue the original message
-            msg_obj.nack(requeue=True)
-            logger.debug('message requeued.')
-            consecutive_errors += 1
-            if consecutive_errors > MAX_WORKER_CONSECUTIVE_ERRORS:
-                logger.error("Worker {} failed to successfully start actor for execution {} {} consecutive times; "
-                             "Exception: {}. Putting the actor in error status and shutting "
-                             "down workers.".format(worker_id, execution_id, MAX_WORKER_CONSECUTIVE_ERRORS, e))
-                Actor.set_status(actor_id, ERROR, "Error executing container: {}; w".format(e))
-                shutdown_workers(actor_id, delete_actor_ch=False)
-                Execution.update_status(actor_id, execution_id, ERROR)
-                # wait for worker to be shutdown..
-                time.sleep(60)
-                break
-            else:
-                # sleep five seconds before getting a message again to give time for the compute
-                # node and/or docker health to recover
-                time.sleep(5)
-                continue
-        except DockerStopContainerError as e:
-            logger.error("Worker {} was not able to stop actor for execution: {}; Exception: {}. "
-                         "Putting the actor in error status and shutting down workers.".format(worker_id, execution_id, e))
-            Actor.set_status(actor_id, ERROR, "Error executing container: {}".format(e))
-            # since the error was with stopping the actor, we will consider this message "processed"; this choice
-            # could be reconsidered/changed
-            msg_obj.ack()
-            Execution.update_status(actor_id, execution_id, ERROR)
+                    logger.error("content from response: {}".format(e.response.content))
+                except Exception as e2:
+                    logger.error("got exception trying to log response content: {}".format(e2))
+                # we hit the limit; give up, nack the message and raise an exception (which will put the actor in
+                # ERROR state).
+                if refresh_attempts == 10:
+                    msg_obj.nack(requeue=True)
+                    logger.info("worker exiting. worker_id: {}".format(worker_id))
+                    raise e
+                else:
+                    # otherwise, wait 2 seconds and then try again:
+                    time.sleep(2)
+    else:
+        logger.info("Agave client `ag` is None -- not passing access token; worker_id: {}".format(worker_id))
+    logger.info("Passing update environment: {}".format(environment))
+    logger.info("About to execute actor; worker_id: {}".format(worker_id))
+    try:
+        stats, final_state, exit_code, start_time = execute_actor(actor_id,
+                                                                  worker_id,
+                                                                  execution_id,
+                                                                  image,
+                                                                  message,
+                                                                  user,
+                                                                  environment,
+                                                                  privileged,
+                                                                  mounts,
+                                                                  leave_containers,
+                                                                  fifo_host_path,
+                                                                  socket_host_path,
+                                                                  mem_limit,
+                                                                  max_cpus,
+                                                                  tenant,
+                                                                  actor_cache.log_ex)
+    except DockerStartContainerError as e:
+        logger.error("Worker {} got DockerStartContainerError: {} trying to start actor for execution {}."
+                     "Placing message back on queue.".format(worker_id, e, execution_id))
+        # if we failed to start the actor container, we leave the worker up and re-queue the original message
+        msg_obj.nack(requeue=True)
+        logger.debug('message requeued.')
+        slots.consecutive_errors += 1
+        if slots.consecutive_errors > MAX_WORKER_CONSECUTIVE_ERRORS:
+            logger.error("Worker {} failed to successfully start actor for execution {} {} consecutive times; "
+                         "Exception: {}. Putting the actor in error status and shutting "
+                         "down workers.".format(worker_id, execution_id, MAX_WORKER_CONSECUTIVE_ERRORS, e))
+            Actor.set_status(actor_id, ERROR, "Error executing container: {}; w".format(e))
             shutdown_workers(actor_id, delete_actor_ch=False)
-            # wait for worker to be shutdown..
-            time.sleep(60)
-            break
-        except Exception as e:
-            logger.error(f"Worker {worker_id} got an unexpected exception trying to run actor for execution: {execution_id}."
-                         "Putting the actor in error status and shutting down workers. "
-                         f"Exception: {e}; Exception type: {type(e)}")
-            # updated 2/2021 -- we no longer set the actor to ERROR state for unrecognized exceptions. Most of the time
-            # these exceptions are due to internal system errors, such as not being able to talk eo RabbitMQ or getting
-            # socket timeouts from docker. these are not the fault of the actor, and putting it (but not other actors
-            # who simply didn't happen to be executing at the time) in ERROR state is confusing to users and leads to
-            # actors not procssing messages until the user notices and intervenes.
-            # # # # # # # Actor.set_status(actor_id, ERROR, "Error executing container: {}".format(e))
-
-            # the execute_actor function raises a DockerStartContainerError if it met an exception before starting the
-            # actor container; if the container was started, then another exception should be raised. Therefore,
-            # we can assume here that the container was at least started and we can ack the message.
-            msg_obj.ack()
             Execution.update_status(actor_id, execution_id, ERROR)
-            shutdown_workers(actor_id, delete_actor_ch=False)
+            notify_complete(actor_id, execution_id, msg, ERROR)
             # wait for worker to be shutdown..
             time.sleep(60)
-            break
-        # ack the message
+            return True
+        else:
+            # sleep five seconds before getting a message again to give time for the compute
+            # node and/or docker health to recover
+            time.sleep(5)
+            return False
+    except DockerStopContainerError as e:
+        logger.error("Worker {} was not able to stop actor for execution: {}; Exception: {}. "
+                     "Putting the actor in error status and shutting down workers.".format(worker_id, execution_id, e))
+        Actor.set_status(actor_id, ERROR, "Error executing container: {}".format(e))
+        # since the error was with stopping the actor, we will consider this message "processed"; this choice
+        # could be reconsidered/changed
         msg_obj.ack()
-
-        # Add the logs to the execution before finalizing it -- otherwise, there is a race condition for clients
-        # waiting on the execution to be COMPLETE and then immediately retrieving the logs.
-        try:
-            logger.debug("Checking for get_actor_log_ttl")
-            log_ex = Actor.get_actor_log_ttl(actor_id)
-            logger.debug("log ex is {log_ex}")
-            Execution.set_logs(execution_id, logs, actor_id, tenant, worker_id, log_ex)
-            logger.debug(f"Successfully added execution logs of expiry {log_ex}.")
-        except Exception as e:
-            msg = "Got exception trying to set logs for exception {}; " \
-                  "Exception: {}; worker_id: {}".format(execution_id, e, worker_id)
-            logger.error(msg)
-
-        logger.debug("container finished successfully; worker_id: {}".format(worker_id))
-        # Add the completed stats to the execution
-        logger.info("Actor container finished successfully. Got stats object:{}".format(str(stats)))
-        Execution.finalize_execution(actor_id, execution_id, COMPLETE, stats, final_state, exit_code, start_time)
-        logger.info("Added execution: {}; worker_id: {}".format(execution_id, worker_id))
-
-        # Update the worker's last updated and last execution fields:
-        try:
-            Worker.update_worker_execution_time(actor_id, worker_id)
-            logger.debug("worker execution time updated. worker_id: {}".format(worker_id))
-        except KeyError:
-            # it is possible that this worker was sent a gracful shutdown command in the other thread
-            # and that spawner has already removed this worker from the store.
-            logger.info("worker {} got unexpected key error trying to update its execution time. "
-                        "Worker better be shutting down! keep_running: {}".format(worker_id, globals.keep_running))
-            if globals.keep_running:
-                logger.error("worker couldn't update's its execution time but keep_running is still true!")
-
-        # we completed an execution successfully; reset the consecutive_errors counter
-        consecutive_errors = 0
-        logger.info("worker time stamps updated; worker_id: {}".format(worker_id))
-    logger.info("global.keep_running no longer true. worker is now exited. worker id: {}".format(worker_id))
+        Execution.update_status(actor_id, execution_id, ERROR)
+        notify_complete(actor_id, execution_id, msg, ERROR)
+        shutdown_workers(actor_id, delete_actor_ch=False)
+        # wait for worker to be shutdown..
+        time.sleep(60)
+        return True
+    except Exception as e:
+        logger.error(f"Worker {worker_id} got an unexpected exception trying to run actor for execution: {execution_id}."
+                     "Putting the actor in error status and shutting down workers. "
+                     f"Exception: {e}; Exception type: {type(e)}")
+        # updated 2/2021 -- we no longer set the actor to ERROR state for unrecognized exceptions. Most of the time
+        # these exceptions are due to internal system errors, such as not being able to talk eo RabbitMQ or getting
+        # socket timeouts from docker. these are not the fault of the actor, and putting it (but not other actors
+        # who simply didn't happen to be executing at the time) in ERROR state is confusing to users and leads to
+        # actors not procssing messages until the user notices and intervenes.
+        # # # # # # # Actor.set_status(actor_id, ERROR, "Error executing container: {}".format(e))
+
+        # the execute_actor function raises a DockerStartContainerError if it met an exception before starting the
+        # actor container; if the container was started, then another exception should be raised. Therefore,
+        # we can assume here that the container was at least started and we can ack the message.
+        msg_obj.ack()
+        Execution.update_status(actor_id, execution_id, ERROR)
+        notify_complete(actor_id, execution_id, msg, ERROR)
+        shutdown_workers(actor_id, delete_actor_ch=False)
+        # wait for worker to be shutdown..
+        time.sleep(60)
+        return True
+    # ack the message
+    msg_obj.ack()
+
+    # the logs were added to the execution by execute_actor() before it returned, so they are in place before the
+    # execution is finalized -- otherwise, there is a race condition for clients waiting on the execution to be
+    # COMPLETE and then immediately retrieving the logs.
+    logger.debug("container finished successfully; worker_id: {}".format(worker_id))
+    # Add the completed stats to the execution
+    logger.info("Actor container finished successfully. Got stats object:{}".format(str(stats)))
+    Execution.finalize_execution(actor_id, execution_id, COMPLETE, stats, final_state, exit_code, start_time)
+    logger.info("Added execution: {}; worker_id: {}".format(execution_id, worker_id))
+    notify_complete(actor_id, execution_id, msg, COMPLETE)
+
+    # Update the worker's last updated and last execution fields:
+    try:
+        Worker.update_worker_execution_time(actor_id, worker_id)
+        logger.debug("worker execution time updated. worker_id: {}".format(worker_id))
+    except KeyError:
+        # it is possible that this worker was sent a gracful shutdown command in the other thread
+        # and that spawner has already removed this worker from the store.
+        logger.info("worker {} got unexpected key error trying to update its execution time. "
+                    "Worker better be shutting down! keep_running: {}".format(worker_id, globals.keep_running))
+        if globals.keep_running:
+            logger.error("worker couldn't update's its execution time but keep_running is still true!")
+
+    # we completed an execution successfully; reset the consecutive_errors counter
+    slots.consecutive_errors = 0
+    logger.info("worker time stamps updated; worker_id: {}".format(worker_id))
+    return False
 
 def get_container_user(actor):
     logger.debug("top of get_container_user")
@@ -586,6 +774,7 @@ def get_container_user(actor):
         user = '{}:{}'.format(uid, gid)
     return user
 
+
 def main():
     """
     Main function for the worker process.
@@ -593,12 +782,32 @@ def main():
     This function
     """
     worker_id = os.environ.get('worker_id')
+    logger.info(f"Top of main() for worker: {worker_id}")
+    spawner_worker_ch = SpawnerWorkerChannel(worker_id=worker_id)
+
+    logger.debug("Worker waiting on message from spawner...")
+    result, msg_obj = spawner_worker_ch.get_one()
+    logger.debug("Worker received reply from spawner.")
+
+    # should be OK to close the spawner_worker_ch on the worker side since spawner was first client
+    # to open it.
+    spawner_worker_ch.delete()
+    logger.debug('spawner_worker_ch closed.')
+
+    # a worker started for a spawner's warm pool is not started for a specific actor; the spawner binds it to an
+    # actor's worker by sending the configuration otherwise passed through environment variables.
+    if type(result) == dict:
+        logger.info(f"Warm worker {worker_id} bound to worker {result.get('worker_id')} of actor "
+                    f"{result.get('actor_id')}.")
+        os.environ.update({k: str(v) for k, v in result.items() if v is not None})
+        worker_id = os.environ.get('worker_id')
+
     image = os.environ.get('image')
     actor_id = os.environ.get('actor_id')
     revision = os.environ.get('revision')
     try:
         revision = int(revision)
-    except ValueError:
+    except (TypeError, ValueError):
         logger.error(f"worker did not get an integer revision number; got: {revision}; "
                      f"worker {actor_id}+{worker_id} exiting.")
         sys.exit()
@@ -609,18 +818,8 @@ def main():
     api_server = os.environ.get('api_server', None)
     client_secret = os.environ.get('client_secret', None)
 
-    logger.info(f"Top of main() for worker: {worker_id}, image: {image}; revision: {revision}"
+    logger.info(f"worker: {worker_id}, image: {image}; revision: {revision}"
                 f"actor_id: {actor_id}; client_id:{client_id}; tenant: {tenant}; api_server: {api_server}")
-    spawner_worker_ch = SpawnerWorkerChannel(worker_id=worker_id)
-
-    logger.debug("Worker waiting on message from spawner...")
-    result = spawner_worker_ch.get_one()
-    logger.debug("Worker received reply from spawner. result: {}.".format(result))
-
-    # should be OK to close the spawner_worker_ch on the worker side since spawner was first client
-    # to open it.
-    spawner_worker_ch.delete()
-    logger.debug('spawner_worker_ch closed.')
     if not client_id:
         logger.info("Did not get client id.")
     else:
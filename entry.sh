@@ -7,29 +7,35 @@ if ! python3 -u /actors/conf_check.py; then
 	exit
 fi
 
+# gunicorn worker class; use an async class (e.g., gevent) so that each worker process can serve many requests that
+# wait on an execution (synchronous messages, logs streams) at the same time.
+worker_class=${worker_class:-sync}
+worker_connections=${worker_connections:-1000}
+gunicorn_opts="-w $threads -k $worker_class --worker-connections $worker_connections -b :5000"
+
 if [ $api = "reg" ]; then
     if [ $server = "dev" ]; then
         python3 -u /actors/reg_api.py
     else
-        cd /actors; /usr/local/bin/gunicorn -w $threads -b :5000 reg_api:app
+        cd /actors; /usr/local/bin/gunicorn $gunicorn_opts reg_api:app
     fi
 elif [ $api = "admin" ]; then
     if [ $server = "dev" ]; then
         python3 -u /actors/admin_api.py
     else
-        cd /actors; /usr/local/bin/gunicorn -w $threads -b :5000 admin_api:app
+        cd /actors; /usr/local/bin/gunicorn $gunicorn_opts admin_api:app
     fi
 elif [ $api = "metrics" ]; then
     if [ $server = "dev" ]; then
         python3 -u /actors/metrics_api.py
     else
-        cd /actors; /usr/local/bin/gunicorn -w $threads -b :5000 metrics_api:app
+        cd /actors; /usr/local/bin/gunicorn $gunicorn_opts metrics_api:app
     fi
 elif [ $api = "mes" ]; then
     if [ $server = "dev" ]; then
         python3 -u /actors/message_api.py
     else
-        cd /actors; /usr/local/bin/gunicorn -w $threads -b :5000 message_api:app
+        cd /actors; /usr/local/bin/gunicorn $gunicorn_opts message_api:app
     fi
 fi
 
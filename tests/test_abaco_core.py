@@ -663,6 +663,41 @@ def test_cant_register_max_workers_stateful(headers):
     assert "stateful actors can only have 1 worker" in message
 
 
+@pytest.mark.regapi
+def test_cant_register_min_idle_workers_stateful(headers):
+    url = '{}/{}'.format(base_url, '/actors')
+    field = 'min_idle_workers'
+    if case == 'camel':
+        field = 'minIdleWorkers'
+    data = {'image': 'abacosamples/test',
+            'name': 'abaco_test_suite_invalid',
+            'stateless': False,
+            field: 1,
+            }
+    rsp = requests.post(url, json=data, headers=headers)
+    response_format(rsp)
+    assert rsp.status_code not in range(1, 399)
+    data = json.loads(rsp.content.decode('utf-8'))
+    message = data['message']
+    assert "stateful actors cannot have min_idle_workers" in message
+
+
+@pytest.mark.regapi
+def test_cant_register_concurrency_stateful(headers):
+    url = '{}/{}'.format(base_url, '/actors')
+    data = {'image': 'abacosamples/test',
+            'name': 'abaco_test_suite_invalid',
+            'stateless': False,
+            'concurrency': 2,
+            }
+    rsp = requests.post(url, json=data, headers=headers)
+    response_format(rsp)
+    assert rsp.status_code not in range(1, 399)
+    data = json.loads(rsp.content.decode('utf-8'))
+    message = data['message']
+    assert "stateful actors cannot have a concurrency greater than 1" in message
+
+
 @pytest.mark.regapi
 def test_register_with_put(headers):
     url = '{}/actors'.format(base_url)
@@ -1020,11 +1055,141 @@ def test_list_execution_logs(headers):
     assert '_abaco_execution_id' in result['logs']
     assert '_abaco_Content_Type' in result['logs']
 
+def test_execution_logs_range(headers):
+    actor_id = get_actor_id(headers)
+    url = '{}/actors/{}/executions'.format(base_url, actor_id)
+    rsp = requests.get(url, headers=headers)
+    result = basic_response_checks(rsp, check_tenant=False)
+    exec_id = result.get('executions')[0].get('id')
+    url = '{}/actors/{}/executions/{}/logs'.format(base_url, actor_id, exec_id)
+    rsp = requests.get(url, headers=headers)
+    full = basic_response_checks(rsp, check_tenant=False)
+    logs = full['logs']
+    assert full['offset'] == 0
+    assert full['length'] == len(logs)
+    # offset and limit
+    rsp = requests.get(url, headers=headers, params={'offset': 5, 'limit': 10})
+    result = basic_response_checks(rsp, check_tenant=False)
+    assert result['logs'] == logs[5:15]
+    assert result['offset'] == 5
+    assert result['length'] == len(logs)
+    # tail
+    rsp = requests.get(url, headers=headers, params={'tail': 20})
+    result = basic_response_checks(rsp, check_tenant=False)
+    assert result['logs'] == logs[-20:]
+    assert result['offset'] == len(logs) - 20
+    # an offset past the end of the log returns no logs
+    rsp = requests.get(url, headers=headers, params={'offset': len(logs) + 10})
+    result = basic_response_checks(rsp, check_tenant=False)
+    assert result['logs'] == ''
+    assert result['offset'] == len(logs)
+    # invalid values
+    rsp = requests.get(url, headers=headers, params={'limit': 'abc'})
+    assert rsp.status_code == 400
+    rsp = requests.get(url, headers=headers, params={'tail': -1})
+    assert rsp.status_code == 400
+    # Range requests in characters
+    rsp = requests.get(url, headers=dict(headers, Range='chars=5-14'))
+    assert rsp.status_code == 206
+    assert rsp.headers['Content-Range'] == 'chars 5-14/{}'.format(len(logs))
+    assert rsp.json()['result']['logs'] == logs[5:15]
+    rsp = requests.get(url, headers=dict(headers, Range='chars=-20'))
+    assert rsp.status_code == 206
+    assert rsp.json()['result']['logs'] == logs[-20:]
+    rsp = requests.get(url, headers=dict(headers, Range='chars={}-'.format(len(logs) + 10)))
+    assert rsp.status_code == 416
+    assert rsp.headers['Content-Range'] == 'chars */{}'.format(len(logs))
+    # ranges in other units are ignored
+    rsp = requests.get(url, headers=dict(headers, Range='bytes=5-14'))
+    assert rsp.status_code == 200
+    assert rsp.json()['result']['logs'] == logs
+
+def test_stream_execution_logs(headers):
+    actor_id = get_actor_id(headers)
+    url = '{}/actors/{}/executions'.format(base_url, actor_id)
+    rsp = requests.get(url, headers=headers)
+    result = basic_response_checks(rsp, check_tenant=False)
+    exec_id = result.get('executions')[0].get('id')
+    # the execution is complete, so the stream returns the full log followed by the end event.
+    url = '{}/actors/{}/executions/{}/logs/stream'.format(base_url, actor_id, exec_id)
+    rsp = requests.get(url, headers=headers)
+    assert rsp.status_code == 200
+    assert rsp.headers['Content-Type'].startswith('text/event-stream')
+    assert 'data: Contents of MSG: testing execution' in rsp.text
+    assert rsp.text.endswith('event: end\ndata: COMPLETE\n\n')
+
 def test_execute_actor_json(headers):
     actor_id = get_actor_id(headers)
     data = {'key1': 'value1', 'key2': 'value2'}
     execute_actor(headers, actor_id=actor_id, json_data=data)
 
+def test_execute_actor_batch(headers):
+    actor_id = get_actor_id(headers)
+    url = '{}/actors/{}/messages/batch'.format(base_url, actor_id)
+    messages = [{'key1': 'value1'}, 'testing batch execution', {'key2': 'value2'}]
+    rsp = requests.post(url, json=messages, headers=headers)
+    result = basic_response_checks(rsp)
+    if case == 'snake':
+        exc_ids = result.get('execution_ids')
+        assert result.get('failed_execution_ids') == []
+    else:
+        exc_ids = result.get('executionIds')
+        assert result.get('failedExecutionIds') == []
+    assert len(exc_ids) == 3
+    # NDJSON bodies are also accepted
+    ndjson_headers = dict(headers)
+    ndjson_headers['Content-Type'] = 'application/x-ndjson'
+    rsp = requests.post(url, data='{"key1": "value1"}\n{"key2": "value2"}\n', headers=ndjson_headers)
+    result = basic_response_checks(rsp)
+    if case == 'snake':
+        exc_ids.extend(result.get('execution_ids'))
+    else:
+        exc_ids.extend(result.get('executionIds'))
+    assert len(exc_ids) == 5
+    # check for the executions to complete
+    count = 0
+    while count < 20:
+        time.sleep(3)
+        statuses = []
+        for exc_id in exc_ids:
+            rsp = requests.get('{}/actors/{}/executions/{}'.format(base_url, actor_id, exc_id), headers=headers)
+            statuses.append(basic_response_checks(rsp).get('status'))
+        if all(status == 'COMPLETE' for status in statuses):
+            return
+        count += 1
+    assert False
+
+def test_execute_actor_batch_invalid_body(headers):
+    actor_id = get_actor_id(headers)
+    url = '{}/actors/{}/messages/batch'.format(base_url, actor_id)
+    rsp = requests.post(url, json={'message': 'not a list'}, headers=headers)
+    assert rsp.status_code == 400
+
+def test_list_executions_paged(headers):
+    actor_id = get_actor_id(headers)
+    url = '{}/actors/{}/executions'.format(base_url, actor_id)
+    rsp = requests.get(url, headers=headers)
+    result = basic_response_checks(rsp)
+    all_ids = [ex.get('id') for ex in result.get('executions')]
+    assert len(all_ids) > 1
+    rsp = requests.get(url, headers=headers, params={'limit': 1})
+    result = basic_response_checks(rsp)
+    assert len(result.get('executions')) == 1
+    assert result.get('executions')[0].get('id') == all_ids[0]
+    if case == 'snake':
+        cursor = result.get('next_cursor')
+        assert result.get('total_executions') == len(all_ids)
+    else:
+        cursor = result.get('nextCursor')
+        assert result.get('totalExecutions') == len(all_ids)
+    assert cursor == all_ids[0]
+    rsp = requests.get(url, headers=headers, params={'limit': 1, 'cursor': cursor})
+    result = basic_response_checks(rsp)
+    assert result.get('executions')[0].get('id') == all_ids[1]
+    # an unknown cursor is a bad request
+    rsp = requests.get(url, headers=headers, params={'limit': 1, 'cursor': 'not-an-execution'})
+    assert rsp.status_code == 400
+
 def test_execute_basic_actor_synchronous(headers):
     actor_id = get_actor_id(headers)
     data = {'message': 'testing execution'}
@@ -2079,6 +2244,25 @@ def test_search_actors_details(headers):
     assert not 'tenant' in result['search'][0]
     assert not 'db_id' in result['search'][0]
 
+def test_search_actors_cursor(headers):
+    url = '{}/actors/search/actors'.format(base_url)
+    rsp = requests.get(url, headers=headers, params={'limit': 5, 'total_count': 'false'})
+    result = basic_response_checks(rsp)
+    if case == 'snake':
+        assert result['_metadata']['total_count'] is None
+        cursor = result['_metadata']['next_cursor']
+    else:
+        assert result['_metadata']['totalCount'] is None
+        cursor = result['_metadata']['nextCursor']
+    assert len(result['search']) == 5
+    assert cursor
+    first_page = [actor['id'] for actor in result['search']]
+    rsp = requests.get(url, headers=headers, params={'limit': 5, 'cursor': cursor})
+    result = basic_response_checks(rsp)
+    second_page = [actor['id'] for actor in result['search']]
+    assert len(second_page) == 5
+    assert not set(first_page) & set(second_page)
+
 def test_search_workers_details(headers):
     url = '{}/actors/search/workers'.format(base_url)
     rsp = requests.get(url, headers=headers)
@@ -0,0 +1,147 @@
+# Unit test suite for the autoscaler's scaling policies and bounds.
+# This test suite runs in the abaco/testsuite docker container; see test_store.py. To run it, execute:
+#     docker run -e base_url=http://172.17.0.1:8000 -v $(pwd)/local-dev.conf:/etc/service.conf --entrypoint=py.test -it --rm abaco/testsuite:dev /tests/test_autoscaler.py
+
+import os
+import sys
+import time
+sys.path.append(os.path.split(os.getcwd())[0])
+sys.path.append('/actors')
+
+import pytest
+
+from autoscaler import Autoscaler, BacklogPolicy, EwmaPolicy, MessagesPerWorkerPolicy, ScalingPolicy, \
+    ThresholdPolicy
+import metrics_utils
+
+
+class FixedPolicy(ScalingPolicy):
+    """Policy that always targets `target` workers."""
+    def __init__(self, target):
+        self.target = target
+
+    def target_workers(self, actor_id, messages, workers, max_workers, avg_runtime=None):
+        return self.target
+
+
+@pytest.fixture
+def scaler(monkeypatch):
+    """An autoscaler with 10 commands of room on each command channel that records its scaling requests."""
+    monkeypatch.setattr(metrics_utils, 'get_max_cmd_length', lambda: 10)
+    requests = {'up': [], 'down': []}
+    monkeypatch.setattr(metrics_utils, 'scale_up', lambda actor_id, num_workers=1: requests['up'].append(
+        (actor_id, num_workers)))
+    monkeypatch.setattr(metrics_utils, 'scale_down', lambda actor_id, is_sync_actor=False, keep=0: requests[
+        'down'].append((actor_id, keep)))
+    a = Autoscaler()
+    a.dry_run = False
+    a.cooldown = 30
+    a.host_capacity = 100
+    a.requests = requests
+    return a
+
+
+def get_actor(**kwargs):
+    actor = {'db_id': 'TEST_autoscaled', 'max_workers': 5}
+    actor.update(kwargs)
+    return actor
+
+
+def test_scaling_policy_is_abstract():
+    with pytest.raises(TypeError):
+        ScalingPolicy()
+
+
+def test_threshold_policy():
+    policy = ThresholdPolicy()
+    policy.threshold = 3
+    assert policy.target_workers('a', 0, 2, 5) == 0
+    assert policy.target_workers('a', 2, 1, 5) == 1
+    assert policy.target_workers('a', 3, 1, 5) == 2
+
+
+def test_messages_per_worker_policy():
+    policy = MessagesPerWorkerPolicy()
+    policy.messages_per_worker = 10
+    assert policy.target_workers('a', 0, 2, 5) == 0
+    assert policy.target_workers('a', 1, 0, 5) == 1
+    assert policy.target_workers('a', 25, 1, 5) == 3
+
+
+def test_backlog_policy():
+    policy = BacklogPolicy()
+    policy.messages_per_worker = 10
+    policy.drain_time = 60
+    assert policy.target_workers('a', 0, 2, 5, avg_runtime=6) == 0
+    # without a completed execution, falls back to messages per worker
+    assert policy.target_workers('a', 25, 0, 5) == 3
+    assert policy.target_workers('a', 25, 0, 5, avg_runtime=6) == 3
+    assert policy.target_workers('a', 100, 0, 5, avg_runtime=6) == 10
+    # at least one worker while messages are queued
+    assert policy.target_workers('a', 1, 0, 5, avg_runtime=0.1) == 1
+
+
+def test_ewma_policy():
+    policy = EwmaPolicy()
+    policy.alpha = 0.5
+    # no previous measurement: starts a first worker for the queued messages
+    assert policy.target_workers('a', 5, 0, 5) == 1
+    # queue growing: adds a worker
+    assert policy.target_workers('a', 9, 1, 5) == 2
+    assert policy.rates['a'] == 2
+    # average change back to 0 while draining: holds
+    assert policy.target_workers('a', 7, 2, 5) == 2
+    # empty queue that is no longer growing: removes the workers
+    assert policy.target_workers('a', 0, 2, 5) == 0
+    # the rates of other actors are tracked separately
+    assert policy.target_workers('b', 3, 0, 5) == 1
+    assert policy.rates['b'] == 0
+
+
+def test_autoscaler_max_workers(scaler):
+    scaler.policy = FixedPolicy(20)
+    scaler.evaluate(get_actor(max_workers=5), 50, 2, None, [])
+    assert scaler.requests['up'] == [('TEST_autoscaled', 3)]
+
+
+def test_autoscaler_command_channel_and_host_capacity(scaler):
+    scaler.policy = FixedPolicy(20)
+    scaler.cmd_lengths = {'default': 8}
+    scaler.evaluate(get_actor(max_workers=20), 50, 0, None, [])
+    assert scaler.requests['up'] == [('TEST_autoscaled', 2)]
+    assert scaler.cmd_lengths['default'] == 10
+    scaler.cmd_lengths = {'default': 0}
+    scaler.host_capacity = 1
+    scaler.evaluate(get_actor(db_id='TEST_other', max_workers=20), 50, 0, None, [])
+    assert scaler.requests['up'][-1] == ('TEST_other', 1)
+    assert scaler.host_capacity == 0
+
+
+def test_autoscaler_scale_down_only_with_empty_queue(scaler):
+    scaler.policy = FixedPolicy(0)
+    scaler.evaluate(get_actor(), 3, 2, None, [])
+    assert scaler.requests['down'] == []
+    scaler.evaluate(get_actor(), 0, 2, None, [])
+    assert scaler.requests['down'] == [('TEST_autoscaled', 0)]
+
+
+def test_autoscaler_cooldown(scaler):
+    scaler.policy = FixedPolicy(0)
+    scaler.last_scale_up['TEST_autoscaled'] = time.time()
+    scaler.evaluate(get_actor(), 0, 2, None, [])
+    assert scaler.requests['down'] == []
+    scaler.last_scale_up['TEST_autoscaled'] = time.time() - scaler.cooldown - 1
+    scaler.evaluate(get_actor(), 0, 2, None, [])
+    assert scaler.requests['down'] == [('TEST_autoscaled', 0)]
+
+
+def test_autoscaler_min_idle_workers(scaler):
+    scaler.policy = FixedPolicy(0)
+    actor = get_actor(min_idle_workers=2)
+    # keeps min_idle_workers idle on top of the busy workers, even with an empty queue
+    scaler.evaluate(actor, 0, 1, None, [], busy=1)
+    assert scaler.requests['up'] == [('TEST_autoscaled', 2)]
+    # idle workers beyond min_idle_workers are shut down, keeping min_idle_workers (once out of the cooldown)
+    scaler.last_scale_up = {}
+    scaler.evaluate(actor, 0, 6, None, [], busy=1)
+    assert scaler.requests['down'] == [('TEST_autoscaled', 2)]
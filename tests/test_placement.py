@@ -0,0 +1,82 @@
+# Unit test suite for the placement of workers on the worker hosts.
+# This test suite runs in the abaco/testsuite docker container; see test_store.py. To run it, execute:
+#     docker run -e base_url=http://172.17.0.1:8000 -v $(pwd)/local-dev.conf:/etc/service.conf --entrypoint=py.test -it --rm abaco/testsuite:dev /tests/test_placement.py
+
+import copy
+import os
+import sys
+sys.path.append(os.path.split(os.getcwd())[0])
+sys.path.append('/actors')
+
+import pytest
+
+import models
+from models import HostCapacity
+
+GB = 1024 ** 3
+
+
+class UpdateResult(object):
+    def __init__(self, modified):
+        self.raw_result = {'nModified': modified}
+
+
+class CapacityStore(object):
+    """In-memory stand-in for the abaco_metrics_store supporting the guarded $inc used by HostCapacity.reserve()."""
+    def __init__(self, docs):
+        self.docs = {doc['_id']: doc for doc in docs}
+
+    def full_update(self, key, value, upsert=False):
+        doc = self.docs.get(key['_id'])
+        if doc is None:
+            return UpdateResult(0)
+        for field, cond in key.items():
+            if field == '_id':
+                continue
+            group, name = field.split('.')
+            if doc[group][name] < cond['$gte']:
+                return UpdateResult(0)
+        for field, inc in value['$inc'].items():
+            group, name = field.split('.')
+            doc[group][name] += inc
+        return UpdateResult(1)
+
+
+def get_host(host_id, workers, memory):
+    return {'_id': HostCapacity.get_capacity_id(host_id),
+            'host_id': host_id,
+            'free': {'workers': workers, 'memory': memory, 'cpus': 8000000000}}
+
+
+@pytest.fixture
+def hosts(monkeypatch):
+    """Two hosts with room for 2 workers each, and 4 GB and 2 GB of memory; get_hosts() returns a stale snapshot."""
+    store = CapacityStore([get_host('big', 2, 4 * GB), get_host('small', 2, 2 * GB)])
+    snapshot = copy.deepcopy(list(store.docs.values()))
+    monkeypatch.setattr(models, 'abaco_metrics_store', store)
+    monkeypatch.setattr(HostCapacity, 'placement_enabled', classmethod(lambda cls: True))
+    monkeypatch.setattr(HostCapacity, 'get_hosts', classmethod(lambda cls, queue=None: copy.deepcopy(snapshot)))
+    monkeypatch.setattr(HostCapacity, 'get_worker_reservation', classmethod(lambda cls, actor: (GB, 0)))
+    return store
+
+
+def test_place_best_fit(hosts):
+    assert HostCapacity.place({'db_id': 'a'}, 3) == ['small', 'small', 'big']
+    assert hosts.docs[HostCapacity.get_capacity_id('small')]['free']['workers'] == 0
+    assert hosts.docs[HostCapacity.get_capacity_id('big')]['free']['memory'] == 3 * GB
+
+
+def test_place_does_not_overcommit(hosts):
+    # both callers read the same snapshot; the second must not reuse the room the first one reserved.
+    first = HostCapacity.place({'db_id': 'a'}, 3)
+    second = HostCapacity.place({'db_id': 'b'}, 3)
+    assert first == ['small', 'small', 'big']
+    assert second == ['big', None, None]
+    for doc in hosts.docs.values():
+        assert doc['free']['workers'] >= 0
+        assert doc['free']['memory'] >= 0
+
+
+def test_place_disabled(hosts, monkeypatch):
+    monkeypatch.setattr(HostCapacity, 'placement_enabled', classmethod(lambda cls: False))
+    assert HostCapacity.place({'db_id': 'a'}, 2) == [None, None]
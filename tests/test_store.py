@@ -22,7 +22,8 @@ sys.path.append(os.path.split(os.getcwd())[0])
 sys.path.append('/actors')
 
 from config import Config
-from store import MongoStore
+from store import MongoStore, CachedMongoStore, path_accessor, STORE_CACHE_HITS, STORE_CACHE_MISSES, \
+    STORE_CACHE_EVICTIONS
 
 store = 'mongo'
 # this is the number of iterations executed in each thread, per test.
@@ -50,6 +51,41 @@ def test_set_with_expiry(st):
     # Mongo expiry is checked every 60 seconds so results will fluctuate slightly due to timing.
     # We'll test at the end of the suite to make sure the key is removed.
 
+def test_set_fields(st):
+    st['test_fields'] = {'k': 'v', 'sub': {'k2': 'v2'}}
+    st.set_fields('test_fields', {'k': 'v1', 'sub.k2': 'w1', ('sub', 'k3'): 'w2', 'new': 'n1'})
+    assert st['test_fields'] == {'k': 'v1', 'sub': {'k2': 'w1', 'k3': 'w2'}, 'new': 'n1'}
+    st.set_fields('test_fields', {'k': 'v2'}, unset=['new', ('sub', 'k3')])
+    assert st['test_fields'] == {'k': 'v2', 'sub': {'k2': 'w1'}}
+
+def test_get_fields(st):
+    st['test_fields'] = {'k': 'v', 'k2': 'v2', 'sub': {'k3': 'v3'}}
+    assert st.get_fields('test_fields', ['k', 'sub', 'missing']) == {'k': 'v', 'sub': {'k3': 'v3'}}
+    with pytest.raises(KeyError):
+        st.get_fields('test_fields_missing', ['k'])
+
+def test_count(st):
+    st['test_count_1'] = {'count_host': 'h1'}
+    st['test_count_2'] = {'count_host': 'h1'}
+    st['test_count_3'] = {'count_host': 'h2'}
+    assert st.count({'count_host': 'h1'}) == 2
+    assert st.count({'count_host': 'h3'}) == 0
+
+def test_inc_fields(st):
+    del st['test_inc']
+    assert st.inc_fields('test_inc', {'length': 5, 'chunks': 1}, {'k': 'v'}) is None
+    previous = st.inc_fields('test_inc', {'length': 3, 'chunks': 1})
+    assert previous['length'] == 5 and previous['chunks'] == 1
+    assert st['test_inc'] == {'length': 8, 'chunks': 2, 'k': 'v'}
+
+def test_delete_many(st):
+    st['test_delete_1'] = {'delete_group': 'g1'}
+    st['test_delete_2'] = {'delete_group': 'g1'}
+    st['test_delete_3'] = {'delete_group': 'g2'}
+    assert st.delete_many({'delete_group': 'g1'}) == 2
+    assert st.count({'delete_group': 'g1'}) == 0
+    assert st.delete_many({'delete_group': 'g2'}) == 1
+
 def _thread(st, n):
     for i in range(n):
         st.update('test', 'k2', f'w{i}')
@@ -255,6 +291,90 @@ def test_redis_two_lists(st):
     assert len(st['free']) == 3
     assert len(st['locked']) == 3
 
+def test_getitem_path(st):
+    doc = {'f1': {'f2': {'f3': 'val'}, 'big': 'x' * 100000}}
+    st['test_path'] = doc
+    # reads of a subfield only project that subfield
+    assert st['test_path', 'f1', 'f2', 'f3'] == 'val'
+    assert st['test_path', 'f1', 'f2'] == {'f3': 'val'}
+    with pytest.raises(KeyError):
+        st['test_path', 'f1', 'missing']
+    # the path accessor replaces the eval() previously used on each read; accessors are cached per path
+    assert path_accessor(('f1', 'f2', 'f3'))(doc) == 'val'
+    assert path_accessor(('f1', 'f2', 'f3')) is path_accessor(('f1', 'f2', 'f3'))
+    with pytest.raises(KeyError):
+        path_accessor(('f1', 'missing'))(doc)
+
+def cached_store(**kwargs):
+    cst = CachedMongoStore(Config.get('store', 'mongo_host'), Config.getint('store', 'mongo_port'), db='13', **kwargs)
+    cst._db.delete_many({})
+    return cst
+
+def test_cached_store_reads(st):
+    cst = cached_store(fallback_ttl=60, watch=False)
+    cst['test_cache'] = {'k': 'v', 'sub': {'k2': 'v2'}}
+    hits = STORE_CACHE_HITS.labels('13')._value.get()
+    misses = STORE_CACHE_MISSES.labels('13')._value.get()
+    assert cst['test_cache'] == {'k': 'v', 'sub': {'k2': 'v2'}}
+    assert cst['test_cache', 'sub', 'k2'] == 'v2'
+    assert cst.get_fields('test_cache', ['k']) == {'k': 'v'}
+    assert STORE_CACHE_MISSES.labels('13')._value.get() == misses + 1
+    assert STORE_CACHE_HITS.labels('13')._value.get() == hits + 2
+    # results are copies of the cached document:
+    cst['test_cache', 'sub']['k2'] = 'changed'
+    assert cst['test_cache', 'sub', 'k2'] == 'v2'
+    # missing documents are cached too:
+    with pytest.raises(KeyError):
+        cst['test_cache_missing']
+    with pytest.raises(KeyError):
+        cst['test_cache_missing']
+    assert STORE_CACHE_MISSES.labels('13')._value.get() == misses + 2
+
+def test_cached_store_invalidation(st):
+    cst = cached_store(fallback_ttl=1, watch=False)
+    cst['test_cache'] = {'k': 'v'}
+    assert cst['test_cache', 'k'] == 'v'
+    # writes through the store are visible immediately:
+    cst['test_cache', 'k'] = 'v1'
+    assert cst['test_cache', 'k'] == 'v1'
+    cst.add_if_empty(['test_cache_new'], {'k': 'n'})
+    assert cst['test_cache_new', 'k'] == 'n'
+    del cst['test_cache_new']
+    with pytest.raises(KeyError):
+        cst['test_cache_new']
+    # writes made elsewhere are visible once the entry expires:
+    cst._db.update_one({'_id': 'test_cache'}, {'$set': {'k': 'v2'}})
+    assert cst['test_cache', 'k'] == 'v1'
+    time.sleep(1.5)
+    assert cst['test_cache', 'k'] == 'v2'
+
+def test_cached_store_eviction(st):
+    cst = cached_store(fallback_ttl=60, max_size=2, watch=False)
+    evictions = STORE_CACHE_EVICTIONS.labels('13', 'size')._value.get()
+    for i in range(3):
+        cst[f'test_cache_{i}'] = {'k': i}
+        assert cst[f'test_cache_{i}', 'k'] == i
+    assert cst.stats()['size'] == 2
+    assert STORE_CACHE_EVICTIONS.labels('13', 'size')._value.get() == evictions + 1
+
+def test_cached_store_change_stream(st):
+    cst = cached_store(ttl=60, fallback_ttl=60)
+    cst['test_cache'] = {'k': 'v'}
+    assert cst['test_cache', 'k'] == 'v'
+    tot = 0
+    while not cst.change_stream_open and tot < 10:
+        tot += 1
+        time.sleep(0.5)
+    if not cst.change_stream_open:
+        pytest.skip("change streams require mongo to run as a replica set.")
+    assert cst['test_cache', 'k'] == 'v'
+    cst._db.update_one({'_id': 'test_cache'}, {'$set': {'k': 'v2'}})
+    tot = 0
+    while cst['test_cache', 'k'] == 'v' and tot < 10:
+        tot += 1
+        time.sleep(0.5)
+    assert cst['test_cache', 'k'] == 'v2'
+
 def test_set_with_expiry2(st):
     # Mongo expiry is checked every 60 seconds so results will fluctuate slightly due to timing.
     # We'll test at the end of the suite to make sure the key is removed.
@@ -0,0 +1,75 @@
+# Unit test suite for the responses of synchronous messages (MessagesResource.do_synch_message).
+# This test suite runs in the abaco/core image; see test_store.py. To run it, execute:
+#     docker run -e base_url=http://172.17.0.1:8000 -v $(pwd)/local-dev.conf:/etc/service.conf --entrypoint=py.test -it --rm abaco/core:dev /tests/test_sync_messages.py
+
+import json
+import os
+import sys
+from types import SimpleNamespace
+sys.path.append(os.path.split(os.getcwd())[0])
+sys.path.append('/actors')
+
+from flask import Flask, g
+import pytest
+
+import codes
+from config import Config
+import controllers
+from errors import ResourceError
+
+case = Config.get('web', 'case')
+DBID = 'TEST_sync'
+
+
+class CompleteChannel(object):
+    """Stand-in for the ExecutionCompleteChannel; wait() returns `status` (None when the wait timed out)."""
+    status = None
+
+    def __init__(self, actor_id, execution_id):
+        pass
+
+    def wait(self, timeout):
+        return self.status
+
+    def close(self):
+        pass
+
+
+class ExecutionsStore(object):
+    def get_fields(self, key, fields):
+        return {'status': codes.RUNNING}
+
+
+@pytest.fixture
+def synch(monkeypatch):
+    """Calls do_synch_message for an execution whose completion status is `status`, in a request context."""
+    monkeypatch.setattr(controllers, 'ExecutionCompleteChannel', CompleteChannel)
+    monkeypatch.setattr(controllers, 'executions_store', ExecutionsStore())
+    monkeypatch.setattr(controllers, 'actors_store', {DBID: {}})
+    monkeypatch.setattr(controllers.Actor, 'from_db',
+                        classmethod(lambda cls, d: SimpleNamespace(api_server='https://api.test', id='sync')))
+    app = Flask(__name__)
+
+    def _synch(status, execution_id='exec123'):
+        monkeypatch.setattr(CompleteChannel, 'status', status)
+        with app.test_request_context():
+            g.db_id = DBID
+            return controllers.MessagesResource().do_synch_message(execution_id)
+    return _synch
+
+
+def test_synch_message_timeout_returns_202(synch):
+    response = synch(None)
+    assert response.status_code == 202
+    result = json.loads(response.get_data(as_text=True))['result']
+    if case == 'snake':
+        assert result['execution_id'] == 'exec123'
+    else:
+        assert result['executionId'] == 'exec123'
+    assert result['status'] == codes.RUNNING
+
+
+def test_synch_message_error_returns_500(synch):
+    with pytest.raises(ResourceError) as e:
+        synch(codes.ERROR)
+    assert e.value.code == 500